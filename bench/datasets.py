@@ -0,0 +1,125 @@
+"""
+Synthetic ERP-shaped datasets for benchmarks.
+
+Rows mimic the flat result sets the services return for the example queries:
+- level 0: flat records like customers.sql / products.sql
+- level 1: BOMs with items, like boms.sql
+- level 2: production orders with lines and steps, like production-orders.sql
+- level 3: production orders with lines, steps and step materials
+"""
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List, Dict, Any
+
+OPERATIONS = ["Cut", "Weld", "Bend", "Paint", "Assemble", "Inspect", "Pack"]
+UNITS = ["PCS", "M", "KG", "M2"]
+STATUSES = ["ACTIVE", "PLANNED", "DONE", "ON_HOLD"]
+
+
+def generate_rows(level: int, parents: int, children: int = 5, grandchildren: int = 3,
+                  seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Generate flat database rows for the given nesting level.
+
+    Args:
+        level: 0 (flat), 1 (BOMs), 2 (orders/lines/steps) or 3 (orders/lines/steps/materials)
+        parents: Number of parent records (rows for level 0)
+        children: Child rows per parent
+        grandchildren: Rows per child at deeper levels
+        seed: Random seed, so runs are reproducible
+
+    Returns:
+        List of row dictionaries as returned by execute_query
+    """
+    rng = random.Random(seed)
+    if level == 0:
+        return _flat_rows(rng, parents)
+    if level == 1:
+        return _bom_rows(rng, parents, children)
+    if level in (2, 3):
+        return _order_rows(rng, parents, children, grandchildren, with_materials=(level == 3))
+    raise ValueError(f"Unsupported nesting level: {level}")
+
+
+def _flat_rows(rng: random.Random, count: int) -> List[Dict[str, Any]]:
+    base = datetime(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        rows.append({
+            "EXTERNAL_ID": str(100000 + i),
+            "NAME": f"Product {i} {rng.choice(['Steel', 'Alu', 'Wood'])}",
+            "SKU": f"SKU-{rng.randint(0, 999999):06d}",
+            "PRICE": Decimal(rng.randint(100, 99999)) / 100,
+            "STOCK_QUANTITY": rng.randint(0, 5000),
+            "CATEGORY": rng.choice(["Raw", "Semi", "Finished"]),
+            "DESCRIPTION": None if rng.random() < 0.3 else "Lorem ipsum " * rng.randint(1, 8),
+            "LAST_MODIFIED": base + timedelta(minutes=rng.randint(0, 500000)),
+        })
+    return rows
+
+
+def _bom_rows(rng: random.Random, parents: int, children: int) -> List[Dict[str, Any]]:
+    rows = []
+    for p in range(parents):
+        object_id = 500000 + p
+        for c in range(children):
+            rows.append({
+                "parent-id": object_id,
+                "EXTERNAL_ID": str(object_id),
+                "BOM_CODE": f"{object_id}-{object_id}-A",
+                "NAME": f"Assembly {p}",
+                "items.item_number": f"{c + 1:03d}",
+                "items.component_code": f"PART-{rng.randint(0, 9999):04d}",
+                "items.quantity": Decimal(rng.randint(1, 1000)) / 10,
+                "items.unit": rng.choice(UNITS),
+                "items.length_mm": rng.randint(10, 6000),
+                "items.width_mm": rng.randint(10, 2000),
+                "items.thickness_mm": None if rng.random() < 0.2 else rng.randint(1, 50),
+            })
+    return rows
+
+
+def _order_rows(rng: random.Random, parents: int, lines: int, steps: int,
+                with_materials: bool) -> List[Dict[str, Any]]:
+    base = datetime(2024, 1, 1)
+    rows = []
+    for p in range(parents):
+        object_id = 900000 + p
+        order = {
+            "parent-id": object_id,
+            "EXTERNAL_ID": str(object_id),
+            "ORDER_NUMBER": f"2024-{p:06d}",
+            "CUSTOMER": f"Customer {rng.randint(1, 500)}",
+            "ORDER_DATE": base + timedelta(days=rng.randint(0, 700)),
+            "STATUS": rng.choice(STATUSES),
+        }
+        for line in range(lines):
+            line_fields = {
+                "lines.line_number": line + 1,
+                "lines.product": f"Widget {rng.randint(1, 300)}",
+                "lines.quantity": rng.randint(1, 500),
+                "lines.unit_price": Decimal(rng.randint(100, 50000)) / 100,
+            }
+            for step in range(steps):
+                step_fields = {
+                    "lines.steps.sequence": step + 1,
+                    "lines.steps.operation": rng.choice(OPERATIONS),
+                    "lines.steps.duration_minutes": rng.randint(5, 240),
+                    "lines.steps.workcenter": f"WC-{rng.randint(1, 40):02d}",
+                    "lines.steps.status": rng.choice(STATUSES),
+                }
+                if with_materials:
+                    for material in range(2):
+                        row = dict(order)
+                        row.update(line_fields)
+                        row.update(step_fields)
+                        row["lines.steps.materials.code"] = f"MAT-{rng.randint(0, 999):03d}"
+                        row["lines.steps.materials.quantity"] = Decimal(rng.randint(1, 100)) / 4
+                        rows.append(row)
+                else:
+                    row = dict(order)
+                    row.update(line_fields)
+                    row.update(step_fields)
+                    rows.append(row)
+    return rows
@@ -0,0 +1,98 @@
+"""
+In-process SQLite stand-in for SQLServerService / FirebirdService.
+"""
+import sqlite3
+from datetime import datetime, date
+from decimal import Decimal
+from typing import List, Dict, Any, Iterator, Optional
+
+from utils.metrics import TableMetrics, timed
+from utils.sql import bind_params, compile_named_params, read_sql_file
+from utils.throttle import fetch_rows
+from utils.validation import describe_columns
+
+sqlite3.register_adapter(Decimal, lambda value: str(value))
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+class SQLiteService:
+    """Database service backed by an in-memory SQLite database with the same interface as the real services."""
+
+    dialect = "sqlite"
+
+    def __init__(self):
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.throttle = None
+
+    def load_rows(self, table_name: str, rows: List[Dict[str, Any]]) -> None:
+        """Create table_name with the columns of rows and insert all rows."""
+        if not rows:
+            return
+        columns = list(rows[0].keys())
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        self.connection.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        self.connection.execute(f'CREATE TABLE "{table_name}" ({quoted})')
+        self.connection.executemany(
+            f'INSERT INTO "{table_name}" ({quoted}) VALUES ({placeholders})',
+            ([row.get(column) for column in columns] for row in rows)
+        )
+        self.connection.commit()
+
+    def test_connection(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def execute_query(self, sql: str, metrics: Optional[TableMetrics] = None,
+                      params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Execute SQL query and return results as list of dictionaries."""
+        compiled_sql, names = compile_named_params(sql)
+        cursor = self.connection.cursor()
+        with timed(metrics, "execute"):
+            cursor.execute(compiled_sql, bind_params(names, params))
+        columns = [desc[0] for desc in cursor.description]
+        if metrics is not None:
+            metrics.columns = describe_columns(cursor.description)
+        with timed(metrics, "fetch"):
+            results = [dict(zip(columns, row)) for row in fetch_rows(cursor, self.throttle)]
+        cursor.close()
+        return results
+
+    def iter_query(self, sql: str, metrics: Optional[TableMetrics] = None,
+                   params: Optional[Dict[str, Any]] = None, fetch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Execute SQL query and yield rows as dictionaries, fetching fetch_size rows at a time."""
+        compiled_sql, names = compile_named_params(sql)
+        cursor = self.connection.cursor()
+        try:
+            with timed(metrics, "execute"):
+                cursor.execute(compiled_sql, bind_params(names, params))
+            columns = [desc[0] for desc in cursor.description]
+            if metrics is not None:
+                metrics.columns = describe_columns(cursor.description)
+            while True:
+                with timed(metrics, "fetch"):
+                    batch = cursor.fetchmany(fetch_size)
+                if not batch:
+                    break
+                if self.throttle is not None:
+                    self.throttle.rows(len(batch))
+                for row in batch:
+                    yield dict(zip(columns, row))
+        finally:
+            cursor.close()
+
+    def explain(self, sql: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Return the EXPLAIN QUERY PLAN output of sql."""
+        compiled_sql, names = compile_named_params(sql)
+        cursor = self.connection.execute(f"EXPLAIN QUERY PLAN {compiled_sql}", bind_params(names, params))
+        plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+        cursor.close()
+        return plan
+
+    def execute_query_from_file(self, file_path: str, metrics: Optional[TableMetrics] = None,
+                                params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Execute SQL query from file."""
+        return self.execute_query(read_sql_file(file_path), metrics, params)
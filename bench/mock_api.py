@@ -0,0 +1,141 @@
+"""
+Local mock of the bulk API with configurable latency and error rate.
+"""
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Iterable
+
+
+class MockBulkAPI:
+    """
+    Threaded HTTP server accepting POST {base_url}/{table}/bulk and NDJSON import jobs
+    at POST {base_url}/{table}/import (completed on the second status poll).
+    A bulk chunk holding a record whose key is in reject_keys is refused with 422.
+
+    Usage:
+        with MockBulkAPI(latency_ms=20, error_rate=0.05) as api:
+            service = APIService(api.base_url, "key", "tenant")
+    """
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 42,
+                 host: str = "127.0.0.1", port: int = 0, reject_keys: Iterable[Any] = ()):
+        self.latency_seconds = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.reject_keys = {str(key).lower() for key in reject_keys}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"requests": 0, "errors": 0, "records": 0, "bytes": 0, "tables": {}}
+        self.jobs: Dict[str, int] = {}  # import job id -> status polls
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def _record(self, table: str, records: int, size: int, failed: bool) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += size
+            if failed:
+                self.stats["errors"] += 1
+                return
+            self.stats["records"] += records
+            self.stats["tables"][table] = self.stats["tables"].get(table, 0) + records
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) == 3 and parts[1] == "import":
+                    with api._lock:
+                        if parts[2] not in api.jobs:
+                            self._reply(404, {"error": "unknown job"})
+                            return
+                        api.jobs[parts[2]] += 1
+                        polls = api.jobs[parts[2]]
+                    self._reply(200, {"id": parts[2], "status": "completed" if polls > 1 else "running"})
+                    return
+                self._reply(200, {"status": "ok"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if api.latency_seconds:
+                    time.sleep(api.latency_seconds)
+
+                table = self.path.strip("/").split("/")[0]
+                is_import = self.path.split("?")[0].rstrip("/").endswith("/import")
+                if api._should_fail():
+                    api._record(table, 0, length, failed=True)
+                    self._reply(503, {"error": "injected failure"})
+                    return
+
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                if is_import:
+                    records = sum(1 for line in body.splitlines() if line.strip())
+                    api._record(table, records, length, failed=False)
+                    with api._lock:
+                        job_id = str(len(api.jobs) + 1)
+                        api.jobs[job_id] = 0
+                    self._reply(202, {"id": job_id, "status": "running"})
+                    return
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    api._record(table, 0, length, failed=True)
+                    self._reply(400, {"error": "invalid json"})
+                    return
+
+                records = len(payload.get("data", [])) if isinstance(payload, dict) else 0
+                if api.reject_keys and isinstance(payload, dict):
+                    key_field = payload.get("keyField")
+                    if any(str(record.get(key_field)).lower() in api.reject_keys for record in payload["data"]):
+                        api._record(table, 0, length, failed=True)
+                        self._reply(422, {"error": "invalid record"})
+                        return
+                api._record(table, records, length, failed=False)
+                self._reply(200, {"upserted": records})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MockBulkAPI":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockBulkAPI":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
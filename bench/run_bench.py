@@ -0,0 +1,170 @@
+"""
+Benchmark runner for the transform and upload pipeline.
+
+Examples:
+    python -m bench.run_bench
+    python -m bench.run_bench --parents 20000 --levels 0,1,2 --latency-ms 10 --error-rate 0.01
+    python -m bench.run_bench --skip-e2e --output bench_output.json
+
+All datasets are generated from --seed, so two runs with the same arguments
+process identical data and can be compared directly.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Any, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.datasets import generate_rows  # noqa: E402
+from utils.transformers import auto_nest_data  # noqa: E402
+
+LEVEL_TABLES = {0: "products", 1: "boms", 2: "production-orders", 3: "production-orders-materials"}
+
+
+def measure(func: Callable[[], Any], items: int, repeat: int) -> Dict[str, Any]:
+    """Run func repeat times and report the best wall time, throughput and peak traced memory."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Measure memory in a separate pass so tracing overhead does not skew the timings
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "items": items,
+        "best_seconds": round(best, 6),
+        "items_per_second": round(items / best, 1) if best else 0.0,
+        "peak_traced_bytes": peak,
+    }
+
+
+def bench_transforms(levels: List[int], parents: int, children: int, grandchildren: int,
+                     seed: int, repeat: int) -> Dict[str, Any]:
+    """Benchmark auto_nest_data and APIService._lowercase_json per nesting level."""
+    try:
+        from services.api_service import APIService
+        lowercaser = APIService.__new__(APIService)
+    except ImportError as e:
+        lowercaser = None
+        print(f"Skipping _lowercase_json benchmark: {e}", file=sys.stderr)
+
+    results = {}
+    for level in levels:
+        rows = generate_rows(level, parents, children, grandchildren, seed=seed)
+        nested = auto_nest_data(rows)
+        entry = {
+            "rows": len(rows),
+            "records": len(nested),
+            "auto_nest_data": measure(lambda: auto_nest_data(rows), len(rows), repeat),
+        }
+        if lowercaser is not None:
+            entry["_lowercase_json"] = measure(lambda: lowercaser._lowercase_json(nested), len(nested), repeat)
+        results[LEVEL_TABLES[level]] = entry
+    return results
+
+
+def bench_end_to_end(levels: List[int], parents: int, children: int, grandchildren: int, seed: int,
+                     batch_size: int, latency_ms: float, error_rate: float, compress: bool) -> Optional[Dict[str, Any]]:
+    """Run SyncService.run_sync against the SQLite stand-in and the mock bulk API."""
+    try:
+        from sync import SyncService
+    except ImportError as e:
+        print(f"Skipping end-to-end benchmark: {e}", file=sys.stderr)
+        return None
+
+    from bench.fake_db import SQLiteService
+    from bench.mock_api import MockBulkAPI
+
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="taskform-bench-") as workdir, \
+            MockBulkAPI(latency_ms=latency_ms, error_rate=error_rate, seed=seed) as api:
+        os.chdir(workdir)
+        try:
+            os.makedirs("queries")
+            database = SQLiteService()
+            for level in levels:
+                table = LEVEL_TABLES[level]
+                rows = generate_rows(level, parents, children, grandchildren, seed=seed)
+                database.load_rows(table, rows)
+                order = ' ORDER BY "parent-id"' if level > 0 else ""
+                with open(os.path.join("queries", f"{table}.sql"), 'w', encoding='utf-8') as f:
+                    f.write(f'SELECT * FROM "{table}"{order}')
+
+            with open("config.json", 'w', encoding='utf-8') as f:
+                json.dump({
+                    "api": {"base_url": api.base_url, "api_key": "bench", "tenant_id": "bench", "compress": compress},
+                    "sync": {"queries_folder": "queries", "batch_size": batch_size, "dry_run": False},
+                    "metrics": {"textfile": ""},
+                }, f)
+
+            service = SyncService("config.json")
+            service.api_service.initial_retry_delay = 0.01
+            service.sql_service = database
+
+            results = service.run_sync()
+            report = results.get("report", {})
+            report["mock_api"] = api.stats
+            return report
+        finally:
+            os.chdir(original_cwd)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="TaskForm Sync benchmarks")
+    parser.add_argument("--levels", default="0,1,2,3", help="comma separated nesting levels (0-3)")
+    parser.add_argument("--parents", type=int, default=5000, help="parent records per dataset (rows for level 0)")
+    parser.add_argument("--children", type=int, default=5, help="child rows per parent")
+    parser.add_argument("--grandchildren", type=int, default=3, help="rows per child at level 2 and 3")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per micro benchmark (best is reported)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mock API latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock API requests answered with 503")
+    parser.add_argument("--compress", action="store_true", help="gzip request bodies")
+    parser.add_argument("--skip-e2e", action="store_true", help="only run the transform micro benchmarks")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="show sync log output")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    results: Dict[str, Any] = {
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "parameters": vars(args),
+        "transforms": bench_transforms(levels, args.parents, args.children, args.grandchildren, args.seed, args.repeat),
+    }
+    if not args.skip_e2e:
+        results["end_to_end"] = bench_end_to_end(
+            levels, args.parents, args.children, args.grandchildren, args.seed,
+            args.batch_size, args.latency_ms, args.error_rate, args.compress
+        )
+
+    output = json.dumps(results, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -46,9 +46,11 @@ echo.
 
 REM Build sync service executable
 echo Building sync.exe (Service)...
+REM tkinter is only used by the GUI; excluding it keeps sync.exe smaller and faster to unpack
 %PYINSTALLER% --onefile ^
     --name sync ^
     --add-data "config.json;." ^
+    --exclude-module tkinter ^
     --hidden-import pyodbc ^
     --hidden-import fdb ^
     --hidden-import requests ^
@@ -11,7 +11,7 @@ echo.
 
 REM Build sync service executable
 echo Building sync.exe...
-pyinstaller --onefile --name sync sync.py --icon=NONE
+pyinstaller --onefile --name sync --exclude-module tkinter sync.py --icon=NONE
 echo.
 
 echo Build complete!
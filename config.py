@@ -46,19 +46,64 @@ class Config:
                 "database_path": "",
                 "username": "",
                 "password": "",
-                "charset": ""
+                "charset": "",
+                "blob_max_mb": 16
             },
             "api": {
                 "base_url": "",
                 "api_key": "",
-                "tenant_id": ""
+                "tenant_id": "",
+                "compress": False,
+                "import_poll_seconds": 5,
+                "import_timeout_minutes": 60
             },
             "sync": {
                 "queries_folder": "queries",
                 "log_level": "INFO",
+                "log_format": "text",
+                "log_max_mb": 10,
+                "log_backup_count": 5,
+                "log_rate_limit_seconds": 0,
                 "batch_size": 1000,
                 "dry_run": False,
-                "query_order": []
+                "dry_run_format": "json",
+                "dry_run_folder": "dry-run-output",
+                "replay_cache": False,
+                "default_sink": "rest",
+                "query_sinks": {},
+                "sink_folder": "sink-output",
+                "file_sink_format": "jsonl",
+                "minimize_payload": "none",
+                "patch_updates": False,
+                "validate_records": False,
+                "max_text_length": 0,
+                "dead_letter_folder": "dead-letter",
+                "max_dead_letters": 100,
+                "sort_by_key": False,
+                "chunk_digests": False,
+                "chunk_digest_refresh_hours": 24,
+                "throttle": {},
+                "run_lock": "skip",
+                "lock_wait_minutes": 60,
+                "lock_stale_minutes": 120,
+                "query_order": [],
+                "interval_minutes": 30,
+                "partitions": {},
+                "default_source": "auto",
+                "query_sources": {},
+                "query_params": {},
+                "detect_deletions": False,
+                "delete_mode": "delete",
+                "max_delete_fraction": 0.5,
+                "state_folder": "state",
+                "memory_budget_mb": 0,
+                "spill_folder": ""
+            },
+            "metrics": {
+                "textfile": "logs/taskform_sync.prom",
+                "http_enabled": True,
+                "http_host": "127.0.0.1",
+                "http_port": 9464
             }
         }
     
@@ -74,18 +119,8 @@ class Config:
                 if "sync" in self.config and "query_order" not in self.config["sync"]:
                     self.config["sync"]["query_order"] = []
                     
-                # Decrypt sensitive fields (lazy - only when needed)
-                # Note: Decryption happens on-demand in get() for GUI fields
-                self._decrypted_cache = {}
-                for field in self.ENCRYPTED_FIELDS:
-                    encrypted_value = self.get(field, "")
-                    if encrypted_value and is_encrypted(encrypted_value):
-                        try:
-                            decrypted_value = decrypt_string(encrypted_value)
-                            self._decrypted_cache[field] = decrypted_value
-                            self.set(field, decrypted_value)
-                        except Exception as e:
-                            print(f"Warning: Could not decrypt {field}: {e}")
+                # Sensitive fields stay encrypted until they are read (see _decrypt_field),
+                # so a run that never uses a credential never calls DPAPI
                             
             except Exception as e:
                 print(f"Error loading config: {e}")
@@ -100,7 +135,7 @@ class Config:
             
             # Encrypt sensitive fields before saving
             for field in self.ENCRYPTED_FIELDS:
-                plaintext_value = self.get(field, "")
+                plaintext_value = self._get_raw(field, "")
                 if plaintext_value and not is_encrypted(plaintext_value):
                     encrypted_value = encrypt_string(plaintext_value)
                     # Set encrypted value in the copy
@@ -116,8 +151,32 @@ class Config:
         except Exception as e:
             raise Exception(f"Error saving config: {e}")
     
+    def _decrypt_field(self, field: str) -> None:
+        """Replace an encrypted field by its plaintext on first use."""
+        encrypted_value = self._get_raw(field, "")
+        if encrypted_value and isinstance(encrypted_value, str) and is_encrypted(encrypted_value):
+            try:
+                self.set(field, decrypt_string(encrypted_value))
+            except Exception as e:
+                print(f"Warning: Could not decrypt {field}: {e}")
+    
+    def decrypt_all(self) -> None:
+        """Decrypt every sensitive field now (e.g. before comparing two configurations)."""
+        for field in self.ENCRYPTED_FIELDS:
+            self._decrypt_field(field)
+    
+    def _decrypt_section(self, section: str) -> None:
+        for field in self.ENCRYPTED_FIELDS:
+            if field.startswith(section + ".") or section.startswith(field):
+                self._decrypt_field(field)
+    
     def get(self, key: str, default: Any = None) -> Any:
-        """Get configuration value using dot notation."""
+        """Get configuration value using dot notation, decrypting sensitive fields on first use."""
+        self._decrypt_section(key)
+        return self._get_raw(key, default)
+    
+    def _get_raw(self, key: str, default: Any = None) -> Any:
+        """Get configuration value using dot notation without decrypting it."""
         keys = key.split('.')
         value = self.config
         for k in keys:
@@ -143,10 +202,12 @@ class Config:
     
     def get_firebird_config(self) -> Dict[str, Any]:
         """Get Firebird configuration."""
+        self._decrypt_section("firebird")
         return self.config.get("firebird", {})
     
     def get_api_config(self) -> Dict[str, Any]:
         """Get API configuration."""
+        self._decrypt_section("api")
         return self.config.get("api", {})
     
     def get_sync_config(self) -> Dict[str, Any]:
@@ -1,11 +1,14 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, scrolledtext
+import json
 import os
-from typing import List
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
 from config import Config
-from services.sqlserver_service import SQLServerService
-from services.firebird_service import FirebirdService
-from services.api_service import APIService
+from utils.query_meta import QueryCatalog
+
+# The services (and their database drivers) are imported in the worker threads that use them
 
 
 class ToolTip:
@@ -39,6 +42,9 @@ class ToolTip:
 class DataSyncGUI:
     """GUI for DataSync configuration with field help and connection-string builder."""
 
+    # Row cap of the query preview (TOP n / FIRST n)
+    PREVIEW_ROWS = 100
+
     def __init__(self, root):
         self.root = root
         self.root.title("DataSync Configuratie")
@@ -50,10 +56,18 @@ class DataSyncGUI:
 
         # Load configuration
         self.config = Config()
+        self.query_catalog = QueryCatalog(
+            os.path.join(self.config.get("sync.state_folder", "state"), "query_index.json")
+        )
+
+        # Callbacks queued by worker threads, run on the Tk thread by _poll_background()
+        self._background_results: "queue.Queue" = queue.Queue()
+        self.sync_running = False
 
         # Create UI
         self.create_widgets()
         self.load_config_to_ui()
+        self.root.after(100, self._poll_background)
 
     def create_widgets(self):
         """Create all UI widgets."""
@@ -89,7 +103,8 @@ class DataSyncGUI:
         self.sql_connection_entry.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=5)
         ToolTip(self.sql_connection_entry, "Voorbeeld: Driver={ODBC Driver 17 for SQL Server};Server=localhost;Database=MijnDB;Trusted_Connection=yes;")
 
-        ttk.Button(sql_frame, text="Test SQL Server", command=self.test_sql_server).grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.sql_test_button = ttk.Button(sql_frame, text="Test SQL Server", command=self.test_sql_server)
+        self.sql_test_button.grid(row=3, column=0, sticky=tk.W, pady=5)
 
         # Firebird Section
         fb_frame = ttk.LabelFrame(main_frame, text="Firebird Instellingen", padding="10")
@@ -112,7 +127,8 @@ class DataSyncGUI:
         self.fb_password_entry = ttk.Entry(fb_frame, width=60, show="*")
         self.fb_password_entry.grid(row=6, column=0, sticky=(tk.W, tk.E), pady=5)
 
-        ttk.Button(fb_frame, text="Test Firebird", command=self.test_firebird).grid(row=7, column=0, sticky=tk.W, pady=5)
+        self.fb_test_button = ttk.Button(fb_frame, text="Test Firebird", command=self.test_firebird)
+        self.fb_test_button.grid(row=7, column=0, sticky=tk.W, pady=5)
 
         # API Section
         api_frame = ttk.LabelFrame(main_frame, text="API Instellingen", padding="10")
@@ -134,7 +150,8 @@ class DataSyncGUI:
         self.api_tenant_entry.grid(row=5, column=0, sticky=(tk.W, tk.E), pady=5)
         ToolTip(self.api_tenant_entry, "Tenant of organisatie ID")
 
-        ttk.Button(api_frame, text="Test API", command=self.test_api).grid(row=6, column=0, sticky=tk.W, pady=5)
+        self.api_test_button = ttk.Button(api_frame, text="Test API", command=self.test_api)
+        self.api_test_button.grid(row=6, column=0, sticky=tk.W, pady=5)
 
         # Sync Settings Section
         sync_frame = ttk.LabelFrame(main_frame, text="Synchronisatie Instellingen", padding="10")
@@ -173,6 +190,7 @@ class DataSyncGUI:
 
         self.query_order_listbox = tk.Listbox(query_order_frame, height=8, width=50, exportselection=False)
         self.query_order_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.query_order_listbox.bind("<<ListboxSelect>>", lambda _event: self.show_query_settings())
 
         order_button_frame = ttk.Frame(query_order_frame)
         order_button_frame.pack(side=tk.LEFT, padx=5)
@@ -182,10 +200,43 @@ class DataSyncGUI:
         ttk.Button(order_button_frame, text="Omhoog", command=lambda: self.move_selected_query(-1)).pack(fill=tk.X, pady=2)
         ttk.Button(order_button_frame, text="Omlaag", command=lambda: self.move_selected_query(1)).pack(fill=tk.X, pady=2)
         ttk.Button(order_button_frame, text="Lijst opschonen", command=self.cleanup_query_order).pack(fill=tk.X, pady=2)
+        self.preview_button = ttk.Button(order_button_frame, text="Voorbeeld", command=self.preview_selected_query)
+        self.preview_button.pack(fill=tk.X, pady=2)
+        ToolTip(self.preview_button, f"Voert de geselecteerde query uit met maximaal {self.PREVIEW_ROWS} rijen en toont "
+                                     "het geneste resultaat, het query plan en de uitvoertijden.")
 
         self.query_order_status = tk.Label(sync_frame, text="", fg="#555555")
         self.query_order_status.grid(row=7, column=0, columnspan=2, sticky=tk.W, pady=(4, 0))
 
+        self.query_settings_label = tk.Label(sync_frame, text="", fg="#555555", justify=tk.LEFT, wraplength=600)
+        self.query_settings_label.grid(row=8, column=0, columnspan=2, sticky=tk.W, pady=(2, 0))
+
+        # Run Now Section
+        run_frame = ttk.LabelFrame(main_frame, text="Sync uitvoeren", padding="10")
+        run_frame.grid(row=row, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        row += 1
+
+        self.run_button = ttk.Button(run_frame, text="Nu synchroniseren", command=self.run_sync_now)
+        self.run_button.grid(row=0, column=0, sticky=tk.W, pady=5)
+        ToolTip(self.run_button, "Voert één sync uit met de opgeslagen configuratie (config.json). Sla wijzigingen eerst op.")
+
+        self.run_status_label = tk.Label(run_frame, text="", fg="#555555", justify=tk.LEFT, wraplength=450)
+        self.run_status_label.grid(row=0, column=1, sticky=tk.W, padx=10)
+
+        self.run_progressbar = ttk.Progressbar(run_frame, mode="determinate", length=600)
+        self.run_progressbar.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+
+        columns = ("status", "rows", "rate", "chunks", "records", "eta")
+        self.run_tree = ttk.Treeview(run_frame, columns=columns, height=6)
+        self.run_tree.heading("#0", text="Tabel")
+        self.run_tree.column("#0", width=160)
+        for column, heading, width in (("status", "Status", 80), ("rows", "Rijen", 80), ("rate", "Per sec.", 80),
+                                       ("chunks", "Chunks", 60), ("records", "Records", 80), ("eta", "Resterend", 80)):
+            self.run_tree.heading(column, text=heading)
+            self.run_tree.column(column, width=width, anchor=tk.E)
+        self.run_tree.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        self._run_totals: Dict[str, int] = {}
+
         # Save Button
         ttk.Button(main_frame, text="Opslaan & Sluiten", command=self.save_and_close, width=20).grid(row=row, column=0, columnspan=2, pady=20)
 
@@ -282,6 +333,86 @@ class DataSyncGUI:
                 fg="#00843d"
             )
 
+    def show_query_settings(self) -> None:
+        """Show the header settings (-- @key: value) of the selected query file."""
+        selection = self.query_order_listbox.curselection()
+        if not selection:
+            self.query_settings_label.config(text="")
+            return
+        file_path = os.path.join(self.get_queries_folder(), self.query_order_listbox.get(selection[0]))
+        if not os.path.exists(file_path):
+            self.query_settings_label.config(text="")
+            return
+        try:
+            settings = self.query_catalog.get(file_path)
+            self.query_catalog.save()
+        except Exception as e:
+            self.query_settings_label.config(text=f"Header niet leesbaar: {e}", fg="#b35b00")
+            return
+
+        if settings.errors:
+            self.query_settings_label.config(text="Ongeldige header: " + "; ".join(settings.errors), fg="#b35b00")
+        elif settings.header:
+            text = ", ".join(f"@{name}: {value}" for name, value in settings.header.items())
+            self.query_settings_label.config(text=f"Query instellingen: {text}", fg="#555555")
+        else:
+            self.query_settings_label.config(text="Geen query instellingen (standaardwaarden)", fg="#555555")
+
+    def preview_selected_query(self) -> None:
+        """Run the selected query capped at PREVIEW_ROWS rows in the background and show the result."""
+        selection = self.query_order_listbox.curselection()
+        if not selection:
+            messagebox.showerror("Fout", "Selecteer eerst een query in de lijst")
+            return
+        file_path = os.path.join(self.get_queries_folder(), self.query_order_listbox.get(selection[0]))
+        if not os.path.exists(file_path):
+            messagebox.showerror("Fout", f"Bestand niet gevonden:\n{file_path}")
+            return
+        config_path = self.config.config_path
+        limit = self.PREVIEW_ROWS
+
+        def work():
+            from sync import SyncService
+
+            service = SyncService(config_path)
+            try:
+                return service.preview_query_file(file_path, limit)
+            finally:
+                service.close()
+
+        def done(preview, error):
+            if error is not None:
+                messagebox.showerror("Fout", f"Voorbeeld mislukt:\n{str(error)}")
+            else:
+                self.show_preview(os.path.basename(file_path), preview)
+
+        self.run_in_background(work, done, self.preview_button)
+
+    def show_preview(self, file_name: str, preview: Dict[str, Any]) -> None:
+        """Show a query preview in a separate window."""
+        window = tk.Toplevel(self.root)
+        window.title(f"Voorbeeld: {file_name}")
+        window.geometry("800x600")
+
+        stages = preview["stages_seconds"]
+        timings = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in stages.items())
+        cap = "TOP/FIRST" if preview["capped"] else "afgebroken na"
+        summary = (f"Bron: {preview['source']} | {len(preview['rows'])} rijen ({cap} {preview['limit']}) -> "
+                   f"{len(preview['records'])} records | {timings}")
+        tk.Label(window, text=summary, justify=tk.LEFT, anchor=tk.W, wraplength=760).pack(fill=tk.X, padx=10, pady=5)
+
+        notebook = ttk.Notebook(window)
+        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+        for title, text in (
+            ("Resultaat (genest)", json.dumps(preview["records"], indent=2, ensure_ascii=False, default=str)),
+            ("Query plan", preview["plan"] or f"Geen plan beschikbaar: {preview['plan_error'] or 'onbekend'}"),
+        ):
+            text_widget = scrolledtext.ScrolledText(notebook, wrap=tk.NONE, font=("Consolas", 9))
+            text_widget.insert("1.0", text)
+            text_widget.configure(state="disabled")
+            notebook.add(text_widget, text=title)
+
     def add_query_to_order(self) -> None:
         """Add a query file from the queries folder to the order list."""
         queries_folder = self.get_queries_folder()
@@ -425,23 +556,76 @@ class DataSyncGUI:
                 self.cleanup_query_order()
                 messagebox.showinfo("Gereed", f"{len(missing)} ontbrekende bestand(en) verwijderd uit de lijst.")
 
+    def run_in_background(self, work: Callable[[], Any], on_done: Callable[[Any, Optional[Exception]], None],
+                          button: Optional[ttk.Button] = None) -> None:
+        """
+        Run work() in a worker thread and call on_done(result, error) on the Tk thread.
+
+        The button (if any) is disabled until the work is done, so the window stays
+        responsive without starting the same work twice.
+        """
+        button_text = None
+        if button is not None:
+            button_text = button.cget("text")
+            button.configure(text="Bezig...")
+            button.state(["disabled"])
+
+        def worker():
+            try:
+                result, error = work(), None
+            except Exception as e:
+                result, error = None, e
+            self._background_results.put((self._finish_background, (on_done, result, error, button, button_text)))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _finish_background(self, on_done, result, error, button, button_text) -> None:
+        if button is not None:
+            button.configure(text=button_text)
+            button.state(["!disabled"])
+        on_done(result, error)
+
+    def _poll_background(self) -> None:
+        """Run the callbacks queued by worker threads; Tk widgets may only be used from this thread."""
+        while True:
+            try:
+                callback, args = self._background_results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Warning: GUI callback failed: {e}")
+        self.root.after(100, self._poll_background)
+
+    def _show_test_result(self, name: str, error: Optional[Exception]) -> None:
+        if error is None:
+            messagebox.showinfo("Succes", f"{name} verbinding succesvol!")
+        else:
+            messagebox.showerror("Fout", f"{name} verbinding mislukt:\n{str(error)}")
+
     def test_sql_server(self):
-        """Test SQL Server connection."""
+        """Test SQL Server connection in the background."""
         connection_string = self.sql_connection_entry.get().strip()
 
         if not connection_string:
             messagebox.showerror("Fout", "Voer een connection string in")
             return
 
-        try:
+        def work():
+            from services.sqlserver_service import SQLServerService
+
             service = SQLServerService(connection_string)
-            service.test_connection()
-            messagebox.showinfo("Succes", "SQL Server verbinding succesvol!")
-        except Exception as e:
-            messagebox.showerror("Fout", f"SQL Server verbinding mislukt:\n{str(e)}")
+            try:
+                service.test_connection()
+            finally:
+                service.close()
+
+        self.run_in_background(work, lambda _result, error: self._show_test_result("SQL Server", error),
+                               self.sql_test_button)
 
     def test_firebird(self):
-        """Test Firebird connection."""
+        """Test Firebird connection in the background."""
         db_path = self.fb_path_entry.get().strip()
         username = self.fb_username_entry.get().strip()
         password = self.fb_password_entry.get().strip()
@@ -450,15 +634,20 @@ class DataSyncGUI:
             messagebox.showerror("Fout", "Vul alle Firebird velden in")
             return
 
-        try:
+        def work():
+            from services.firebird_service import FirebirdService
+
             service = FirebirdService(db_path, username, password)
-            service.test_connection()
-            messagebox.showinfo("Succes", "Firebird verbinding succesvol!")
-        except Exception as e:
-            messagebox.showerror("Fout", f"Firebird verbinding mislukt:\n{str(e)}")
+            try:
+                service.test_connection()
+            finally:
+                service.close()
+
+        self.run_in_background(work, lambda _result, error: self._show_test_result("Firebird", error),
+                               self.fb_test_button)
 
     def test_api(self):
-        """Test API connection."""
+        """Test API connection in the background."""
         base_url = self.api_url_entry.get().strip()
         api_key = self.api_key_entry.get().strip()
         tenant_id = self.api_tenant_entry.get().strip()
@@ -467,12 +656,105 @@ class DataSyncGUI:
             messagebox.showerror("Fout", "Vul alle API velden in")
             return
 
-        try:
+        def work():
+            from services.api_service import APIService
+
             service = APIService(base_url, api_key, tenant_id)
-            service.test_connection()
-            messagebox.showinfo("Succes", "API verbinding succesvol!")
-        except Exception as e:
-            messagebox.showerror("Fout", f"API verbinding mislukt:\n{str(e)}")
+            try:
+                service.test_connection()
+            finally:
+                service.close()
+
+        self.run_in_background(work, lambda _result, error: self._show_test_result("API", error),
+                               self.api_test_button)
+
+    @staticmethod
+    def _format_seconds(seconds: Optional[float]) -> str:
+        if seconds is None:
+            return "?"
+        seconds = int(round(seconds))
+        return f"{seconds // 60}:{seconds % 60:02d}"
+
+    def run_sync_now(self):
+        """Run one sync with the saved configuration in a worker thread, showing progress per table."""
+        if self.sync_running:
+            return
+        self.sync_running = True
+        self.run_tree.delete(*self.run_tree.get_children())
+        self._run_totals = {}
+        self.run_progressbar.configure(value=0, maximum=1)
+        self.run_status_label.config(text="Sync wordt gestart...")
+        config_path = self.config.config_path
+
+        def report(event: Dict[str, Any]) -> None:
+            # Called on the worker thread; the event is shown by _poll_background()
+            self._background_results.put((self._show_sync_progress, (event,)))
+
+        def work():
+            from sync import SyncService
+
+            service = SyncService(config_path)
+            service.progress = report
+            try:
+                return service.run_sync()
+            finally:
+                service.close()
+
+        self.run_in_background(work, self._sync_done, self.run_button)
+
+    def _show_sync_progress(self, event: Dict[str, Any]) -> None:
+        """Update the progress panel with one event from SyncService.run_sync()."""
+        name = event["event"]
+        table = event.get("table")
+        eta = self._format_seconds(event.get("eta_seconds"))
+
+        if name == "run_started":
+            for table_name in event["tables"]:
+                self.run_tree.insert("", tk.END, iid=table_name, text=table_name,
+                                     values=("wachten", "", "", "", "", ""))
+            self.run_progressbar.configure(value=0, maximum=max(1, len(event["tables"])))
+            self.run_status_label.config(text=f"{len(event['tables'])} tabel(len), geschatte duur {eta}")
+        elif name == "table_started":
+            self.run_tree.set(table, "status", "bezig")
+            self.run_tree.see(table)
+            self.run_status_label.config(
+                text=f"Tabel {event['index'] + 1}/{event['total']}: {table} (sync resterend {eta})")
+        elif name == "table_extracted":
+            self._run_totals[table] = event["records"]
+            self.run_tree.set(table, "rows", event["rows"])
+        elif name == "chunk_sent":
+            rate = event["records_per_second"]
+            self.run_tree.set(table, "chunks", event["chunks"])
+            self.run_tree.set(table, "records", event["records_uploaded"])
+            self.run_tree.set(table, "rate", f"{rate:.0f}")
+            total = self._run_totals.get(table)
+            if total is not None and rate > 0:
+                self.run_tree.set(table, "eta", self._format_seconds((total - event["records_uploaded"]) / rate))
+        elif name == "table_finished":
+            summary = event["summary"]
+            self.run_tree.set(table, "status", "gereed" if summary["status"] == "success" else "mislukt")
+            self.run_tree.set(table, "rows", summary["rows_extracted"])
+            self.run_tree.set(table, "rate", f"{summary['rows_per_second']:.0f}")
+            self.run_tree.set(table, "records", summary["records_uploaded"])
+            self.run_tree.set(table, "eta", "")
+            self.run_progressbar.step(1)
+        elif name == "run_finished":
+            self.run_status_label.config(
+                text=f"Gereed in {self._format_seconds(event['duration_seconds'])}: "
+                     f"{event['success_count']} geslaagd, {event['failed_count']} mislukt")
+
+    def _sync_done(self, results: Optional[Dict[str, Any]], error: Optional[Exception]) -> None:
+        self.sync_running = False
+        if error is not None:
+            self.run_status_label.config(text=f"Sync mislukt: {error}")
+            messagebox.showerror("Fout", f"Sync mislukt:\n{str(error)}")
+        elif results is not None and results.get("lock_skipped"):
+            holder = results["report"]["lock"]["holder"]
+            self.run_status_label.config(
+                text=f"Sync overgeslagen: er loopt al een sync (PID {holder.get('pid')} op "
+                     f"{holder.get('host')}, sinds {holder.get('started')})")
+        elif results is not None and not results.get("report"):
+            self.run_status_label.config(text="Geen query bestanden gevonden")
 
     def browse_queries_folder(self):
         """Browse for queries folder."""
@@ -1,40 +1,84 @@
-import requests
+import gzip
+import itertools
 import time
 import json
 import os
+import textwrap
 from datetime import datetime
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Union, Optional
+from utils.chunking import KeyChunking
 from utils.logging import Logger
+from utils.metrics import TableMetrics, timed
+from utils.transformers import lowercase_json
+
+
+class ChunkRejected(Exception):
+    """The API refused a chunk with a client error (4xx)."""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"API error: {status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
 
 class APIService:
-    """Service for API operations with retry logic."""
+    """
+    Service for API operations with retry logic.
+
+    requests is imported when the first request is made, so dry runs never load it.
+    """
     
-    def __init__(self, base_url: str, api_key: str, tenant_id: str, dry_run: bool = False):
+    def __init__(self, base_url: str, api_key: str, tenant_id: str, dry_run: bool = False,
+                 batch_size: int = 500, compress: bool = False, session: Any = None,
+                 dry_run_format: str = "json", dry_run_folder: str = "dry-run-output"):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
         self.tenant_id = tenant_id
         self.dry_run = dry_run
+        self.batch_size = max(1, int(batch_size or 500))
+        self.compress = compress
         self.logger = Logger("api")
+        # A session passed in is shared (multi-tenant host) and is closed by its owner
+        self._session = session
+        self._owns_session = session is None
+        # Called as on_chunk(table_name, records, body_bytes) after each chunk was accepted
+        self.on_chunk: Optional[Callable[[str, int, int], None]] = None
+        # Called as on_rejected(table_name, record, reason) for a record the API rejects on its own;
+        # when set, a rejected upsert chunk is split in halves until the rejected records are isolated
+        self.on_rejected: Optional[Callable[[str, Dict[str, Any], str], None]] = None
+        # Rate limits for uploaded bytes and requests (utils.throttle), set by the sync per table
+        self.throttle = None
         
         # Retry settings
         self.max_retries = 3
         self.initial_retry_delay = 1  # seconds
         
+        self.dry_run_format = str(dry_run_format or "json").lower()
+        
         if self.dry_run:
             self.logger.info("🧪 DRY-RUN MODE ENABLED - No data will be sent to API")
             # Create dry-run output folder
-            self.dry_run_folder = "dry-run-output"
+            self.dry_run_folder = dry_run_folder or "dry-run-output"
             os.makedirs(self.dry_run_folder, exist_ok=True)
 
+    @property
+    def session(self):
+        """HTTP session with pooled keep-alive connections, created on first use."""
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+        return self._session
+
+    def close(self) -> None:
+        """Close the HTTP session and its pooled connections (unless the session is shared)."""
+        if self._session is not None and self._owns_session:
+            self._session.close()
+            self._session = None
+
     def _lowercase_json(self, value: Union[Dict[str, Any], List[Any], str, Any]) -> Union[Dict[str, Any], List[Any], str, Any]:
         """Recursively convert all dictionary keys and string values to lowercase."""
-        if isinstance(value, dict):
-            return {str(key).lower(): self._lowercase_json(val) for key, val in value.items()}
-        if isinstance(value, list):
-            return [self._lowercase_json(item) for item in value]
-        if isinstance(value, str):
-            return value.lower()
-        return value
+        return lowercase_json(value)
     
     def _get_headers(self) -> Dict[str, str]:
         """Get API request headers."""
@@ -43,10 +87,125 @@ class APIService:
             "X-Api-Key": self.api_key,
             "X-Tenant-ID": self.tenant_id
         }
+
+    def _post_chunk(self, endpoint: str, table_name: str, payload: Optional[Dict[str, Any]],
+                    metrics: Optional[TableMetrics] = None, body: Optional[bytes] = None,
+                    records: int = 0) -> None:
+        """
+        Serialize, optionally compress and POST one chunk with retry logic.
+
+        Server errors (5xx) and network errors are retried with exponential backoff,
+        client errors (4xx) fail immediately. Pass body instead of payload when the
+        chunk was already serialized; records is the record count reported to on_chunk.
+        """
+        if body is None:
+            with timed(metrics, "serialize"):
+                body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+
+        headers = self._get_headers()
+        if self.compress:
+            with timed(metrics, "compress"):
+                body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+        from requests.exceptions import RequestException
+
+        for attempt in range(self.max_retries):
+            if attempt > 0 and metrics is not None:
+                metrics.retries += 1
+            if self.throttle is not None:
+                self.throttle.upload(len(body))
+
+            start = time.perf_counter()
+            try:
+                response = self.session.post(
+                    endpoint,
+                    data=body,
+                    headers=headers,
+                    timeout=30
+                )
+                error = None
+                if response.status_code in [200, 201]:
+                    if self.on_chunk is not None:
+                        self.on_chunk(table_name, records, len(body))
+                    return
+                elif response.status_code >= 500:
+                    # Server error, retry
+                    error = f"Server error: {response.status_code} - {response.text}"
+                else:
+                    # Client error, don't retry
+                    if self.on_rejected is None or response.status_code not in self.REJECT_STATUSES:
+                        self.logger.error(f"Bulk upsert failed for {table_name}: {response.status_code} - {response.text}")
+                    raise ChunkRejected(response.status_code, response.text)
+            except RequestException as e:
+                error = str(e)
+            finally:
+                elapsed = time.perf_counter() - start
+                if metrics is not None:
+                    metrics.add_time("upload", elapsed)
+                    metrics.record_request(elapsed, len(body))
+
+            if attempt < self.max_retries - 1:
+                delay = self.initial_retry_delay * (2 ** attempt)
+                self.logger.warning(f"Attempt {attempt + 1} failed ({error}), retrying in {delay} seconds...")
+                time.sleep(delay)
+            else:
+                self.logger.error(f"All retry attempts failed for {table_name}: {error}")
+                raise Exception(f"Bulk upsert failed after {self.max_retries} attempts: {error}")
+    
+    # Client errors that can be caused by the content of a single record
+    REJECT_STATUSES = (400, 409, 413, 422)
+    
+    def _post_records(self, endpoint: str, table_name: str, records: List[Dict[str, Any]], operation: str,
+                      key_field: str, metrics: Optional[TableMetrics] = None, body: Optional[bytes] = None) -> int:
+        """
+        POST normalized records as one chunk and return how many of them were accepted.
+        
+        When on_rejected is set and the API rejects the chunk because of its content,
+        the chunk is split in halves that are posted again, recursively, until single
+        records are rejected; those go to on_rejected. One bad record in a chunk of n
+        costs about 2 * log2(n) extra requests.
+        """
+        payload = None if body is not None else {"data": records, "operation": operation, "keyField": key_field}
+        try:
+            self._post_chunk(endpoint, table_name, payload, metrics, body=body, records=len(records))
+            return len(records)
+        except ChunkRejected as e:
+            if self.on_rejected is None or e.status_code not in self.REJECT_STATUSES or not records:
+                raise
+            if len(records) == 1:
+                self.on_rejected(table_name, records[0], f"{e.status_code} - {e.text}")
+                return 0
+            self.logger.debug(f"Chunk of {len(records)} records rejected by the API for {table_name}, splitting it")
+            middle = len(records) // 2
+            return (self._post_records(endpoint, table_name, records[:middle], operation, key_field, metrics)
+                    + self._post_records(endpoint, table_name, records[middle:], operation, key_field, metrics))
+    
+    def _post_body_chunks(self, endpoint: str, table_name: str, body_chunks, operation: str, key_field: str,
+                          metrics: Optional[TableMetrics] = None, chunking: Optional[KeyChunking] = None) -> int:
+        """POST (records, body) chunks, skipping chunks uploaded before when chunking keeps digests; returns the records accepted."""
+        digests = chunking.digests if chunking is not None else None
+        total = 0
+        for chunk_index, (chunk, body) in enumerate(body_chunks, start=1):
+            digest = None
+            if digests is not None:
+                digest = digests.digest(body)
+                if digests.skip(digest, len(chunk)):
+                    continue
+            count = self._post_records(endpoint, table_name, chunk, operation, key_field, metrics, body=body)
+            if digest is not None and count == len(chunk):
+                digests.uploaded(digest)
+            total += count
+            if metrics is not None:
+                metrics.records_uploaded += count
+            self.logger.debug(f"Chunk {chunk_index} ({count} records, {len(body)} bytes) uploaded for {table_name}")
+        return total
     
     def test_connection(self) -> bool:
         """Test API connection."""
         try:
+            import requests
+
             # Try a simple GET request to the base URL
             response = requests.get(
                 self.base_url,
@@ -64,47 +223,194 @@ class APIService:
             self.logger.error("API connection failed", e)
             raise Exception(f"API connection failed: {str(e)}")
     
-    def bulk_upsert(self, table_name: str, data: List[Dict[str, Any]], key_field: str = "external_id") -> bool:
+    def _write_dry_run_chunks(self, table_name: str, chunks: Iterable[List[Dict[str, Any]]], key_field: str,
+                              metrics: Optional[TableMetrics] = None) -> int:
+        """Write normalized chunks to a dry-run file in dry_run_format (not json) and return the record count."""
+        from utils.dry_run import open_dry_run_writer
+        
+        writer = open_dry_run_writer(self.dry_run_folder, table_name, key_field, self.dry_run_format)
+        total = 0
+        try:
+            for chunk in chunks:
+                with timed(metrics, "serialize"):
+                    writer.write(chunk)
+                total += len(chunk)
+        finally:
+            writer.close()
+        if metrics is not None:
+            metrics.records_uploaded += total
+        self.logger.success(f"🧪 DRY-RUN: Saved {total} records to {writer.path}")
+        return total
+    
+    def _iter_byte_chunks(self, records: Iterable[Any], operation: str, key_field: str, batch_size: int,
+                          batch_bytes: Optional[int], metrics: Optional[TableMetrics] = None,
+                          boundary: Optional[Callable[[Any], bool]] = None):
+        """
+        Yield (records, body) chunks of at most batch_size records and roughly batch_bytes bytes.
+        
+        Records are serialized once and the request bodies are assembled from those
+        pieces, so sizing the chunks costs no extra serialization. A single record
+        larger than batch_bytes is sent on its own. A chunk is also closed after each
+        record for which boundary(record) is true (key-boundary chunks).
+        """
+        batch_bytes = batch_bytes or float("inf")
+        prefix = b'{"data": ['
+        suffix = ('], "operation": ' + json.dumps(operation) + ', "keyField": '
+                  + json.dumps(key_field, ensure_ascii=False) + '}').encode('utf-8')
+        overhead = len(prefix) + len(suffix)
+        pieces: List[bytes] = []
+        chunk: List[Any] = []
+        size = overhead
+        for record in records:
+            with timed(metrics, "serialize"):
+                piece = json.dumps(record, ensure_ascii=False, default=str).encode('utf-8')
+            if pieces and (len(pieces) >= batch_size or size + len(piece) + 2 > batch_bytes):
+                yield chunk, prefix + b", ".join(pieces) + suffix
+                pieces, chunk, size = [], [], overhead
+            pieces.append(piece)
+            chunk.append(record)
+            size += len(piece) + 2
+            if boundary is not None and boundary(record):
+                yield chunk, prefix + b", ".join(pieces) + suffix
+                pieces, chunk, size = [], [], overhead
+        if pieces:
+            yield chunk, prefix + b", ".join(pieces) + suffix
+    
+    def _iter_normalized_chunks(self, records: Iterable[Dict[str, Any]], chunk_size: int,
+                                metrics: Optional[TableMetrics] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield lowercased chunks of chunk_size records from an iterable."""
+        iterator = iter(records)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                return
+            with timed(metrics, "normalize"):
+                yield self._lowercase_json(chunk)
+    
+    def _bulk_upsert_stream(self, table_name: str, records: Iterable[Dict[str, Any]], key_field: str,
+                            metrics: Optional[TableMetrics], batch_size: int, batch_bytes: Optional[int],
+                            operation: str = "upsert", chunking: Optional[KeyChunking] = None) -> bool:
+        """
+        Upsert an iterable of records (e.g. a memory-bounded nested extract) chunk by chunk.
+        
+        Only one chunk is held in memory at a time; the dry-run file is written incrementally
+        in the same format as for a list.
+        """
+        endpoint = f"{self.base_url}/{table_name}/bulk"
+        transformed_key_field = key_field.lower() if isinstance(key_field, str) else key_field
+        chunks = self._iter_normalized_chunks(records, batch_size, metrics)
+        total = 0
+        
+        self.logger.info(f"📊 Streaming records for table: {table_name}")
+        self.logger.info(f"🌐 Target URL: {endpoint}")
+        
+        if self.dry_run and self.dry_run_format != "json":
+            self._write_dry_run_chunks(table_name, chunks, transformed_key_field, metrics)
+            return True
+        
+        if self.dry_run:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_file = os.path.join(self.dry_run_folder, f"{table_name}_{timestamp}.json")
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write('{\n  "data": [')
+                for chunk in chunks:
+                    with timed(metrics, "serialize"):
+                        pieces = [textwrap.indent(json.dumps(record, indent=2, ensure_ascii=False, default=str), "    ")
+                                  for record in chunk]
+                    f.write((",\n" if total else "\n") + ",\n".join(pieces))
+                    total += len(chunk)
+                f.write("\n  ]" if total else "]")
+                f.write(',\n  "operation": ' + json.dumps(operation) + ',\n  "keyField": '
+                        + json.dumps(transformed_key_field, ensure_ascii=False) + '\n}')
+            if metrics is not None:
+                metrics.records_uploaded += total
+            self.logger.success(f"🧪 DRY-RUN: Saved {total} records to {output_file}")
+            return True
+        
+        if batch_bytes or chunking is not None:
+            body_chunks = self._iter_byte_chunks(itertools.chain.from_iterable(chunks), operation,
+                                                 transformed_key_field, batch_size, batch_bytes, metrics,
+                                                 boundary=chunking.boundary(batch_size) if chunking else None)
+            total = self._post_body_chunks(endpoint, table_name, body_chunks, operation, transformed_key_field,
+                                           metrics, chunking)
+        else:
+            for chunk in chunks:
+                count = self._post_records(endpoint, table_name, chunk, operation, transformed_key_field, metrics)
+                total += count
+                if metrics is not None:
+                    metrics.records_uploaded += count
+        
+        if not total and not (chunking is not None and chunking.digests is not None and chunking.digests.skipped_chunks):
+            self.logger.warning(f"No data to upsert for table: {table_name}")
+        else:
+            self.logger.success(f"Bulk upsert successful for {table_name}: {total} records")
+        return True
+    
+    def bulk_upsert(self, table_name: str, data: Iterable[Dict[str, Any]], key_field: str = "external_id",
+                    metrics: Optional[TableMetrics] = None, batch_size: Optional[int] = None,
+                    batch_bytes: Optional[int] = None, operation: str = "upsert",
+                    chunking: Optional[KeyChunking] = None) -> bool:
         """
-        Perform bulk upsert operation.
+        Perform bulk upsert operation in chunks of batch_size records.
         
         Args:
             table_name: Name of the table to upsert into
-            data: List of data dictionaries to upsert
+            data: List of data dictionaries to upsert, or any iterable to upload it as a stream
             key_field: Field name to use as the key for upsert operation
+            metrics: Optional table metrics to record stage timings into
+            batch_size: Records per request for this table (default: the service batch_size)
+            batch_bytes: Also cap each request body at about this many bytes (before compression)
+            operation: "upsert", or "patch" when the records only hold their changed fields
+            chunking: Cut chunks on key boundaries (records sorted by key), skipping chunks
+                uploaded before when it keeps chunk digests
         
         Returns:
             True if successful, raises exception otherwise
         """
+        if not isinstance(data, list):
+            return self._bulk_upsert_stream(table_name, data, key_field, metrics,
+                                            max(1, int(batch_size or self.batch_size)), batch_bytes, operation,
+                                            chunking)
+        
         if not data:
             self.logger.warning(f"No data to upsert for table: {table_name}")
             return True
         
         endpoint = f"{self.base_url}/{table_name}/bulk"
-        transformed_data = self._lowercase_json(data)
+        with timed(metrics, "normalize"):
+            transformed_data = self._lowercase_json(data)
         transformed_key_field = key_field.lower() if isinstance(key_field, str) else key_field
-
-        payload = {
-            "data": transformed_data,
-            "operation": "upsert",
-            "keyField": transformed_key_field
-        }
         
         self.logger.info(f"📊 Processing {len(data)} records for table: {table_name}")
         self.logger.info(f"🌐 Target URL: {endpoint}")
         
-        # DRY-RUN MODE: Save to JSON file instead of posting
+        # DRY-RUN MODE: Save to a file instead of posting
+        if self.dry_run and self.dry_run_format != "json":
+            step = max(1, int(batch_size or self.batch_size))
+            chunks = (transformed_data[start:start + step] for start in range(0, len(transformed_data), step))
+            self._write_dry_run_chunks(table_name, chunks, transformed_key_field, metrics)
+            return True
+        
         if self.dry_run:
+            payload = {
+                "data": transformed_data,
+                "operation": operation,
+                "keyField": transformed_key_field
+            }
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             output_file = os.path.join(self.dry_run_folder, f"{table_name}_{timestamp}.json")
             
             try:
+                with timed(metrics, "serialize"):
+                    serialized = json.dumps(payload, indent=2, ensure_ascii=False, default=str)
                 with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(payload, f, indent=2, ensure_ascii=False, default=str)
+                    f.write(serialized)
                 
                 self.logger.success(f"🧪 DRY-RUN: Saved {len(data)} records to {output_file}")
                 self.logger.info(f"   Would POST to: {endpoint}")
-                self.logger.info(f"   Payload size: {len(json.dumps(payload))} bytes")
+                self.logger.info(f"   Payload size: {len(serialized.encode('utf-8'))} bytes")
+                if metrics is not None:
+                    metrics.records_uploaded += len(data)
                 return True
                 
             except Exception as e:
@@ -112,36 +418,213 @@ class APIService:
                 return False
         
         # NORMAL MODE: Actually post to API
-        self.logger.info(f"📤 Bulk upserting {len(data)} records to {table_name}")
+        batch_size = max(1, int(batch_size or self.batch_size))
+        if batch_bytes or chunking is not None:
+            if chunking is not None:
+                self.logger.info(f"📤 Bulk upserting {len(data)} records to {table_name} in key-boundary chunks")
+            else:
+                self.logger.info(f"📤 Bulk upserting {len(data)} records to {table_name} in chunks of max {batch_bytes} bytes")
+            chunks = self._iter_byte_chunks(transformed_data, operation, transformed_key_field,
+                                            batch_size, batch_bytes, metrics,
+                                            boundary=chunking.boundary(batch_size) if chunking else None)
+            self._post_body_chunks(endpoint, table_name, chunks, operation, transformed_key_field, metrics, chunking)
+            self.logger.success(f"Bulk upsert successful for {table_name}: {len(data)} records")
+            return True
         
-        # Retry logic with exponential backoff
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.post(
-                    endpoint,
-                    json=payload,
-                    headers=self._get_headers(),
-                    timeout=30
-                )
-                
-                if response.status_code in [200, 201]:
-                    self.logger.success(f"Bulk upsert successful for {table_name}: {len(data)} records")
-                    return True
-                elif response.status_code >= 500:
-                    # Server error, retry
-                    raise Exception(f"Server error: {response.status_code} - {response.text}")
-                else:
-                    # Client error, don't retry
-                    self.logger.error(f"Bulk upsert failed for {table_name}: {response.status_code} - {response.text}")
-                    raise Exception(f"API error: {response.status_code} - {response.text}")
+        total_chunks = (len(transformed_data) + batch_size - 1) // batch_size
+        self.logger.info(f"📤 Bulk upserting {len(data)} records to {table_name} in {total_chunks} chunk(s)")
+        
+        for chunk_index, start in enumerate(range(0, len(transformed_data), batch_size), start=1):
+            chunk = transformed_data[start:start + batch_size]
+            count = self._post_records(endpoint, table_name, chunk, operation, transformed_key_field, metrics)
+            if metrics is not None:
+                metrics.records_uploaded += count
+            if total_chunks > 1:
+                self.logger.debug(f"Chunk {chunk_index}/{total_chunks} uploaded for {table_name}")
+        
+        self.logger.success(f"Bulk upsert successful for {table_name}: {len(data)} records")
+        return True
+
+    
+    def bulk_import(self, table_name: str, data: Iterable[Dict[str, Any]], key_field: str = "external_id",
+                    metrics: Optional[TableMetrics] = None, poll_seconds: float = 5.0,
+                    timeout_seconds: float = 3600.0, operation: str = "upsert") -> bool:
+        """
+        Upload all records as one gzip-compressed NDJSON body to the import endpoint
+        and wait until the import job finished.
+        
+        The body is spooled to a temporary file first so that a failed upload can be
+        retried; only one chunk of records is held in memory. The endpoint
+        ({base_url}/{table}/import) answers with a job ({"id", "status"}) whose status
+        is polled at its Location header or {endpoint}/{id} until it is completed or failed.
+        
+        Returns:
+            True if successful, raises exception otherwise
+        """
+        if self.dry_run:
+            return self.bulk_upsert(table_name, data, key_field, metrics=metrics, operation=operation)
+        
+        import tempfile
+        
+        endpoint = f"{self.base_url}/{table_name}/import"
+        transformed_key_field = key_field.lower() if isinstance(key_field, str) else key_field
+        total = 0
+        with tempfile.TemporaryFile() as spool:
+            with gzip.GzipFile(fileobj=spool, mode='wb', compresslevel=5) as body:
+                for chunk in self._iter_normalized_chunks(data, self.batch_size, metrics):
+                    with timed(metrics, "serialize"):
+                        body.write("".join(json.dumps(record, ensure_ascii=False, default=str) + "\n"
+                                           for record in chunk).encode('utf-8'))
+                    total += len(chunk)
+            if not total:
+                self.logger.warning(f"No data to import for table: {table_name}")
+                return True
+            size = spool.tell()
+            self.logger.info(f"📤 Importing {total} records ({size} compressed bytes) into {table_name}")
+            
+            headers = self._get_headers()
+            headers.update({"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"})
+            params = {"operation": operation, "keyField": transformed_key_field}
+            from requests.exceptions import RequestException
+            
+            for attempt in range(self.max_retries):
+                if attempt > 0 and metrics is not None:
+                    metrics.retries += 1
+                spool.seek(0)
+                data = spool
+                if self.throttle is not None:
+                    from utils.throttle import ThrottledReader
                     
-            except requests.exceptions.RequestException as e:
+                    self.throttle.take("requests", 1)
+                    data = ThrottledReader(spool, size, self.throttle)
+                start = time.perf_counter()
+                try:
+                    response = self.session.post(endpoint, data=data, params=params, headers=headers,
+                                                 timeout=(30, 600))
+                    if response.status_code in (200, 201, 202):
+                        break
+                    error = f"{response.status_code} - {response.text}"
+                    if response.status_code < 500:
+                        raise Exception(f"Import failed for {table_name}: {error}")
+                except RequestException as e:
+                    error = str(e)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    if metrics is not None:
+                        metrics.add_time("upload", elapsed)
+                        metrics.record_request(elapsed, size)
+                
                 if attempt < self.max_retries - 1:
                     delay = self.initial_retry_delay * (2 ** attempt)
-                    self.logger.warning(f"Attempt {attempt + 1} failed, retrying in {delay} seconds...")
+                    self.logger.warning(f"Import attempt {attempt + 1} failed ({error}), retrying in {delay} seconds...")
                     time.sleep(delay)
                 else:
-                    self.logger.error(f"All retry attempts failed for {table_name}", e)
-                    raise Exception(f"Bulk upsert failed after {self.max_retries} attempts: {str(e)}")
+                    raise Exception(f"Import failed after {self.max_retries} attempts: {error}")
+        
+        job = response.json() if response.content else {}
+        status_url = response.headers.get("Location") or (f"{endpoint}/{job['id']}" if job.get("id") else None)
+        with timed(metrics, "import_wait"):
+            self._wait_for_import(table_name, job, status_url, poll_seconds, timeout_seconds)
+        
+        if metrics is not None:
+            metrics.records_uploaded += total
+        if self.on_chunk is not None:
+            self.on_chunk(table_name, total, size)
+        self.logger.success(f"Bulk import successful for {table_name}: {total} records")
+        return True
+    
+    IMPORT_DONE = ("completed", "succeeded", "success", "done")
+    IMPORT_FAILED = ("failed", "error", "cancelled", "canceled")
+    
+    def _wait_for_import(self, table_name: str, job: Dict[str, Any], status_url: Optional[str],
+                         poll_seconds: float, timeout_seconds: float) -> None:
+        """
+        Poll an import job until it is done; raise if it failed or did not finish in time.
+        
+        A poll that fails with a server or network error is retried with the same
+        backoff as an upload; max_retries failed polls in a row fail the import.
+        """
+        from urllib.parse import urljoin
+        from requests.exceptions import RequestException
+        
+        deadline = time.monotonic() + timeout_seconds
+        delay = poll_seconds
+        failures = 0  # failed polls in a row
+        while True:
+            status = str(job.get("status", "completed" if status_url is None else "")).lower()
+            if status in self.IMPORT_DONE:
+                return
+            if status in self.IMPORT_FAILED:
+                raise Exception(f"Import of {table_name} failed: {job.get('error') or job.get('errors') or status}")
+            if status_url is None:
+                raise Exception(f"Import of {table_name} returned status {status!r} without a job to poll")
+            if time.monotonic() > deadline:
+                raise Exception(f"Import of {table_name} did not finish within {timeout_seconds:.0f} seconds")
+            time.sleep(delay)
+            delay = poll_seconds
+            try:
+                response = self.session.get(urljoin(self.base_url + "/", status_url), headers=self._get_headers(),
+                                            timeout=30)
+                error = f"Server error: {response.status_code} - {response.text}" if response.status_code >= 500 else None
+            except RequestException as e:
+                error = str(e)
+            if error is not None:
+                failures += 1
+                if failures >= self.max_retries:
+                    raise Exception(f"Import status of {table_name} failed after {self.max_retries} attempts: {error}")
+                delay = self.initial_retry_delay * (2 ** (failures - 1))
+                self.logger.warning(f"Import status poll of {table_name} failed ({error}), retrying in {delay} seconds...")
+                continue
+            failures = 0
+            if response.status_code not in (200, 201, 202):
+                raise Exception(f"Import status of {table_name} failed: {response.status_code} - {response.text}")
+            job = response.json()
+            self.logger.debug(f"Import of {table_name}: {job.get('status')}")
+    
+    def bulk_delete(self, table_name: str, keys: List[Any], key_field: str = "external_id",
+                    soft: bool = False, metrics: Optional[TableMetrics] = None) -> bool:
+        """
+        Delete (or soft-delete) records by key in chunks of batch_size keys.
+        
+        Args:
+            table_name: Name of the table to delete from
+            keys: Key values of the records to delete
+            key_field: Field name used as the key
+            soft: Use the soft_delete operation instead of delete
+            metrics: Optional table metrics to record stage timings into
+        
+        Returns:
+            True if successful, raises exception otherwise
+        """
+        if not keys:
+            return True
+        
+        endpoint = f"{self.base_url}/{table_name}/bulk"
+        operation = "soft_delete" if soft else "delete"
+        transformed_key_field = key_field.lower() if isinstance(key_field, str) else key_field
+        
+        if self.dry_run:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_file = os.path.join(self.dry_run_folder, f"{table_name}_{operation}_{timestamp}.json")
+            payload = {
+                "data": [{transformed_key_field: key} for key in keys],
+                "operation": operation,
+                "keyField": transformed_key_field
+            }
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, indent=2, ensure_ascii=False, default=str)
+            self.logger.success(f"🧪 DRY-RUN: Saved {len(keys)} {operation} keys to {output_file}")
+            return True
+        
+        self.logger.info(f"🗑 Sending {operation} for {len(keys)} records to {table_name}")
+        for start in range(0, len(keys), self.batch_size):
+            chunk = keys[start:start + self.batch_size]
+            payload = {
+                "data": [{transformed_key_field: key} for key in chunk],
+                "operation": operation,
+                "keyField": transformed_key_field
+            }
+            self._post_chunk(endpoint, table_name, payload, metrics)
         
-        return False
\ No newline at end of file
+        self.logger.success(f"Bulk {operation} successful for {table_name}: {len(keys)} records")
+        return True
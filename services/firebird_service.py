@@ -1,19 +1,38 @@
-import fdb
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
+from utils.connection_pool import ConnectionPool
+from utils.firebird_types import ColumnDecoders, stream_threshold
 from utils.logging import Logger
+from utils.metrics import TableMetrics, timed
+from utils.sql import bind_params, compile_named_params, read_sql_file
+from utils.validation import describe_columns
 
 class FirebirdService:
-    """Service for Firebird database operations."""
+    """
+    Service for Firebird database operations.
+
+    The fdb driver is imported on the first connection, so runs that never touch
+    Firebird do not pay for loading it. Result columns the driver returns as bytes or
+    BLOB readers are decoded per column (see utils.firebird_types).
+    """
+
+    dialect = "firebird"
     
-    def __init__(self, database_path: str, username: str, password: str, charset: Optional[str] = None):
+    def __init__(self, database_path: str, username: str, password: str, charset: Optional[str] = None,
+                 blob_max_mb: float = 16):
         self.database_path = database_path
         self.username = username
         self.password = password
         self.charset = charset.strip().upper() if charset else None
+        self.blob_max_bytes = int(blob_max_mb * 1024 * 1024) if blob_max_mb else 0
         self.logger = Logger("firebird")
+        self.pool = ConnectionPool(self._connect_for_pool, ping=self._ping)
+        # Rate limits for fetched rows (utils.throttle), set by the sync per table
+        self.throttle = None
 
     def _connect(self):
         """Create a Firebird connection honoring optional charset."""
+        import fdb
+
         conn_kwargs = {
             "dsn": self.database_path,
             "user": self.username,
@@ -24,6 +43,33 @@ class FirebirdService:
         else:
             conn_kwargs["charset"] = "UTF8"  # match legacy default
         return fdb.connect(**conn_kwargs)
+
+    def _connect_for_pool(self):
+        """Create a pooled connection using read-committed read-only transactions."""
+        import fdb
+
+        conn = self._connect()
+        # Read-only read-committed transactions see fresh data on every query and do not
+        # hold back garbage collection, so the connection can stay open between runs
+        tpb = getattr(fdb, "ISOLATION_LEVEL_READ_COMMITED_RO", None)
+        if tpb is not None:
+            conn.default_tpb = tpb
+        return conn
+
+    @staticmethod
+    def _ping(conn) -> None:
+        """Raise if the server dropped a pooled connection."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1 FROM RDB$DATABASE")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        conn.commit(retaining=True)
+
+    def close(self) -> None:
+        """Close pooled connections."""
+        self.pool.close()
     
     def test_connection(self) -> bool:
         """Test Firebird connection."""
@@ -36,48 +82,161 @@ class FirebirdService:
             self.logger.error("Firebird connection failed", e)
             raise Exception(f"Firebird connection failed: {str(e)}")
     
-    def execute_query(self, sql: str) -> List[Dict[str, Any]]:
-        """Execute SQL query and return results as list of dictionaries."""
+    def execute_query(self, sql: str, metrics: Optional[TableMetrics] = None,
+                      params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Execute SQL query and return results as list of dictionaries.
+        
+        Named parameters (:name) are bound from params through the driver. The prepared
+        statement is cached on the pooled connection and reused on the next execution.
+        """
         try:
             self.logger.info(f"Executing Firebird query")
             
-            conn = self._connect()
-            cursor = conn.cursor()
-            
-            # Encode SQL string to bytes for fdb
-            if isinstance(sql, str):
-                sql = sql.encode('utf-8')
+            compiled_sql, names = compile_named_params(sql)
+            values = bind_params(names, params)
             
-            cursor.execute(sql)
+            with timed(metrics, "connect"):
+                conn = self.pool.acquire()
+            try:
+                with timed(metrics, "prepare"):
+                    # Encode SQL string to bytes for fdb (once, when the statement is prepared)
+                    cursor, prepared = self.pool.statement(
+                        conn, compiled_sql,
+                        lambda: self._prepare(conn, compiled_sql),
+                        dispose=lambda statement: statement[0].close()
+                    )
+                
+                with timed(metrics, "execute"):
+                    cursor.execute(prepared, values)
+                
+                decoders = ColumnDecoders(cursor.description, self.blob_max_bytes)
+                if metrics is not None:
+                    metrics.columns = describe_columns(cursor.description)
+                
+                # Fetch all rows and convert to list of dictionaries
+                if self.throttle is None:
+                    with timed(metrics, "fetch"):
+                        rows = cursor.fetchall()
+                    with timed(metrics, "decode"):
+                        results = decoders.to_dicts(rows)
+                else:
+                    results = []
+                    while True:
+                        with timed(metrics, "fetch"):
+                            batch = cursor.fetchmany(1000)
+                        if not batch:
+                            break
+                        # Decoded per batch: streamed BLOBs must be read before the next fetch
+                        with timed(metrics, "decode"):
+                            results.extend(decoders.to_dicts(batch))
+                        self.throttle.rows(len(batch))
+                
+                conn.commit(retaining=True)
+                self._warn_truncated(decoders)
+            except Exception:
+                self.pool.discard(conn)
+                raise
+            self.pool.release(conn)
             
-            # Get column names
-            columns = [desc[0] for desc in cursor.description]
+            self.logger.success(f"Firebird query executed successfully, {len(results)} rows returned")
+            return results
             
-            # Fetch all rows and convert to list of dictionaries
-            results = []
-            for row in cursor.fetchall():
-                results.append(dict(zip(columns, row)))
+        except Exception as e:
+            self.logger.error("Firebird query execution failed", e)
+            raise Exception(f"Firebird query failed: {str(e)}")
+    
+    def iter_query(self, sql: str, metrics: Optional[TableMetrics] = None,
+                   params: Optional[Dict[str, Any]] = None, fetch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Execute SQL query and yield rows as dictionaries, fetching fetch_size rows at a time.
+        
+        The pooled connection stays checked out until the iteration ends.
+        """
+        compiled_sql, names = compile_named_params(sql)
+        values = bind_params(names, params)
+        
+        with timed(metrics, "connect"):
+            conn = self.pool.acquire()
+        try:
+            with timed(metrics, "prepare"):
+                cursor, prepared = self.pool.statement(
+                    conn, compiled_sql,
+                    lambda: self._prepare(conn, compiled_sql),
+                    dispose=lambda statement: statement[0].close()
+                )
             
-            cursor.close()
-            conn.close()
+            with timed(metrics, "execute"):
+                cursor.execute(prepared, values)
+            decoders = ColumnDecoders(cursor.description, self.blob_max_bytes)
+            if metrics is not None:
+                metrics.columns = describe_columns(cursor.description)
             
-            self.logger.success(f"Firebird query executed successfully, {len(results)} rows returned")
-            return results
+            row_count = 0
+            while True:
+                with timed(metrics, "fetch"):
+                    batch = cursor.fetchmany(fetch_size)
+                if not batch:
+                    break
+                row_count += len(batch)
+                if self.throttle is not None:
+                    self.throttle.rows(len(batch))
+                # Decoded before yielding: streamed BLOBs must be read before the next fetch
+                with timed(metrics, "decode"):
+                    batch = decoders.to_dicts(batch)
+                yield from batch
             
+            conn.commit(retaining=True)
+            self._warn_truncated(decoders)
+        except GeneratorExit:
+            # Abandoned mid-stream: the cursor still has pending rows
+            self.pool.discard(conn)
+            raise
         except Exception as e:
+            self.pool.discard(conn)
             self.logger.error("Firebird query execution failed", e)
             raise Exception(f"Firebird query failed: {str(e)}")
+        self.pool.release(conn)
+        self.logger.success(f"Firebird query streamed successfully, {row_count} rows returned")
+    
+    def explain(self, sql: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Return the plan Firebird chose when preparing sql, without running the query."""
+        compiled_sql, _ = compile_named_params(sql)
+        conn = self.pool.acquire()
+        try:
+            cursor, prepared = self._prepare(conn, compiled_sql)
+            plan = prepared.plan or ""
+            cursor.close()
+            conn.commit(retaining=True)
+        except Exception:
+            self.pool.discard(conn)
+            raise
+        self.pool.release(conn)
+        return plan.strip()
+    
+    def _prepare(self, conn, sql: str):
+        """Prepare sql on a new cursor of conn."""
+        cursor = conn.cursor()
+        prepared = cursor.prep(sql.encode('utf-8'))
+        # BLOBs above the limit are streamed so that they are never read whole
+        prepared.set_stream_blob_treshold(stream_threshold(self.blob_max_bytes))
+        return cursor, prepared
+    
+    def _warn_truncated(self, decoders: ColumnDecoders) -> None:
+        if decoders.truncated:
+            self.logger.warning(f"{decoders.truncated} BLOB value(s) truncated to "
+                                f"{self.blob_max_bytes} bytes (firebird.blob_max_mb)")
     
-    def execute_query_from_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def execute_query_from_file(self, file_path: str, metrics: Optional[TableMetrics] = None,
+                                params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Execute SQL query from file."""
         try:
-            # Read file with UTF-8-SIG to automatically remove BOM if present
-            with open(file_path, 'r', encoding='utf-8-sig') as f:
-                sql = f.read()
+            # Cached read with UTF-8-SIG to automatically remove BOM if present
+            sql = read_sql_file(file_path)
             
             self.logger.info(f"Executing query from file: {file_path}")
-            return self.execute_query(sql)
+            return self.execute_query(sql, metrics, params)
             
         except Exception as e:
             self.logger.error(f"Failed to execute query from file: {file_path}", e)
-            raise
\ No newline at end of file
+            raise
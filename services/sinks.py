@@ -0,0 +1,147 @@
+"""
+Output sinks: where the records of a table are written.
+
+    rest         upsert chunks through the REST bulk endpoint (default)
+    bulk_import  one compressed NDJSON upload to the import endpoint, polled until done
+    file         local NDJSON (or any dry-run format) files in sync.sink_folder
+
+The sink is chosen per query file (-- @sink / @initial_sink headers, sync.query_sinks,
+sync.default_sink), so an initial load of millions of rows can use bulk_import while
+the incremental runs after it keep using rest upserts.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.logging import Logger
+from utils.metrics import TableMetrics, timed
+from utils.transformers import lowercase_json
+
+SINKS = ("rest", "bulk_import", "file")
+
+
+class Sink:
+    """Interface of a sink; every sink can upsert records and delete keys."""
+
+    name = ""
+
+    def upsert(self, table_name: str, records: Iterable[Dict[str, Any]], key_field: str = "external_id",
+               metrics: Optional[TableMetrics] = None, batch_size: Optional[int] = None,
+               batch_bytes: Optional[int] = None, operation: str = "upsert", chunking=None) -> bool:
+        raise NotImplementedError
+
+    def delete(self, table_name: str, keys: List[Any], key_field: str = "external_id", soft: bool = False,
+               metrics: Optional[TableMetrics] = None) -> bool:
+        raise NotImplementedError
+
+
+class RestSink(Sink):
+    """Upserts and deletes through the REST bulk endpoint of the API service."""
+
+    name = "rest"
+
+    def __init__(self, api_service):
+        self.api_service = api_service
+
+    def upsert(self, table_name, records, key_field="external_id", metrics=None, batch_size=None, batch_bytes=None,
+               operation="upsert", chunking=None):
+        return self.api_service.bulk_upsert(table_name, records, key_field, metrics=metrics,
+                                            batch_size=batch_size, batch_bytes=batch_bytes, operation=operation,
+                                            chunking=chunking)
+
+    def delete(self, table_name, keys, key_field="external_id", soft=False, metrics=None):
+        return self.api_service.bulk_delete(table_name, keys, key_field, soft=soft, metrics=metrics)
+
+
+class BulkImportSink(RestSink):
+    """Uploads a whole table as one import job; deletes still go through the REST bulk endpoint."""
+
+    name = "bulk_import"
+
+    def __init__(self, api_service, poll_seconds: float = 5.0, timeout_seconds: float = 3600.0):
+        super().__init__(api_service)
+        self.poll_seconds = poll_seconds
+        self.timeout_seconds = timeout_seconds
+
+    def upsert(self, table_name, records, key_field="external_id", metrics=None, batch_size=None, batch_bytes=None,
+               operation="upsert", chunking=None):
+        # One import job: there are no chunks to cut or skip
+        return self.api_service.bulk_import(table_name, records, key_field, metrics=metrics,
+                                            poll_seconds=self.poll_seconds, timeout_seconds=self.timeout_seconds,
+                                            operation=operation)
+
+
+class FileSink(Sink):
+    """
+    Writes each run of a table to a new local file, normalized like the API payload.
+
+    Deleted keys go to a separate {table}_{operation}_{timestamp} file in the same format,
+    and so do patches ({table}_patch_{timestamp}).
+    """
+
+    name = "file"
+
+    def __init__(self, folder: str, file_format: str = "jsonl", chunk_size: int = 1000):
+        self.folder = folder
+        self.file_format = file_format
+        self.chunk_size = max(1, int(chunk_size))
+        self.logger = Logger("sink")
+
+    def _write(self, name: str, key_field: str, chunks: Iterable[List[Dict[str, Any]]],
+               metrics: Optional[TableMetrics]) -> int:
+        from utils.dry_run import open_dry_run_writer
+
+        os.makedirs(self.folder, exist_ok=True)
+        writer = open_dry_run_writer(self.folder, name, key_field, self.file_format)
+        total = 0
+        try:
+            for chunk in chunks:
+                with timed(metrics, "serialize"):
+                    writer.write(chunk)
+                total += len(chunk)
+        finally:
+            writer.close()
+        self.logger.success(f"Saved {total} records to {writer.path}")
+        return total
+
+    def upsert(self, table_name, records, key_field="external_id", metrics=None, batch_size=None, batch_bytes=None,
+               operation="upsert", chunking=None):
+        import itertools
+
+        iterator = iter(records)
+
+        def chunks():
+            while True:
+                chunk = list(itertools.islice(iterator, self.chunk_size))
+                if not chunk:
+                    return
+                with timed(metrics, "normalize"):
+                    yield lowercase_json(chunk)
+
+        name = table_name if operation == "upsert" else f"{table_name}_{operation}"
+        total = self._write(name, key_field.lower(), chunks(), metrics)
+        if metrics is not None:
+            metrics.records_uploaded += total
+        return True
+
+    def delete(self, table_name, keys, key_field="external_id", soft=False, metrics=None):
+        if not keys:
+            return True
+        key_field = key_field.lower()
+        operation = "soft_delete" if soft else "delete"
+        self._write(f"{table_name}_{operation}", key_field, [[{key_field: key} for key in keys]], metrics)
+        return True
+
+
+def create_sink(name: str, api_service, sync_config: Dict[str, Any], api_config: Dict[str, Any]) -> Sink:
+    """Create the sink called name from the sync and api configuration sections."""
+    if name == "rest":
+        return RestSink(api_service)
+    if name == "bulk_import":
+        return BulkImportSink(api_service,
+                              poll_seconds=float(api_config.get("import_poll_seconds", 5)),
+                              timeout_seconds=float(api_config.get("import_timeout_minutes", 60)) * 60)
+    if name == "file":
+        return FileSink(sync_config.get("sink_folder") or "sink-output",
+                        file_format=str(sync_config.get("file_sink_format") or "jsonl").lower(),
+                        chunk_size=sync_config.get("batch_size", 1000))
+    raise Exception(f"Unknown sink: {name} (expected one of {', '.join(SINKS)})")
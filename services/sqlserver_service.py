@@ -1,18 +1,53 @@
-import pyodbc
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
+from utils.connection_pool import ConnectionPool
 from utils.logging import Logger
+from utils.metrics import TableMetrics, timed
+from utils.sql import bind_params, compile_named_params, read_sql_file
+from utils.throttle import fetch_rows
+from utils.validation import describe_columns
 
 class SQLServerService:
-    """Service for SQL Server database operations."""
+    """
+    Service for SQL Server database operations.
+
+    The pyodbc driver is imported on the first connection, so runs that never touch
+    SQL Server do not pay for loading it.
+    """
+
+    dialect = "sqlserver"
     
     def __init__(self, connection_string: str):
         self.connection_string = connection_string
         self.logger = Logger("sqlserver")
+        self.pool = ConnectionPool(self._connect, ping=self._ping)
+        # Rate limits for fetched rows (utils.throttle), set by the sync per table
+        self.throttle = None
+    
+    def _connect(self, **kwargs):
+        """Create a SQL Server connection."""
+        import pyodbc
+        
+        return pyodbc.connect(self.connection_string, **kwargs)
+    
+    @staticmethod
+    def _ping(conn) -> None:
+        """Raise if the server dropped a pooled connection."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        conn.commit()
+    
+    def close(self) -> None:
+        """Close pooled connections."""
+        self.pool.close()
     
     def test_connection(self) -> bool:
         """Test SQL Server connection."""
         try:
-            conn = pyodbc.connect(self.connection_string, timeout=5)
+            conn = self._connect(timeout=5)
             conn.close()
             self.logger.success("SQL Server connection successful")
             return True
@@ -20,43 +55,137 @@ class SQLServerService:
             self.logger.error("SQL Server connection failed", e)
             raise Exception(f"SQL Server connection failed: {str(e)}")
     
-    def execute_query(self, sql: str) -> List[Dict[str, Any]]:
-        """Execute SQL query and return results as list of dictionaries."""
+    def execute_query(self, sql: str, metrics: Optional[TableMetrics] = None,
+                      params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Execute SQL query and return results as list of dictionaries.
+        
+        Named parameters (:name) are bound from params through the driver. Each SQL text
+        keeps its own cursor on the pooled connection; pyodbc reuses the prepared
+        statement when the same text is executed again on that cursor.
+        """
         try:
             self.logger.info(f"Executing SQL Server query")
             
-            conn = pyodbc.connect(self.connection_string)
-            cursor = conn.cursor()
+            compiled_sql, names = compile_named_params(sql)
+            values = bind_params(names, params)
             
-            cursor.execute(sql)
+            with timed(metrics, "connect"):
+                conn = self.pool.acquire()
+            try:
+                cursor = self.pool.statement(conn, compiled_sql, conn.cursor, dispose=lambda c: c.close())
+                
+                with timed(metrics, "execute"):
+                    if values:
+                        cursor.execute(compiled_sql, values)
+                    else:
+                        cursor.execute(compiled_sql)
+                
+                # Get column names
+                columns = [column[0] for column in cursor.description]
+                if metrics is not None:
+                    metrics.columns = describe_columns(cursor.description)
+                
+                # Fetch all rows and convert to list of dictionaries
+                with timed(metrics, "fetch"):
+                    results = [dict(zip(columns, row)) for row in fetch_rows(cursor, self.throttle)]
+                
+                conn.commit()
+            except Exception:
+                self.pool.discard(conn)
+                raise
+            self.pool.release(conn)
             
-            # Get column names
-            columns = [column[0] for column in cursor.description]
+            self.logger.success(f"SQL Server query executed successfully, {len(results)} rows returned")
+            return results
             
-            # Fetch all rows and convert to list of dictionaries
-            results = []
-            for row in cursor.fetchall():
-                results.append(dict(zip(columns, row)))
+        except Exception as e:
+            self.logger.error("SQL Server query execution failed", e)
+            raise Exception(f"SQL Server query failed: {str(e)}")
+    
+    def iter_query(self, sql: str, metrics: Optional[TableMetrics] = None,
+                   params: Optional[Dict[str, Any]] = None, fetch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Execute SQL query and yield rows as dictionaries, fetching fetch_size rows at a time.
+        
+        The pooled connection stays checked out until the iteration ends.
+        """
+        compiled_sql, names = compile_named_params(sql)
+        values = bind_params(names, params)
+        
+        with timed(metrics, "connect"):
+            conn = self.pool.acquire()
+        try:
+            cursor = self.pool.statement(conn, compiled_sql, conn.cursor, dispose=lambda c: c.close())
             
-            cursor.close()
-            conn.close()
+            with timed(metrics, "execute"):
+                if values:
+                    cursor.execute(compiled_sql, values)
+                else:
+                    cursor.execute(compiled_sql)
+            columns = [column[0] for column in cursor.description]
+            if metrics is not None:
+                metrics.columns = describe_columns(cursor.description)
             
-            self.logger.success(f"SQL Server query executed successfully, {len(results)} rows returned")
-            return results
+            row_count = 0
+            while True:
+                with timed(metrics, "fetch"):
+                    batch = cursor.fetchmany(fetch_size)
+                if not batch:
+                    break
+                row_count += len(batch)
+                if self.throttle is not None:
+                    self.throttle.rows(len(batch))
+                for row in batch:
+                    yield dict(zip(columns, row))
             
+            conn.commit()
+        except GeneratorExit:
+            # Abandoned mid-stream: the cursor still has pending rows
+            self.pool.discard(conn)
+            raise
         except Exception as e:
+            self.pool.discard(conn)
             self.logger.error("SQL Server query execution failed", e)
             raise Exception(f"SQL Server query failed: {str(e)}")
+        self.pool.release(conn)
+        self.logger.success(f"SQL Server query streamed successfully, {row_count} rows returned")
+    
+    def explain(self, sql: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Return the estimated plan of sql (SET SHOWPLAN_TEXT) without running the query.
+        
+        Uses its own connection, so the SHOWPLAN setting never leaks into the pool.
+        """
+        compiled_sql, names = compile_named_params(sql)
+        values = bind_params(names, params)
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SET SHOWPLAN_TEXT ON")
+            lines: List[str] = []
+            if values:
+                cursor.execute(compiled_sql, values)
+            else:
+                cursor.execute(compiled_sql)
+            while True:
+                if cursor.description:
+                    lines.extend(str(row[0]).rstrip() for row in cursor.fetchall())
+                if not cursor.nextset():
+                    break
+            return "\n".join(lines)
+        finally:
+            conn.close()
     
-    def execute_query_from_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def execute_query_from_file(self, file_path: str, metrics: Optional[TableMetrics] = None,
+                                params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Execute SQL query from file."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                sql = f.read()
+            sql = read_sql_file(file_path)
             
             self.logger.info(f"Executing query from file: {file_path}")
-            return self.execute_query(sql)
+            return self.execute_query(sql, metrics, params)
             
         except Exception as e:
             self.logger.error(f"Failed to execute query from file: {file_path}", e)
-            raise
\ No newline at end of file
+            raise
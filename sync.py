@@ -1,64 +1,177 @@
+import time
+_IMPORT_STARTED = time.perf_counter()  # for --startup-profile
+
+import argparse
+import json
 import os
 import sys
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Set, Tuple, TYPE_CHECKING
 from config import Config
-from services.sqlserver_service import SQLServerService
-from services.firebird_service import FirebirdService
-from services.api_service import APIService
-from utils.logging import Logger
+from utils.logging import Logger, configure_logging
+from utils.chunking import ChunkDigests, KeyChunking, key_sort_token
+from utils.keyset import KeySetStore, decode_token, diff_sorted, key_token, merge_records, sorted_unique
+from utils.partitioning import fetch_partitioned
+from utils.payload import MINIMIZE_MODES, PatchSnapshot, minimize_records
+from utils.spill import MergedRecordStream, RecordStream, nest_within_budget, prime, sort_within_budget
+from utils.sql import invalidate_sql_file, read_sql_file
+from utils.metrics import RunMetrics, TableMetrics, timed, write_run_report
+from utils.prometheus import SyncMetrics, start_http_server
+from utils.query_meta import QueryCatalog, QuerySettings
+from utils.startup import get_startup_profile
+from utils.state import SyncState
+from utils.throttle import Throttle, ThrottleLevel, create_throttle
 from utils.transformers import auto_nest_data
+from utils.validation import RecordValidator, filter_valid
+
+if TYPE_CHECKING:
+    from services.sqlserver_service import SQLServerService
+    from services.firebird_service import FirebirdService
+    from services.api_service import APIService
+
+# Database drivers, requests and the services are imported when they are first needed
+_IMPORT_FINISHED = time.perf_counter()
 
 class SyncService:
     """Main sync service for DataSync application."""
     
-    def __init__(self):
-        self.config = Config()
-        self.logger = Logger("sync")
+    # Where a query file runs: "auto" tries SQL Server and falls back to Firebird (legacy)
+    QUERY_SOURCES = ("auto", "sql_server", "firebird", "both")
+    
+    # Delay between a file change notification and applying it
+    WATCH_SETTLE_SECONDS = 1.0
+    
+    def __init__(self, config_path: str = "config.json", tenant: Optional[str] = None,
+                 http_session: Any = None, configure_logging: bool = True):
+        """
+        Args:
+            config_path: Path of the configuration file
+            tenant: Tenant name when several configurations run in one process (see utils.tenants)
+            http_session: requests.Session shared with other tenants (default: one per APIService)
+            configure_logging: Apply the logging settings of this configuration to the shared backend
+        """
+        startup = get_startup_profile()
+        self.tenant = tenant
+        self.http_session = http_session
+        self.owns_logging = configure_logging
+        with startup.phase("config"):
+            self.config = Config(config_path)
+            if tenant:
+                self._apply_tenant_defaults(self.config)
+        with startup.phase("logging"):
+            if self.owns_logging:
+                self._configure_logging()
+            self.logger = Logger(f"sync.{tenant}" if tenant else "sync")
         
         # Initialize services
         self.sql_service = None
         self.fb_service = None
         self.api_service = None
         
-        self._initialize_services()
+        with startup.phase("state"):
+            self.state = SyncState(self.config.get("sync.state_folder", "state"))
+            self.key_sets = KeySetStore(self.config.get("sync.state_folder", "state"))
+            self.queries = QueryCatalog(os.path.join(self.config.get("sync.state_folder", "state"), "query_index.json"))
+        self._last_attempt: Dict[str, float] = {}  # table -> time.monotonic() of the last run, for due checks
+        self.prometheus = SyncMetrics(labels={"tenant": tenant} if tenant else None)
+        self.profiler = None  # Set by enable_profiling(); None keeps the sync loop free of profiling overhead
+        self._run_lock = None  # The RunLock held by the current run
+        # Called with progress events (dictionaries with an "event" name) during run_sync(), e.g. by the GUI
+        self.progress: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._progress_table: Optional[Dict[str, Any]] = None
+        self._rejects: Optional[Dict[str, Any]] = None  # dead-letter file of the table being uploaded
+        self._throttle_levels: Optional[Dict[str, ThrottleLevel]] = None  # sync.throttle levels, built on first use
+        # Process-wide level shared by all tenants of a TenantHost, replaces this configuration's own
+        self.global_throttle: Optional[ThrottleLevel] = None
+        
+        with startup.phase("services"):
+            self._initialize_services()
+    
+    # Per-tenant replacements for paths that are left at their default in a tenant configuration
+    TENANT_DEFAULTS = {
+        "sync.state_folder": ("state", os.path.join("state", "{tenant}")),
+        "sync.dry_run_folder": ("dry-run-output", os.path.join("dry-run-output", "{tenant}")),
+        "sync.dead_letter_folder": ("dead-letter", os.path.join("dead-letter", "{tenant}")),
+        "sync.sink_folder": ("sink-output", os.path.join("sink-output", "{tenant}")),
+        "metrics.textfile": ("logs/taskform_sync.prom", "logs/taskform_sync_{tenant}.prom"),
+    }
+    
+    def _apply_tenant_defaults(self, config: Config) -> None:
+        """Give each tenant its own state, output and dead-letter folders and metrics textfile unless its configuration sets them."""
+        for field, (default, tenant_default) in self.TENANT_DEFAULTS.items():
+            if config.get(field, default) == default:
+                config.set(field, tenant_default.format(tenant=self.tenant))
+    
+    def _configure_logging(self):
+        """Apply the logging settings from the sync section of the configuration."""
+        sync_config = self.config.get_sync_config()
+        configure_logging(
+            level=sync_config.get("log_level", "INFO"),
+            log_format=sync_config.get("log_format", "text"),
+            max_bytes=int(float(sync_config.get("log_max_mb", 10)) * 1024 * 1024),
+            backup_count=sync_config.get("log_backup_count", 5),
+            rate_limit_seconds=sync_config.get("log_rate_limit_seconds", 0)
+        )
     
     def _initialize_services(self):
         """Initialize database and API services based on configuration."""
-        # Initialize SQL Server if enabled
-        if self.config.is_sql_server_enabled():
-            sql_config = self.config.get_sql_server_config()
+        self.sql_service = self._create_sql_service(self.config)
+        self.fb_service = self._create_fb_service(self.config)
+        self.api_service = self._create_api_service(self.config)
+    
+    def _create_sql_service(self, config: Config) -> Optional["SQLServerService"]:
+        """Create the SQL Server service if it is enabled and configured."""
+        if config.is_sql_server_enabled():
+            sql_config = config.get_sql_server_config()
             if sql_config.get("connection_string"):
-                self.sql_service = SQLServerService(sql_config["connection_string"])
+                from services.sqlserver_service import SQLServerService
+
                 self.logger.info("SQL Server service initialized")
-        
-        # Initialize Firebird if enabled
-        if self.config.is_firebird_enabled():
-            fb_config = self.config.get_firebird_config()
+                return SQLServerService(sql_config["connection_string"])
+        return None
+    
+    def _create_fb_service(self, config: Config) -> Optional["FirebirdService"]:
+        """Create the Firebird service if it is enabled and configured."""
+        if config.is_firebird_enabled():
+            fb_config = config.get_firebird_config()
             if all([fb_config.get("database_path"), fb_config.get("username"), fb_config.get("password")]):
-                self.fb_service = FirebirdService(
+                from services.firebird_service import FirebirdService
+
+                self.logger.info("Firebird service initialized")
+                return FirebirdService(
                     fb_config["database_path"],
                     fb_config["username"],
                     fb_config["password"],
-                    charset=fb_config.get("charset")
+                    charset=fb_config.get("charset"),
+                    blob_max_mb=fb_config.get("blob_max_mb", 16)
                 )
-                self.logger.info("Firebird service initialized")
-        
-        # Initialize API service
-        api_config = self.config.get_api_config()
-        sync_config = self.config.get_sync_config()
+        return None
+    
+    def _create_api_service(self, config: Config) -> "APIService":
+        """Create the API service, raising if the API configuration is incomplete."""
+        api_config = config.get_api_config()
+        sync_config = config.get_sync_config()
         dry_run = sync_config.get("dry_run", False)
         batch_size = sync_config.get("batch_size", 500)  # Default 500 records per batch
         
         if all([api_config.get("base_url"), api_config.get("api_key"), api_config.get("tenant_id")]):
-            self.api_service = APIService(
+            from services.api_service import APIService
+            
+            service = APIService(
                 api_config["base_url"],
                 api_config["api_key"],
                 api_config["tenant_id"],
                 dry_run=dry_run,
-                batch_size=batch_size
+                batch_size=batch_size,
+                compress=api_config.get("compress", False),
+                session=self.http_session,
+                dry_run_format=sync_config.get("dry_run_format", "json"),
+                dry_run_folder=sync_config.get("dry_run_folder", "dry-run-output")
             )
+            service.on_chunk = self._on_chunk_sent
+            service.on_rejected = lambda table_name, record, reason: self._reject_record(table_name, record, reason, "api")
             self.logger.info(f"API service initialized (batch_size: {batch_size})")
+            return service
         else:
             raise Exception("API configuration is incomplete")
     
@@ -107,25 +220,138 @@ class SyncService:
         else:
             self.logger.info("Using default alphabetical query order")
 
+        self.refresh_query_settings(ordered_files)
         return ordered_files
     
+    def refresh_query_settings(self, query_files: List[str]) -> None:
+        """Re-parse the header of changed query files and report invalid settings."""
+        try:
+            for settings in self.queries.refresh(query_files):
+                for error in settings.errors:
+                    self.logger.warning(f"Ignoring header setting in {settings.table_name}.sql: {error}")
+        except Exception as e:
+            self.logger.error("Failed to read query file headers", e)
+    
+    def get_query_settings(self, table_name: str) -> QuerySettings:
+        """Return the settings from the header of a table's query file."""
+        return self.queries.for_table(table_name)
+    
     def get_table_name_from_file(self, file_path: str) -> str:
         """Extract table name from SQL file name."""
         file_name = os.path.basename(file_path)
         table_name = os.path.splitext(file_name)[0]
         return table_name
     
-    def execute_query_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def get_partition_settings(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Return key-range partition settings for a table, or None to run the query unpartitioned.
+        
+        Declared in the query header (-- @partitions: 4, -- @partition_key: parent-id,
+        -- @partition_bounds: production_orders.objectid) or configured in sync.partitions,
+        e.g. {"production-orders": {"key": "parent-id", "count": 4, "bounds": "production_orders.objectid"}}.
+        """
+        header = self.get_query_settings(table_name)
+        partitions = self.config.get("sync.partitions", {})
+        settings = partitions.get(table_name) if isinstance(partitions, dict) else None
+        if not isinstance(settings, dict):
+            settings = {}
+        count = header.partitions if header.partitions is not None else int(settings.get("count", 1))
+        if count < 2:
+            return None
+        return {"key": header.partition_key or settings.get("key", "parent-id"), "count": count,
+                "bounds": header.partition_bounds or settings.get("bounds")}
+    
+    def get_query_params(self, table_name: str) -> Dict[str, Any]:
+        """
+        Return the named parameters available to a query file.
+        
+        Built in: :tenant (api.tenant_id), :since (start of the last successful sync of
+        the table, 1900-01-01 before the first) and :range_lo/:range_hi (the full key
+        range unless the query is partitioned). Extra values come from sync.query_params,
+        either global ({"site": "NL01"}) or per table ({"boms": {"site": "NL01"}}).
+        """
+        last_success = self.state.last_success(table_name)
+        params: Dict[str, Any] = {
+            "tenant": self.config.get("api.tenant_id", ""),
+            "since": datetime.fromtimestamp(last_success) if last_success else datetime(1900, 1, 1),
+            "range_lo": -2 ** 63,
+            "range_hi": 2 ** 63 - 1,
+        }
+        configured = self.config.get("sync.query_params", {})
+        if isinstance(configured, dict):
+            params.update({name: value for name, value in configured.items() if not isinstance(value, dict)})
+            table_params = configured.get(table_name)
+            if isinstance(table_params, dict):
+                params.update(table_params)
+        return params
+    
+    def _execute_on_service(self, service, file_path: str, metrics: Optional[TableMetrics] = None,
+                            stream: bool = False) -> Iterable[Dict[str, Any]]:
+        """
+        Execute a query file on one database service, partitioned if configured.
+        
+        With stream=True the query returns an iterator instead of a list: an unpartitioned
+        query fetches rows in batches, a partitioned one yields each key range as it is
+        done (the query is already executed when this returns).
+        """
+        table_name = self.get_table_name_from_file(file_path)
+        params = self.get_query_params(table_name)
+        partition = self.get_partition_settings(table_name)
+        if not partition:
+            if stream and hasattr(service, "iter_query"):
+                self.logger.info(f"Streaming query from file: {file_path}")
+                return prime(service.iter_query(read_sql_file(file_path), metrics, params))
+            return service.execute_query_from_file(file_path, metrics, params)
+        
+        sql = read_sql_file(file_path)
+        rows = fetch_partitioned(service, sql, partition["key"], partition["count"], metrics, self.logger, params,
+                                 partition["bounds"])
+        return prime(rows) if stream else list(rows)
+    
+    def get_query_source(self, table_name: str) -> str:
+        """
+        Return the declared source for a table.
+        
+        Declared in the query header (-- @source: firebird) or configured in
+        sync.query_sources, e.g. {"boms": "firebird", "customers": "both"},
+        with sync.default_source (default "auto") for undeclared tables.
+        """
+        sources = self.config.get("sync.query_sources", {})
+        source = self.get_query_settings(table_name).source
+        if not source:
+            source = sources.get(table_name) if isinstance(sources, dict) else None
+        source = str(source or self.config.get("sync.default_source", "auto")).lower()
+        if source not in self.QUERY_SOURCES:
+            self.logger.warning(f"Unknown query source '{source}' for {table_name}, using auto")
+            return "auto"
+        return source
+    
+    def _get_source_service(self, source: str):
+        """Return the service for 'sql_server' or 'firebird', raising if it is not enabled."""
+        service = self.sql_service if source == "sql_server" else self.fb_service
+        if service is None:
+            raise Exception(f"Query source '{source}' is not enabled or not configured")
+        return service
+    
+    def execute_query_file(self, file_path: str, metrics: Optional[TableMetrics] = None,
+                           stream: bool = False) -> Iterable[Dict[str, Any]]:
         """
-        Execute query file on enabled database(s).
-        Returns results from the first available database.
+        Execute query file on its declared database.
+        For source "auto", returns results from the first available database.
+        See _execute_on_service() for stream.
         """
+        source = self.get_query_source(self.get_table_name_from_file(file_path))
+        if source in ("sql_server", "firebird"):
+            return self._execute_on_service(self._get_source_service(source), file_path, metrics, stream)
+        if source == "both":
+            raise Exception(f"{file_path} is declared for both sources, use extract_records()")
+        
         results = []
         
         # Try SQL Server first if enabled
         if self.sql_service:
             try:
-                results = self.sql_service.execute_query_from_file(file_path)
+                results = self._execute_on_service(self.sql_service, file_path, metrics, stream)
                 return results
             except Exception as e:
                 self.logger.error(f"SQL Server query failed for {file_path}", e)
@@ -133,7 +359,7 @@ class SyncService:
         # Try Firebird if enabled and SQL Server didn't work
         if self.fb_service:
             try:
-                results = self.fb_service.execute_query_from_file(file_path)
+                results = self._execute_on_service(self.fb_service, file_path, metrics, stream)
                 return results
             except Exception as e:
                 self.logger.error(f"Firebird query failed for {file_path}", e)
@@ -144,38 +370,218 @@ class SyncService:
         
         return results
     
-    def sync_single_query(self, query_file: str) -> bool:
+    def preview_query_file(self, file_path: str, limit: int = 100) -> Dict[str, Any]:
+        """
+        Run a query file capped at limit rows on its declared source (the first enabled
+        one for auto and both) and return the preview of utils.preview.preview_query().
+        """
+        from utils.preview import preview_query
+        
+        table_name = self.get_table_name_from_file(file_path)
+        self.queries.get(file_path)
+        source = self.get_query_source(table_name)
+        if source in ("sql_server", "firebird"):
+            service = self._get_source_service(source)
+        else:
+            service = self.sql_service or self.fb_service
+            if service is None:
+                raise Exception("No database is enabled and configured")
+        preview = preview_query(service, read_sql_file(file_path), limit, self.get_query_params(table_name),
+                                nest=self.get_query_settings(table_name).nest != "none")
+        preview["source"] = "sql_server" if service is self.sql_service else "firebird"
+        return preview
+    
+    def get_sink_name(self, table_name: str) -> str:
+        """
+        Return the sink of a table: the -- @initial_sink header until the table synced
+        successfully once, then the -- @sink header, sync.query_sinks or sync.default_sink.
+        """
+        from services.sinks import SINKS
+        
+        settings = self.get_query_settings(table_name)
+        sink = None
+        if settings.initial_sink and self.state.last_success(table_name) is None:
+            sink = settings.initial_sink
+        sink = sink or settings.sink or self.config.get("sync.query_sinks", {}).get(table_name) \
+            or self.config.get("sync.default_sink", "rest")
+        sink = str(sink).lower()
+        if sink not in SINKS:
+            self.logger.warning(f"Unknown sink '{sink}' for {table_name}, using rest")
+            return "rest"
+        return sink
+    
+    def get_sink(self, table_name: str, metrics: Optional[TableMetrics] = None):
+        """Create the sink a table's records are written to (see get_sink_name)."""
+        from services.sinks import create_sink
+        
+        name = self.get_sink_name(table_name)
+        if metrics is not None:
+            metrics.sink = name
+        return create_sink(name, self.api_service, self.config.get_sync_config(), self.config.get_api_config())
+    
+    def get_memory_budget(self, table_name: str) -> int:
+        """Return the transform memory budget of a table in bytes (0 = unlimited)."""
+        budget = self.get_query_settings(table_name).memory_budget
+        if budget is None:
+            budget = int(float(self.config.get("sync.memory_budget_mb", 0) or 0) * 1024 * 1024)
+        return max(0, budget)
+    
+    def _get_spill_folder(self) -> str:
+        return self.config.get("sync.spill_folder") or os.path.join(self.config.get("sync.state_folder", "state"), "spill")
+    
+    def extract_records(self, query_file: str, metrics: Optional[TableMetrics] = None) -> Tuple[int, Iterable[Dict[str, Any]]]:
+        """
+        Execute a query file and nest its rows.
+        
+        With a memory budget (sync.memory_budget_mb or -- @memory_budget) the rows are
+        streamed from the database and nested within the budget, spilling to disk when
+        needed. The records are then returned as a RecordStream, which is only read
+        while uploading; its row_count is complete afterwards and the returned count is 0.
+        
+        Returns:
+            Tuple of (number of rows extracted, nested records)
+        """
+        table_name = self.get_table_name_from_file(query_file)
+        if self.get_query_source(table_name) == "both":
+            return self._extract_from_both_sources(query_file, metrics)
+        
+        budget = self.get_memory_budget(table_name)
+        if budget:
+            rows = self.execute_query_file(query_file, metrics, stream=True)
+            if self.get_query_settings(table_name).nest == "none":
+                return 0, RecordStream(iter(rows))
+            return 0, nest_within_budget(rows, budget, self._get_spill_folder(), metrics)
+        
+        data = self.execute_query_file(query_file, metrics)
+        if self.get_query_settings(table_name).nest == "none":
+            return len(data), data
+        
+        # Auto-nest data if query uses dot notation (e.g., lines.sku, lines.steps.name)
+        # Queries with 'parent-id' column will be automatically nested
+        with timed(metrics, "nest"):
+            nested_data = auto_nest_data(data)
+        return len(data), nested_data
+    
+    def _extract_from_both_sources(self, query_file: str, metrics: Optional[TableMetrics] = None) -> Tuple[int, RecordStream]:
+        """
+        Run a query file on SQL Server and Firebird concurrently and merge the results.
+        
+        Both queries are executed up front, so a failing source fails the table before
+        anything is uploaded. The rows are then streamed: each source is nested on its own
+        within the memory budget and the records are deduplicated on their key while they
+        are uploaded, SQL Server first and taking priority. Only the seen keys are kept.
+        """
+        services = [("sql_server", self._get_source_service("sql_server")),
+                    ("firebird", self._get_source_service("firebird"))]
+        source_metrics = [TableMetrics(name) for name, _ in services]
+        table_name = self.get_table_name_from_file(query_file)
+        settings = self.get_query_settings(table_name)
+        budget = self.get_memory_budget(table_name)
+        
+        from concurrent.futures import ThreadPoolExecutor
+        
+        with ThreadPoolExecutor(max_workers=len(services), thread_name_prefix="source") as executor:
+            futures = [executor.submit(self._execute_on_service, service, query_file, service_metrics, True)
+                       for (_, service), service_metrics in zip(services, source_metrics)]
+            extracted = [future.result() for future in futures]
+        
+        if metrics is not None:
+            metrics.columns = next((m.columns for m in source_metrics if m.columns is not None), None)
+        if settings.nest == "none":
+            streams = [RecordStream(iter(rows)) for rows in extracted]
+        else:
+            streams = [nest_within_budget(rows, budget, self._get_spill_folder(), metrics) for rows in extracted]
+        
+        def merged() -> Iterator[Dict[str, Any]]:
+            try:
+                yield from merge_records(streams, settings.key or "external_id")
+            finally:
+                if metrics is not None:
+                    for service_metrics in source_metrics:
+                        for stage, seconds in service_metrics.stages.items():
+                            metrics.add_time(stage, seconds)
+            counts = ", ".join(f"{name}: {stream.record_count}" for (name, _), stream in zip(services, streams))
+            self.logger.info(f"Merged records from both sources ({counts}) into {records.record_count} unique records")
+        
+        records = MergedRecordStream(merged(), streams)
+        return 0, records
+    
+    def sync_single_query(self, query_file: str, metrics: Optional[TableMetrics] = None) -> bool:
         """
         Sync a single query file.
         
         Args:
             query_file: Path to SQL query file
+            metrics: Optional table metrics to record stage timings into
         
         Returns:
             True if successful, False otherwise
         """
+        throttles: List[Throttle] = []
         try:
             table_name = self.get_table_name_from_file(query_file)
             self.logger.info(f"Processing query file: {query_file} -> table: {table_name}")
+            throttles = self._install_throttles(table_name)
             
-            # Execute query
-            data = self.execute_query_file(query_file)
+            # Execute query and nest rows
+            row_count, nested_data = self.extract_records(query_file, metrics)
+            if isinstance(nested_data, RecordStream):
+                return self._sync_stream(table_name, nested_data, metrics)
+            if metrics is not None:
+                metrics.rows_extracted = row_count
             
-            if not data:
+            if not row_count:
                 self.logger.warning(f"No data returned for {table_name}")
                 return True
             
-            # Auto-nest data if query uses dot notation (e.g., lines.sku, lines.steps.name)
-            # Queries with 'parent-id' column will be automatically nested
-            nested_data = auto_nest_data(data)
+            self._emit("table_extracted", table=table_name, rows=row_count, records=len(nested_data))
             
             # Log transformation if nesting occurred
-            if len(nested_data) != len(data):
-                self.logger.info(f"Nested {len(data)} rows into {len(nested_data)} parent records")
+            if len(nested_data) != row_count:
+                self.logger.info(f"Nested {row_count} rows into {len(nested_data)} parent records")
             
             # Upload to API
             if self.api_service:
-                self.api_service.bulk_upsert(table_name, nested_data)
+                settings = self.get_query_settings(table_name)
+                key_field = settings.key or "external_id"
+                snapshot = self._patch_snapshot(table_name, key_field)
+                self._open_rejects(table_name, metrics, snapshot)
+                try:
+                    records = nested_data
+                    if self.is_validation_enabled(table_name):
+                        with timed(metrics, "validate"):
+                            records = list(filter_valid(records, self._record_validator(key_field),
+                                                        self._rejected_by_validation(table_name)))
+                    minimize = self.get_minimize_mode(table_name)
+                    if minimize != "none":
+                        with timed(metrics, "minimize"):
+                            records = list(minimize_records(records, minimize, key_field))
+                    chunking = self._key_chunking(table_name, key_field)
+                    if chunking is not None or snapshot is not None:
+                        with timed(metrics, "sort"):
+                            records.sort(key=lambda record: key_sort_token(record, key_field))
+                    # Patches are computed while they are uploaded, not collected first
+                    upload = records if snapshot is None else snapshot.patch_all(records)
+                    self.get_sink(table_name, metrics).upsert(table_name, upload, key_field, metrics=metrics,
+                                                              batch_size=settings.batch_size,
+                                                              batch_bytes=settings.batch_bytes,
+                                                              operation="upsert" if snapshot is None else "patch",
+                                                              chunking=chunking)
+                except Exception:
+                    if snapshot is not None:
+                        snapshot.discard()
+                    raise
+                finally:
+                    self._close_rejects()
+                if snapshot is not None:
+                    self._save_patch_snapshot(snapshot, metrics)
+                self._save_chunk_digests(chunking, metrics)
+                writer = self._replay_writer(table_name, key_field)
+                if writer is not None:
+                    self._commit_replay(writer, records)
+                if self.is_deletion_detection_enabled(table_name):
+                    # All extracted keys, so a rejected record is not deleted from the API
+                    self.detect_and_delete(table_name, nested_data, metrics, key_field)
                 return True
             else:
                 self.logger.error("API service not initialized")
@@ -183,15 +589,453 @@ class SyncService:
                 
         except Exception as e:
             self.logger.error(f"Failed to sync {query_file}", e)
+            if metrics is not None:
+                metrics.error = str(e)
             return False
+        finally:
+            self._remove_throttles(throttles, metrics)
+    
+    def _install_throttles(self, table_name: str) -> List[Throttle]:
+        """Give the database and API services the rate limits (sync.throttle) that apply to table_name."""
+        settings = self.config.get("sync.throttle") or {}
+        if not settings and self.global_throttle is None:
+            return []
+        if self._throttle_levels is None:
+            # Built once, so the global and per-source buckets carry over from table to table
+            levels = {"": ThrottleLevel("global", settings)}
+            for source, source_settings in (settings.get("sources") or {}).items():
+                levels[source] = ThrottleLevel(source, source_settings)
+            self._throttle_levels = levels
+        table_settings = (settings.get("tables") or {}).get(table_name)
+        table_level = ThrottleLevel(table_name, table_settings) if table_settings else None
+        throttles = []
+        for source, service in (("sql_server", self.sql_service), ("firebird", self.fb_service),
+                                ("api", self.api_service)):
+            if service is None:
+                continue
+            global_level = self.global_throttle if self.global_throttle is not None else self._throttle_levels[""]
+            service.throttle = create_throttle([global_level, self._throttle_levels.get(source),
+                                                table_level])
+            if service.throttle is not None:
+                throttles.append(service.throttle)
+        return throttles
+    
+    def _remove_throttles(self, throttles: List[Throttle], metrics: Optional[TableMetrics] = None) -> None:
+        """Take the table's rate limits off the services and report the time spent waiting for them."""
+        if not throttles:
+            return
+        for service in (self.sql_service, self.fb_service, self.api_service):
+            if service is not None:
+                service.throttle = None
+        waited = sum(throttle.waited_seconds for throttle in throttles)
+        if metrics is not None and waited:
+            metrics.add_time("throttle", waited)
+    
+    def _sync_stream(self, table_name: str, records: RecordStream, metrics: Optional[TableMetrics] = None) -> bool:
+        """Upload a memory-bounded record stream, collecting only the keys for deletion detection."""
+        if not self.api_service:
+            self.logger.error("API service not initialized")
+            return False
+        
+        settings = self.get_query_settings(table_name)
+        key_field = settings.key or "external_id"
+        tokens: Optional[List[str]] = [] if self.is_deletion_detection_enabled(table_name) else None
+        
+        def collect_keys(stream: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            for record in stream:
+                tokens.append(key_token(record, key_field))
+                yield record
+        
+        stream = records if tokens is None else collect_keys(records)
+        if self.is_validation_enabled(table_name):
+            stream = filter_valid(stream, self._record_validator(key_field),
+                                  self._rejected_by_validation(table_name))
+        stream = minimize_records(stream, self.get_minimize_mode(table_name), key_field)
+        chunking = self._key_chunking(table_name, key_field)
+        snapshot = self._patch_snapshot(table_name, key_field)
+        if chunking is not None or snapshot is not None:
+            stream = sort_within_budget(stream, lambda record: key_sort_token(record, key_field),
+                                        self.get_memory_budget(table_name), self._get_spill_folder(), metrics)
+        writer = self._replay_writer(table_name, key_field)
+        if writer is not None:
+            stream = writer.tee(stream)
+        upload = stream if snapshot is None else snapshot.patch_all(stream)
+        self._open_rejects(table_name, metrics, snapshot)
+        try:
+            self.get_sink(table_name, metrics).upsert(table_name, upload, key_field, metrics=metrics,
+                                                      batch_size=settings.batch_size,
+                                                      batch_bytes=settings.batch_bytes,
+                                                      operation="upsert" if snapshot is None else "patch",
+                                                      chunking=chunking)
+        except Exception:
+            if writer is not None:
+                writer.abort()
+            if snapshot is not None:
+                snapshot.discard()
+            raise
+        finally:
+            self._close_rejects()
+        if writer is not None:
+            self._commit_replay(writer)
+        if snapshot is not None:
+            self._save_patch_snapshot(snapshot, metrics)
+        self._save_chunk_digests(chunking, metrics)
+        if metrics is not None:
+            metrics.rows_extracted = records.row_count
+        
+        if not records.row_count:
+            self.logger.warning(f"No data returned for {table_name}")
+            return True
+        if records.record_count != records.row_count:
+            self.logger.info(f"Nested {records.row_count} rows into {records.record_count} parent records")
+        if metrics is not None and metrics.spill_runs:
+            self.logger.info(f"Nesting {table_name} spilled {metrics.spill_runs} run(s), "
+                             f"{metrics.spilled_bytes} bytes, to stay within the memory budget")
+        if tokens is not None:
+            self.detect_and_delete(table_name, None, metrics, key_field, tokens=tokens)
+        return True
     
-    def run_sync(self) -> Dict[str, Any]:
+    def get_minimize_mode(self, table_name: str) -> str:
+        """The query header (-- @minimize) wins over sync.minimize_payload (a mode or a table -> mode mapping)."""
+        mode = self.get_query_settings(table_name).minimize
+        if mode is None:
+            setting = self.config.get("sync.minimize_payload", "none")
+            mode = setting.get(table_name, "none") if isinstance(setting, dict) else setting
+        mode = str(mode or "none").lower()
+        if mode not in MINIMIZE_MODES:
+            self.logger.warning(f"Unknown minimize mode '{mode}' for {table_name}, sending all fields")
+            return "none"
+        return mode
+    
+    def is_patch_enabled(self, table_name: str) -> bool:
+        """The query header (-- @patch: true) wins over sync.patch_updates (boolean or list of tables)."""
+        header = self.get_query_settings(table_name).patch
+        if header is not None:
+            return header
+        setting = self.config.get("sync.patch_updates", False)
+        if isinstance(setting, list):
+            return table_name in setting
+        return bool(setting)
+    
+    def _patch_snapshot(self, table_name: str, key_field: str):
+        """Return the table's patch snapshot, or None if patch updates are off."""
+        if not self.is_patch_enabled(table_name):
+            return None
+        return PatchSnapshot(self.config.get("sync.state_folder", "state"), table_name, key_field)
+    
+    def _save_patch_snapshot(self, snapshot, metrics: Optional[TableMetrics] = None) -> None:
+        """Store the snapshot of an uploaded table; a dry run keeps the previous one."""
+        self.logger.info(f"Patch upload: {snapshot.new} new, {snapshot.patched} changed, "
+                         f"{snapshot.unchanged} unchanged records")
+        if snapshot.damaged:
+            self.logger.warning(f"The patch snapshot {snapshot.path} was damaged, "
+                                f"the records it could not compare were sent whole")
+        if metrics is not None:
+            metrics.records_unchanged += snapshot.unchanged
+        if self.api_service.dry_run:
+            snapshot.discard()
+        else:
+            snapshot.save()
+    
+    def is_key_order_enabled(self, table_name: str) -> bool:
+        """The query header (-- @sort_by_key) wins over sync.sort_by_key (boolean or list of tables)."""
+        header = self.get_query_settings(table_name).sort_by_key
+        if header is not None:
+            return header
+        setting = self.config.get("sync.sort_by_key", False)
+        if isinstance(setting, list):
+            return table_name in setting
+        return bool(setting)
+    
+    def is_chunk_digest_enabled(self, table_name: str) -> bool:
+        """The query header (-- @chunk_digests) wins over sync.chunk_digests (boolean or list of tables)."""
+        header = self.get_query_settings(table_name).chunk_digests
+        if header is not None:
+            return header
+        setting = self.config.get("sync.chunk_digests", False)
+        if isinstance(setting, list):
+            return table_name in setting
+        return bool(setting)
+    
+    def _key_chunking(self, table_name: str, key_field: str) -> Optional[KeyChunking]:
+        """Return the key-ordered chunking of a table, or None; chunk digests imply key order."""
+        digests = None
+        if self.is_chunk_digest_enabled(table_name):
+            refresh_hours = float(self.config.get("sync.chunk_digest_refresh_hours", 24) or 0)
+            digests = ChunkDigests(self.config.get("sync.state_folder", "state"), table_name,
+                                   refresh_seconds=refresh_hours * 3600)
+        elif not self.is_key_order_enabled(table_name):
+            return None
+        return KeyChunking(key_field, digests)
+    
+    def _save_chunk_digests(self, chunking: Optional[KeyChunking], metrics: Optional[TableMetrics] = None) -> None:
+        """Store the chunk digests of an uploaded table; a dry run keeps the previous ones."""
+        digests = chunking.digests if chunking is not None else None
+        if digests is None:
+            return
+        if digests.skipped_chunks:
+            self.logger.info(f"Skipped {digests.skipped_chunks} unchanged chunk(s), {digests.skipped_records} records")
+        if metrics is not None:
+            metrics.chunks_skipped = digests.skipped_chunks
+            metrics.records_unchanged += digests.skipped_records
+        if not self.api_service.dry_run:
+            digests.save()
+    
+    def is_validation_enabled(self, table_name: str) -> bool:
+        """The query header (-- @validate) wins over sync.validate_records (boolean or list of tables)."""
+        header = self.get_query_settings(table_name).validate
+        if header is not None:
+            return header
+        setting = self.config.get("sync.validate_records", False)
+        if isinstance(setting, list):
+            return table_name in setting
+        return bool(setting)
+    
+    def _record_validator(self, key_field: str) -> RecordValidator:
+        return RecordValidator(key_field, int(self.config.get("sync.max_text_length", 0) or 0))
+    
+    def _rejected_by_validation(self, table_name: str) -> Callable[[Dict[str, Any], str], None]:
+        return lambda record, reason: self._reject_record(table_name, record, reason, "validate")
+    
+    def _open_rejects(self, table_name: str, metrics: Optional[TableMetrics], snapshot) -> None:
+        """Start the dead-letter file of the table that is about to be uploaded."""
+        from utils.dead_letter import DeadLetterFile
+        
+        dead_letters = DeadLetterFile(self.config.get("sync.dead_letter_folder") or "dead-letter", table_name,
+                                      limit=self.config.get("sync.max_dead_letters", 100))
+        self._rejects = {"table": table_name, "file": dead_letters, "metrics": metrics, "snapshot": snapshot}
+    
+    def _close_rejects(self) -> None:
+        current, self._rejects = self._rejects, None
+        if current is None:
+            return
+        current["file"].close()
+        if current["file"].count:
+            self.logger.warning(f"{current['file'].count} record(s) of {current['table']} were rejected "
+                                f"and written to {current['file'].path}")
+    
+    def _reject_record(self, table_name: str, record: Dict[str, Any], reason: str, stage: str) -> None:
+        """Set a record that failed validation or was rejected by the API aside in the dead-letter file."""
+        current = self._rejects
+        if current is None or current["table"] != table_name:
+            raise Exception(f"Record of {table_name} rejected: {reason}")
+        self.logger.debug(f"Rejected a record of {table_name} ({stage}): {reason}")
+        if current["metrics"] is not None:
+            current["metrics"].records_rejected += 1
+        if current["snapshot"] is not None:
+            current["snapshot"].forget(record)
+        current["file"].add(record, reason, stage)
+    
+    def is_replay_cache_enabled(self, table_name: str) -> bool:
+        """sync.replay_cache keeps the last uploaded extract for --replay (boolean or list of tables)."""
+        setting = self.config.get("sync.replay_cache", False)
+        if isinstance(setting, list):
+            return table_name in setting
+        return bool(setting)
+    
+    def get_replay_cache(self):
+        from utils.replay import ReplayCache
+        
+        return ReplayCache(os.path.join(self.config.get("sync.state_folder", "state"), "replay"))
+    
+    def _replay_writer(self, table_name: str, key_field: str):
+        """Return a replay cache writer for the table, or None if caching is off or fails to start."""
+        if not self.is_replay_cache_enabled(table_name):
+            return None
+        try:
+            return self.get_replay_cache().writer(table_name, key_field)
+        except Exception as e:
+            self.logger.error(f"Could not start the replay cache of {table_name}", e)
+            return None
+    
+    def _commit_replay(self, writer, records: Optional[Iterable[Dict[str, Any]]] = None) -> None:
+        """Finish a replay cache generation; a failing cache never fails the sync."""
+        try:
+            if records is not None:
+                for record in records:
+                    writer.add(record)
+            writer.commit()
+        except Exception as e:
+            writer.abort()
+            self.logger.error(f"Could not update the replay cache of {writer.table_name}", e)
+    
+    def replay(self, tables: Optional[List[str]] = None, keys: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Upload the cached extracts again without querying the databases (--replay).
+        
+        Args:
+            tables: Tables to replay (default: every cached table, in upload order)
+            keys: Only resend the records with these keys
+        
+        Returns:
+            Dictionary with the same counts as run_sync()
+        """
+        cache = self.get_replay_cache()
+        cached = cache.tables()
+        if tables is None:
+            ordered = [self.get_table_name_from_file(path) for path in self.get_query_files()]
+            tables = [table for table in ordered if table in cached] + [table for table in cached if table not in ordered]
+        
+        results = {"start_time": datetime.now(), "success_count": 0, "failed_count": 0,
+                   "skipped_count": 0, "failed_files": []}
+        run_metrics = RunMetrics()
+        self.logger.info(f"Replaying {len(tables)} table(s) from {cache.folder}"
+                         + (f" ({len(keys)} selected keys)" if keys is not None else ""))
+        for table_name in tables:
+            metrics = run_metrics.table(table_name)
+            try:
+                meta = cache.meta(table_name)
+                if meta is None:
+                    raise Exception("no replay cache, enable sync.replay_cache and run a sync first")
+                self.logger.info(f"Replaying {table_name}: {meta['records']} cached records from {meta['created']}")
+                settings = self.get_query_settings(table_name)
+                records = RecordStream(cache.iter_records(table_name, keys))
+                # Records the API rejects on their own go to the dead-letter file, as in a sync
+                self._open_rejects(table_name, metrics, None)
+                try:
+                    self.get_sink(table_name, metrics).upsert(table_name, records, meta["key_field"], metrics=metrics,
+                                                              batch_size=settings.batch_size,
+                                                              batch_bytes=settings.batch_bytes)
+                finally:
+                    self._close_rejects()
+                metrics.rows_extracted = records.record_count
+                success = True
+            except Exception as e:
+                self.logger.error(f"Failed to replay {table_name}", e)
+                metrics.error = str(e)
+                success = False
+            metrics.finish(success, metrics.error)
+            self._log_table_metrics(metrics)
+            if success:
+                results["success_count"] += 1
+            else:
+                results["failed_count"] += 1
+                results["failed_files"].append(table_name)
+        
+        run_metrics.finish()
+        report = run_metrics.to_dict()
+        report["mode"] = "replay"
+        report["success_count"] = results["success_count"]
+        report["failed_count"] = results["failed_count"]
+        results["report"] = report
+        try:
+            results["report_path"] = write_run_report(report, self.logger.log_folder, prefix="replay_report")
+        except Exception as e:
+            self.logger.error("Failed to write replay report", e)
+        return results
+    
+    def is_deletion_detection_enabled(self, table_name: str) -> bool:
+        """The query header (-- @detect_deletions: true) wins over sync.detect_deletions (boolean or list of tables)."""
+        header = self.get_query_settings(table_name).detect_deletions
+        if header is not None:
+            return header
+        setting = self.config.get("sync.detect_deletions", False)
+        if isinstance(setting, list):
+            return table_name in setting
+        return bool(setting)
+    
+    def detect_and_delete(self, table_name: str, records: Optional[List[Dict[str, Any]]],
+                          metrics: Optional[TableMetrics] = None, key_field: str = "external_id",
+                          tokens: Optional[List[Optional[str]]] = None) -> int:
+        """
+        Delete records that were present in the last successful run but are missing now.
+        
+        The keys of the current extract are sorted and diffed against the stored sorted
+        key file in one streaming pass; vanished keys are sent in batches to the bulk
+        delete (or soft_delete, see sync.delete_mode) operation. The key file is only
+        replaced after the deletes succeeded. Pass tokens (key_token() of each record)
+        instead of records when the records were streamed.
+        
+        Returns:
+            Number of records deleted
+        """
+        dry_run = self.api_service.dry_run
+        with timed(metrics, "deletion_diff"):
+            if tokens is None:
+                tokens = (key_token(record, key_field) for record in records)
+            current = sorted_unique(tokens)
+            if not self.key_sets.exists(table_name):
+                if not dry_run:
+                    self.key_sets.save(table_name, current)
+                self.logger.info(f"Stored {len(current)} keys for {table_name}, deletion detection starts next run")
+                return 0
+            previous_count = 0
+            
+            def count_previous(stored: Iterable[str]) -> Iterator[str]:
+                nonlocal previous_count
+                for token in stored:
+                    previous_count += 1
+                    yield token
+            
+            # diff_sorted reads the whole stored file, so previous_count is exact afterwards
+            vanished = list(diff_sorted(count_previous(self.key_sets.iter_keys(table_name)), current))
+        
+        if vanished:
+            max_fraction = float(self.config.get("sync.max_delete_fraction", 0.5))
+            if not previous_count or len(vanished) > max_fraction * previous_count:
+                raise Exception(
+                    f"Refusing to delete {len(vanished)} records from {table_name}: more than "
+                    f"{max_fraction:.0%} of the table vanished (check the query or raise sync.max_delete_fraction)"
+                )
+            
+            delete_mode = self.get_query_settings(table_name).delete_mode or self.config.get("sync.delete_mode", "delete")
+            soft = str(delete_mode).lower() == "soft_delete"
+            self.get_sink(table_name).delete(
+                table_name, [decode_token(token) for token in vanished], key_field, soft=soft, metrics=metrics
+            )
+            if metrics is not None:
+                metrics.records_deleted = len(vanished)
+        
+        # A dry run must not move the baseline of the next real run
+        if not dry_run:
+            self.key_sets.save(table_name, current)
+        return len(vanished)
+    
+    def get_table_interval(self, table_name: str) -> float:
+        """Return the sync interval of a table in seconds (-- @interval header or sync.interval_minutes)."""
+        interval = self.get_query_settings(table_name).interval_seconds
+        if interval is None:
+            interval = float(self.config.get("sync.interval_minutes", 30)) * 60
+        return max(1.0, interval)
+    
+    def seconds_until_due(self, table_name: str) -> float:
+        """Return how long until a table is due in daemon mode (0 if it is due now)."""
+        last_attempt = self._last_attempt.get(table_name)
+        if last_attempt is None:
+            return 0.0
+        return max(0.0, last_attempt + self.get_table_interval(table_name) - time.monotonic())
+    
+    def seconds_until_next_due(self) -> float:
+        """Return how long until the next table is due, at most sync.interval_minutes (the folder re-scan)."""
+        interval_seconds = max(1.0, float(self.config.get("sync.interval_minutes", 30)) * 60)
+        return min([interval_seconds] + [self.seconds_until_due(table) for table in self._last_attempt])
+    
+    def run_sync(self, due_only: bool = False) -> Dict[str, Any]:
         """
         Run full sync process.
         
+        Args:
+            due_only: Only sync tables whose interval elapsed since their last run (daemon mode)
+        
         Returns:
             Dictionary with sync results
         """
+        run = self.start_run(due_only)
+        try:
+            while self.run_next_table(run):
+                pass
+        except BaseException:
+            self._release_run_lock(run)
+            raise
+        return self.finish_run(run)
+    
+    def start_run(self, due_only: bool = False) -> Dict[str, Any]:
+        """
+        Start a sync run and return its run state for run_next_table() and finish_run().
+        
+        run_sync() runs all tables in one go; the multi-tenant host interleaves the
+        tables of several runs instead.
+        """
         start_time = datetime.now()
         self.logger.info("=" * 50)
         self.logger.info(f"Starting sync at {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -201,36 +1045,169 @@ class SyncService:
             "start_time": start_time,
             "success_count": 0,
             "failed_count": 0,
+            "skipped_count": 0,
             "failed_files": []
         }
+        run = {"results": results, "metrics": RunMetrics(), "query_files": [], "due_files": [],
+               "due_tables": [], "next": 0, "lock": None}
+        
+        lock = self._create_run_lock()
+        if lock is not None:
+            if not lock.acquire():
+                holder = lock.holder_at_skip or {}
+                self.logger.warning(f"Skipping this run: another run holds {lock.path} "
+                                    f"(PID {holder.get('pid')} on {holder.get('host')} since {holder.get('started')})")
+                lock.record_skip()
+                results["lock_skipped"] = True
+                run["lock"] = lock
+                return run
+            if lock.waited_seconds >= 1:
+                self.logger.info(f"Waited {lock.waited_seconds:.0f}s for the run lock")
+            run["lock"] = self._run_lock = lock
         
         # Get query files
         query_files = self.get_query_files()
         
         if not query_files:
             self.logger.warning("No query files found")
+            return run
+        
+        due_files = [query_file for query_file in query_files
+                     if not due_only or self.seconds_until_due(self.get_table_name_from_file(query_file)) <= 0]
+        results["skipped_count"] = len(query_files) - len(due_files)
+        due_tables = [self.get_table_name_from_file(query_file) for query_file in due_files]
+        run.update(query_files=query_files, due_files=due_files, due_tables=due_tables)
+        if due_tables:
+            self._emit("run_started", tables=due_tables, eta_seconds=self.estimate_seconds(due_tables))
+        return run
+    
+    def has_next_table(self, run: Dict[str, Any]) -> bool:
+        """Return whether the run still has tables to sync (none once its run lock was taken over)."""
+        lock = run.get("lock")
+        if lock is not None and lock.lost:
+            return False
+        return run["next"] < len(run["due_files"])
+    
+    def run_next_table(self, run: Dict[str, Any]) -> bool:
+        """Sync the next table of a run; returns False when no table was left."""
+        if not self.has_next_table(run):
+            return False
+        index = run["next"]
+        run["next"] += 1
+        query_file = run["due_files"][index]
+        due_tables = run["due_tables"]
+        results = run["results"]
+        
+        table_name = due_tables[index]
+        self._last_attempt[table_name] = time.monotonic()
+        table_metrics = run["metrics"].table(table_name)
+        table_started = datetime.now()
+        self._progress_table = {"table": table_name, "metrics": table_metrics, "chunks": 0,
+                                "records": 0, "remaining": due_tables[index + 1:]}
+        self._emit("table_started", table=table_name, index=index, total=len(due_tables),
+                   eta_seconds=self.estimate_seconds(due_tables[index:]))
+        if self.profiler is None:
+            success = self.sync_single_query(query_file, table_metrics)
+        else:
+            with self.profiler.profile(table_metrics.table_name):
+                success = self.sync_single_query(query_file, table_metrics)
+        table_metrics.finish(success, table_metrics.error)
+        self._progress_table = None
+        self._log_table_metrics(table_metrics)
+        if success:
+            # The start time, so the next :since also covers rows changed during this run
+            self.state.mark_success(table_metrics.table_name, table_started)
+            self.state.table(table_name)["last_duration_seconds"] = round(table_metrics.duration_seconds, 3)
+        self.prometheus.observe_table(table_metrics, self.state.last_success(table_metrics.table_name))
+        self._emit("table_finished", table=table_name, summary=table_metrics.to_dict(),
+                   eta_seconds=self.estimate_seconds(due_tables[index + 1:]))
+        
+        if success:
+            results["success_count"] += 1
+        else:
+            results["failed_count"] += 1
+            results["failed_files"].append(query_file)
+        return True
+    
+    def _create_run_lock(self):
+        """Return the run lock for sync.run_lock (skip, queue, kill_stale), or None if it is off."""
+        from utils.run_lock import LOCK_POLICIES, RunLock
+        
+        policy = str(self.config.get("sync.run_lock", "skip") or "off").lower()
+        if policy in ("off", "none", "false"):
+            return None
+        if policy not in LOCK_POLICIES:
+            self.logger.warning(f"Unknown sync.run_lock policy '{policy}', using skip")
+            policy = "skip"
+        return RunLock(self.config.get("sync.state_folder", "state"), policy,
+                       stale_seconds=float(self.config.get("sync.lock_stale_minutes", 120)) * 60,
+                       wait_seconds=float(self.config.get("sync.lock_wait_minutes", 60)) * 60,
+                       logger=self.logger)
+    
+    def _release_run_lock(self, run: Dict[str, Any]) -> None:
+        lock = run.get("lock")
+        if lock is not None:
+            lock.release()
+        if self._run_lock is lock:
+            self._run_lock = None
+    
+    @staticmethod
+    def _lock_report(lock) -> Dict[str, Any]:
+        """The lock section of a run report."""
+        report = {"policy": lock.policy, "wait_seconds": round(lock.waited_seconds, 3),
+                  "skipped_runs": lock.skipped_runs()}
+        if lock.lost:
+            report["lost"] = True
+        if lock.taken_over is not None:
+            report["taken_over"] = {name: lock.taken_over.get(name) for name in ("pid", "host", "started")}
+        return report
+    
+    def finish_run(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        """Log the summary of a run, write its report and metrics, release the run lock and return its results."""
+        try:
+            return self._finish_run(run)
+        finally:
+            self._release_run_lock(run)
+    
+    def _finish_run(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        results = run["results"]
+        run_metrics = run["metrics"]
+        if results.get("lock_skipped"):
+            run_metrics.finish()
+            report = run_metrics.to_dict()
+            if self.tenant:
+                report["tenant"] = self.tenant
+            report["skipped_by_lock"] = True
+            report["lock"] = self._lock_report(run["lock"])
+            report["lock"]["holder"] = {name: (run["lock"].holder_at_skip or {}).get(name)
+                                        for name in ("pid", "host", "started")}
+            results["report"] = report
+            try:
+                results["report_path"] = write_run_report(
+                    report, self.logger.log_folder, prefix=f"run_report_{self.tenant}" if self.tenant else "run_report")
+            except Exception as e:
+                self.logger.error("Failed to write run report", e)
+            return results
+        if not run["query_files"]:
             return results
         
-        # Process each query file
-        for query_file in query_files:
-            success = self.sync_single_query(query_file)
-            
-            if success:
-                results["success_count"] += 1
-            else:
-                results["failed_count"] += 1
-                results["failed_files"].append(query_file)
+        if not run_metrics.tables:
+            self.logger.info("No tables due yet")
+            return results
         
         # Log summary
+        start_time = results["start_time"]
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
         
         self.logger.info("=" * 50)
         self.logger.info(f"Sync completed at {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         self.logger.info(f"Duration: {duration:.2f} seconds")
-        self.logger.info(f"Total files: {len(query_files)}")
+        self.logger.info(f"Total files: {len(run['query_files'])}")
         self.logger.info(f"Successful: {results['success_count']}")
         self.logger.info(f"Failed: {results['failed_count']}")
+        if results["skipped_count"]:
+            self.logger.info(f"Not due yet: {results['skipped_count']}")
         
         if results["failed_files"]:
             self.logger.error(f"Failed files: {', '.join(results['failed_files'])}")
@@ -240,13 +1217,376 @@ class SyncService:
         results["end_time"] = end_time
         results["duration_seconds"] = duration
         
+        run_metrics.finish()
+        report = run_metrics.to_dict()
+        if self.tenant:
+            report["tenant"] = self.tenant
+        report["success_count"] = results["success_count"]
+        report["failed_count"] = results["failed_count"]
+        report["skipped_count"] = results["skipped_count"]
+        lock = run.get("lock")
+        if lock is not None:
+            report["lock"] = self._lock_report(lock)
+            if not lock.lost:
+                lock.reset_skipped_runs()
+        results["report"] = report
+        try:
+            results["report_path"] = write_run_report(report, self.logger.log_folder,
+                                                      prefix=f"run_report_{self.tenant}" if self.tenant else "run_report")
+            self.logger.info(f"Run report written to {results['report_path']}")
+        except Exception as e:
+            self.logger.error("Failed to write run report", e)
+        
+        self.prometheus.observe_run(results["failed_count"] == 0, end_time.timestamp(), duration)
+        self._export_metrics()
+        self._emit("run_finished", success_count=results["success_count"], failed_count=results["failed_count"],
+                   duration_seconds=duration)
+        
         return results
+    
+    def estimate_seconds(self, table_names: List[str]) -> Optional[float]:
+        """Estimate how long syncing table_names takes from their last successful durations (None if unknown)."""
+        durations = [self.state.data["tables"].get(name, {}).get("last_duration_seconds") for name in table_names]
+        known = [duration for duration in durations if duration is not None]
+        if not known and table_names:
+            return None
+        return float(sum(known))
+    
+    def _emit(self, event: str, **fields: Any) -> None:
+        """Send a progress event to the progress callback; callback errors never fail the sync."""
+        if self._run_lock is not None:
+            self._run_lock.heartbeat()  # every progress event shows the run is alive
+        if self.progress is None:
+            return
+        fields["event"] = event
+        try:
+            self.progress(fields)
+        except Exception as e:
+            self.logger.debug(f"Progress callback failed: {e}")
+    
+    def _on_chunk_sent(self, table_name: str, records: int, body_bytes: int) -> None:
+        """Report an uploaded chunk with the upload rate and the estimated time left for the run."""
+        lock = self._run_lock
+        if lock is not None:
+            lock.heartbeat()
+            if lock.lost:
+                from utils.run_lock import RunLockLost
+                
+                raise RunLockLost(f"Another run took over the run lock, stopped uploading {table_name}")
+        current = self._progress_table
+        if self.progress is None or current is None or current["table"] != table_name:
+            return
+        current["chunks"] += 1
+        current["records"] += records
+        elapsed = current["metrics"].elapsed()
+        remaining = self.estimate_seconds(current["remaining"])
+        last = self.state.data["tables"].get(table_name, {}).get("last_duration_seconds")
+        if last is None:
+            remaining = None
+        elif remaining is not None:
+            remaining += max(0.0, last - elapsed)
+        self._emit("chunk_sent", table=table_name, chunks=current["chunks"], records_uploaded=current["records"],
+                   bytes=body_bytes, records_per_second=current["records"] / elapsed if elapsed > 0 else 0.0,
+                   eta_seconds=remaining)
+    
+    def close(self) -> None:
+        """Close the pooled database connections and the HTTP session."""
+        for service in (self.sql_service, self.fb_service, self.api_service):
+            if service is not None:
+                service.close()
+    
+    def watched_paths(self) -> List[str]:
+        """The configuration file and the queries folder, watched for changes in daemon mode."""
+        return [self.config.config_path, self.config.get("sync.queries_folder", "queries")]
+    
+    def reload_config(self) -> bool:
+        """
+        Reload config.json and rebuild only the services whose settings changed.
+        
+        New services are created before anything is replaced, so an incomplete or
+        unreadable config keeps the running configuration. Unchanged services keep
+        their connection pools.
+        
+        Returns:
+            True if the new configuration was applied
+        """
+        try:
+            with open(self.config.config_path, 'r', encoding='utf-8') as f:
+                json.load(f)  # a half-written file would otherwise load as defaults
+            new_config = Config(self.config.config_path)
+            if self.tenant:
+                self._apply_tenant_defaults(new_config)
+            # Compare plaintext credentials, as the running config decrypted the ones it used
+            new_config.decrypt_all()
+            self.config.decrypt_all()
+        except Exception as e:
+            self.logger.error("Ignoring changed config.json, it could not be read", e)
+            return False
+        
+        def changed(*keys: str) -> bool:
+            return any(self.config.get(key) != new_config.get(key) for key in keys)
+        
+        replacements = {}
+        try:
+            if changed("sql_server"):
+                replacements["sql_service"] = self._create_sql_service(new_config)
+            if changed("firebird"):
+                replacements["fb_service"] = self._create_fb_service(new_config)
+            if changed("api", "sync.dry_run", "sync.dry_run_format", "sync.dry_run_folder", "sync.batch_size"):
+                replacements["api_service"] = self._create_api_service(new_config)
+        except Exception as e:
+            for service in replacements.values():
+                if service is not None:
+                    service.close()
+            self.logger.error("Ignoring changed config.json, services could not be created", e)
+            return False
+        
+        logging_changed = changed("sync.log_level", "sync.log_format", "sync.log_max_mb",
+                                  "sync.log_backup_count", "sync.log_rate_limit_seconds")
+        if changed("metrics.http_enabled", "metrics.http_host", "metrics.http_port"):
+            self.logger.warning("Metrics endpoint settings changed, restart the daemon to apply them")
+        if changed("sync.queries_folder"):
+            self.queries.invalidate()
+            invalidate_sql_file()
+        
+        self.config = new_config
+        self._throttle_levels = None
+        for attribute, service in replacements.items():
+            old_service = getattr(self, attribute)
+            setattr(self, attribute, service)
+            if old_service is not None:
+                old_service.close()
+        if logging_changed and self.owns_logging:
+            self._configure_logging()
+        
+        rebuilt = ", ".join(replacements) or "no services"
+        self.logger.info(f"Configuration reloaded ({rebuilt} rebuilt)")
+        return True
+    
+    def apply_file_changes(self, changed_paths: Set[str]) -> None:
+        """Apply changes reported by the file watcher between runs."""
+        config_path = os.path.normcase(os.path.abspath(self.config.config_path))
+        queries_folder = os.path.normcase(os.path.abspath(self.config.get("sync.queries_folder", "queries")))
+        for path in sorted(changed_paths):
+            # A watcher shared by several tenants also reports the files of the others
+            if path == config_path or os.path.dirname(path) != queries_folder:
+                continue
+            self.queries.invalidate(path)
+            invalidate_sql_file(path)
+            self.logger.info(f"Query file changed: {os.path.basename(path)}")
+        if config_path in changed_paths:
+            self.reload_config()
+    
+    def enable_profiling(self, top_n: int = 25) -> None:
+        """Profile each table with cProfile/tracemalloc and write reports to logs/profiles/."""
+        from utils.profiling import TableProfiler
+        
+        output_folder = os.path.join(self.logger.log_folder, "profiles")
+        self.profiler = TableProfiler(output_folder, top_n=top_n)
+        self.logger.info(f"Profiling enabled, reports are written to {output_folder}")
+    
+    def _export_metrics(self) -> None:
+        """Persist sync state and write the Prometheus textfile."""
+        try:
+            self.state.save()
+        except Exception as e:
+            self.logger.error("Failed to save sync state", e)
+        
+        textfile = self.config.get("metrics.textfile", "logs/taskform_sync.prom")
+        if textfile:
+            try:
+                self.prometheus.registry.write_textfile(textfile)
+            except Exception as e:
+                self.logger.error(f"Failed to write metrics textfile {textfile}", e)
+    
+    def run_daemon(self) -> None:
+        """
+        Sync every table when it is due and serve /metrics until interrupted.
+        
+        A table is due sync.interval_minutes (or its -- @interval header) after its last run;
+        the daemon sleeps until the next table is due, but at least re-scans the queries
+        folder every sync.interval_minutes. Changes to config.json and the queries folder
+        are picked up between runs without a restart.
+        """
+        self.start_metrics_endpoint()
+        self.seed_metrics()
+        
+        from utils.watcher import FileWatcher
+        
+        watched_paths = self.watched_paths()
+        watcher = FileWatcher(watched_paths)
+        watcher.start()
+        self.logger.info(f"Watching config and queries for changes ({watcher.backend})")
+        
+        self.logger.info(f"Daemon mode: syncing every {float(self.config.get('sync.interval_minutes', 30)):.1f} minutes")
+        try:
+            while True:
+                try:
+                    self.run_sync(due_only=True)
+                except Exception as e:
+                    self.logger.error("Sync run failed", e)
+                
+                if watcher.wait(max(1.0, self.seconds_until_next_due())):
+                    time.sleep(self.WATCH_SETTLE_SECONDS)  # let editors finish writing
+                    self.apply_file_changes(watcher.pop_changes())
+                    if self.watched_paths() != watched_paths:
+                        watcher.stop()
+                        watched_paths = self.watched_paths()
+                        watcher = FileWatcher(watched_paths)
+                        watcher.start()
+        except KeyboardInterrupt:
+            self.logger.info("Daemon stopped")
+        finally:
+            watcher.stop()
+            self.close()
+    
+    def start_metrics_endpoint(self, registry: Any = None) -> None:
+        """Serve registry (default: the metrics of this service) on /metrics if metrics.http_enabled."""
+        if not self.config.get("metrics.http_enabled", True):
+            return
+        host = self.config.get("metrics.http_host", "127.0.0.1")
+        port = int(self.config.get("metrics.http_port", 9464))
+        try:
+            start_http_server(registry or self.prometheus.registry, host, port)
+            self.logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+        except OSError as e:
+            self.logger.error(f"Could not start metrics endpoint on {host}:{port}", e)
+    
+    def seed_metrics(self) -> None:
+        """Seed the last-success gauges so stalled tables are visible before the first run completes."""
+        for table_name in self.state.data["tables"]:
+            last_success = self.state.last_success(table_name)
+            if last_success is not None:
+                self.prometheus.last_success.set(last_success, table=table_name)
+    
+    def _log_table_metrics(self, metrics: TableMetrics) -> None:
+        """Log a one-line performance summary for a table."""
+        summary = metrics.to_dict()
+        stages = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in summary["stages_seconds"].items())
+        self.logger.info(
+            f"⏱ {metrics.table_name}: {summary['duration_seconds']:.2f}s, "
+            f"{summary['rows_extracted']} rows ({summary['rows_per_second']:.0f} rows/s), "
+            f"{summary['bytes_sent']} bytes, {summary['retries']} retries"
+            + (f" [{stages}]" if stages else "")
+        )
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="TaskForm Sync - sync SQL query results to the API")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running, sync every sync.interval_minutes and serve /metrics")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a .pstats file and allocation report per table to logs/profiles/")
+    parser.add_argument("--profile-top", type=int, default=25, metavar="N",
+                        help="number of entries in the profile reports (default: 25)")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="print a cold start breakdown (phases and imports) to stderr")
+    parser.add_argument("--startup-target-ms", type=float, default=1000, metavar="MS",
+                        help="cold start target reported by --startup-profile (default: 1000)")
+    parser.add_argument("--diff-dry-run", nargs=2, metavar=("A", "B"),
+                        help="compare two dry-run outputs (json, jsonl, jsonl.gz, parquet or arrow) by key and exit")
+    parser.add_argument("--diff-key", metavar="FIELD",
+                        help="key field for --diff-dry-run (default: the keyField in A, else external_id)")
+    parser.add_argument("--diff-output", metavar="FILE",
+                        help="also write the full --diff-dry-run result with all keys as JSON to FILE")
+    parser.add_argument("--replay", action="store_true",
+                        help="upload the last cached extracts (sync.replay_cache) again without querying the databases")
+    parser.add_argument("--replay-tables", metavar="T1,T2",
+                        help="with --replay: only these tables (default: all cached tables)")
+    parser.add_argument("--replay-keys", metavar="K1,K2",
+                        help="with --replay: only resend the records with these keys")
+    parser.add_argument("--replay-keys-file", metavar="FILE",
+                        help="with --replay: only resend the keys listed in FILE, one per line")
+    parser.add_argument("--tenants-dir", metavar="DIR",
+                        help="sync every *.json tenant configuration in DIR in this process")
+    parser.add_argument("--tenant-workers", type=int, default=2, metavar="N",
+                        help="tables synced at the same time with --tenants-dir (default: 2)")
+    args = parser.parse_args(argv)
+    if args.tenants_dir:
+        # Tenant mode only syncs, and its tables run on parallel workers whose profiles would overlap
+        for option, given in (("--profile", args.profile), ("--replay", args.replay)):
+            if given:
+                parser.error(f"{option} cannot be combined with --tenants-dir")
+    return args
+
+def replay_selection(args: argparse.Namespace) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+    """Return the (tables, keys) selected by --replay-tables, --replay-keys and --replay-keys-file."""
+    tables = [name.strip() for name in args.replay_tables.split(",") if name.strip()] if args.replay_tables else None
+    keys = None
+    if args.replay_keys:
+        keys = [key.strip() for key in args.replay_keys.split(",") if key.strip()]
+    if args.replay_keys_file:
+        with open(args.replay_keys_file, 'r', encoding='utf-8-sig') as f:
+            keys = (keys or []) + [line.strip() for line in f if line.strip()]
+    return tables, keys
+
+def run_tenants(args: argparse.Namespace) -> int:
+    """Sync all tenant configurations of --tenants-dir in one process; returns the exit code."""
+    from utils.tenants import TenantHost, find_tenant_configs
+    
+    config_paths = find_tenant_configs(args.tenants_dir)
+    if not config_paths:
+        raise Exception(f"No tenant configurations (*.json) found in {args.tenants_dir}")
+    host = TenantHost(config_paths, SyncService, workers=args.tenant_workers)
+    if not host.tenants:
+        host.close()
+        raise Exception("No tenant could be loaded")
+    if args.daemon:
+        host.run_daemon()
+        return 0
+    try:
+        results = host.run_pass()
+    finally:
+        host.close()
+    failed = len(config_paths) - len(host.tenants) + sum(1 for result in results.values() if result["failed_count"])
+    return 1 if failed else 0
+
+def diff_dry_run(args: argparse.Namespace) -> int:
+    """Print the differences between two dry-run outputs; returns 1 if they differ (like diff)."""
+    from utils.dry_run import diff_dry_runs, format_diff
+    
+    diff = diff_dry_runs(args.diff_dry_run[0], args.diff_dry_run[1], args.diff_key)
+    print(format_diff(diff))
+    if args.diff_output:
+        with open(args.diff_output, 'w', encoding='utf-8') as f:
+            json.dump(diff, f, indent=2, ensure_ascii=False, default=str)
+    return 1 if diff["added"] or diff["changed"] or diff["removed"] else 0
 
 def main():
     """Main entry point for sync service."""
+    args = parse_args()
+    if args.diff_dry_run:
+        sys.exit(diff_dry_run(args))
+    startup = get_startup_profile()
+    if args.startup_profile:
+        startup.started = _IMPORT_STARTED
+        startup.enable(imports_done=_IMPORT_FINISHED)
     try:
+        if args.tenants_dir:
+            sys.exit(run_tenants(args))
         sync_service = SyncService()
-        results = sync_service.run_sync()
+        if args.profile:
+            sync_service.enable_profiling(args.profile_top)
+        if args.startup_profile:
+            startup.mark_ready()
+        if args.replay:
+            try:
+                results = sync_service.replay(*replay_selection(args))
+            finally:
+                sync_service.close()
+            sys.exit(1 if results["failed_count"] else 0)
+        if args.daemon:
+            if args.startup_profile:
+                print(startup.report(args.startup_target_ms / 1000), file=sys.stderr)
+            sync_service.run_daemon()
+            sys.exit(0)
+        try:
+            results = sync_service.run_sync()
+        finally:
+            sync_service.close()
+        if args.startup_profile:
+            # After the run, so the driver and requests imports done by the first query are listed too
+            print(startup.report(args.startup_target_ms / 1000), file=sys.stderr)
         
         # Exit with error code if any syncs failed
         if results["failed_count"] > 0:
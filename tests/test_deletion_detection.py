@@ -0,0 +1,65 @@
+"""Deletion detection: the max_delete_fraction guard against the stored key set."""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sync import SyncService  # noqa: E402
+
+
+class RecordingAPI:
+    """Stands in for the API service and records the deleted keys."""
+
+    dry_run = False
+
+    def __init__(self):
+        self.deleted = []
+
+    def bulk_delete(self, table_name, keys, key_field="external_id", soft=False, metrics=None):
+        self.deleted.append(list(keys))
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("queries")
+    with open("config.json", 'w', encoding='utf-8') as f:
+        json.dump({
+            "api": {"base_url": "http://127.0.0.1:9", "api_key": "test", "tenant_id": "test"},
+            "sync": {"queries_folder": "queries", "state_folder": "state", "max_delete_fraction": 0.5},
+            "metrics": {"textfile": ""},
+        }, f)
+    sync_service = SyncService("config.json")
+    sync_service.api_service = RecordingAPI()
+    return sync_service
+
+
+def records(keys):
+    return [{"external_id": key} for key in keys]
+
+
+def test_unchanged_keys_delete_nothing(service):
+    keys = [f"k{i}" for i in range(100)]
+    assert service.detect_and_delete("items", records(keys)) == 0
+    assert service.detect_and_delete("items", records(keys)) == 0
+    assert service.api_service.deleted == []
+
+
+def test_partial_delete_below_fraction(service):
+    service.detect_and_delete("items", records(f"k{i}" for i in range(200)))
+    assert service.detect_and_delete("items", records(f"k{i}" for i in range(150))) == 50
+    assert len(service.api_service.deleted) == 1
+    # The key file now holds the 150 remaining keys
+    assert service.key_sets.count("items") == 150
+
+
+def test_full_replacement_is_refused(service):
+    service.detect_and_delete("items", records(f"old{i}" for i in range(100)))
+    with pytest.raises(Exception, match="Refusing to delete 100 records"):
+        service.detect_and_delete("items", records(f"new{i}" for i in range(100)))
+    assert service.api_service.deleted == []
+    # The baseline is kept, so the next run is checked against the same keys
+    assert sorted(service.key_sets.iter_keys("items"))[0] == '"old0"'
@@ -0,0 +1,78 @@
+"""Key-range partitioning: range splitting and partitioned fetches in key order."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_db import SQLiteService  # noqa: E402
+from utils.metrics import TableMetrics  # noqa: E402
+from utils.partitioning import build_bounds_query, fetch_partitioned, split_range  # noqa: E402
+
+
+def covered(ranges):
+    return [key for lo, hi in ranges for key in range(lo, hi)]
+
+
+@pytest.mark.parametrize("low, high, count", [(0, 99, 4), (0, 9, 3), (-5, 5, 2), (1, 1000, 7), (0, 0, 1)])
+def test_ranges_cover_every_key_once(low, high, count):
+    ranges = split_range(low, high, count)
+    assert len(ranges) <= count
+    assert covered(ranges) == list(range(low, high + 1))
+
+
+def test_single_key_gives_one_range():
+    assert split_range(5, 5, 4) == [(5, 6)]
+
+
+def test_more_partitions_than_keys():
+    assert split_range(1, 3, 10) == [(1, 2), (2, 3), (3, 4)]
+
+
+def test_zero_partitions_means_one():
+    assert split_range(0, 9, 0) == [(0, 10)]
+
+
+def test_empty_range():
+    assert split_range(5, 4, 3) == []
+
+
+def test_bounds_from_table_column_or_query():
+    assert build_bounds_query("SELECT * FROM x", "id", "orders.objectid") == \
+        "SELECT MIN(objectid) AS range_lo, MAX(objectid) AS range_hi FROM orders"
+    assert build_bounds_query("SELECT * FROM x", "id", "SELECT 1, 2;") == "SELECT 1, 2"
+    with pytest.raises(ValueError):
+        build_bounds_query("SELECT * FROM x", "id", "objectid")
+
+
+@pytest.fixture
+def service():
+    db = SQLiteService()
+    db.load_rows("items", [{"id": key, "name": f"item {key}"} for key in range(1, 101)])
+    db.load_rows("codes", [{"id": f"c{key}"} for key in range(10)])
+    return db
+
+
+@pytest.mark.parametrize("bounds", [None, "items.id", "SELECT MIN(id), MAX(id) FROM items"])
+def test_partitions_are_yielded_in_key_order(service, bounds):
+    metrics = TableMetrics("items")
+    rows = list(fetch_partitioned(service, "SELECT id, name FROM items ORDER BY id", "id", 4, metrics,
+                                  bounds=bounds))
+    assert [row["id"] for row in rows] == list(range(1, 101))
+    assert [column.name for column in metrics.columns] == ["id", "name"]
+    assert "partitioned_extract_wall" in metrics.stages
+
+
+def test_more_partitions_than_rows(service):
+    rows = list(fetch_partitioned(service, "SELECT id FROM items WHERE id <= 3", "id", 8))
+    assert [row["id"] for row in rows] == [1, 2, 3]
+
+
+def test_text_key_runs_unpartitioned(service):
+    rows = list(fetch_partitioned(service, "SELECT id FROM codes ORDER BY id", "id", 4))
+    assert [row["id"] for row in rows] == sorted(f"c{key}" for key in range(10))
+
+
+def test_empty_result(service):
+    assert list(fetch_partitioned(service, "SELECT id FROM items WHERE id > 1000", "id", 4)) == []
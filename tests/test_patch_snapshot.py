@@ -0,0 +1,103 @@
+"""Patch snapshots: round trip, interrupted runs and damaged snapshot files."""
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chunking import key_sort_token  # noqa: E402
+from utils.payload import PatchSnapshot  # noqa: E402
+
+
+def records(count, name="a"):
+    return [{"external_id": f"k{i:03d}", "name": name, "qty": i} for i in range(count)]
+
+
+def run(folder, items, save=True):
+    snapshot = PatchSnapshot(str(folder), "items")
+    sent = list(snapshot.patch_all(sorted(items, key=lambda record: key_sort_token(record, "external_id"))))
+    if save:
+        snapshot.save()
+    return snapshot, sent
+
+
+def test_round_trip_sends_only_changes(tmp_path):
+    first, sent = run(tmp_path, records(50))
+    assert first.new == 50 and len(sent) == 50
+
+    changed = records(50)
+    changed[7]["name"] = "b"
+    del changed[9]["qty"]
+    second, sent = run(tmp_path, changed)
+    assert (second.new, second.patched, second.unchanged) == (0, 2, 48)
+    assert sent == [{"external_id": "k007", "name": "b"}, {"external_id": "k009", "qty": None}]
+
+    third, sent = run(tmp_path, changed)
+    assert third.unchanged == 50 and sent == []
+
+
+def test_records_out_of_key_order_are_refused(tmp_path):
+    snapshot = PatchSnapshot(str(tmp_path), "items")
+    snapshot.patch({"external_id": "b"})
+    try:
+        snapshot.patch({"external_id": "a"})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected a ValueError")
+    snapshot.discard()
+
+
+def test_interrupted_run_keeps_the_previous_snapshot(tmp_path):
+    run(tmp_path, records(20))
+    # A run that dies halfway never saves; its temp file is left behind
+    interrupted, _ = run(tmp_path, records(20, name="changed")[:10], save=False)
+    interrupted._file.close()
+    assert os.path.exists(interrupted._temp_path)
+
+    again, sent = run(tmp_path, records(20))
+    assert again.unchanged == 20 and sent == []
+
+
+def test_discard_removes_the_partial_snapshot(tmp_path):
+    run(tmp_path, records(5))
+    snapshot, _ = run(tmp_path, records(5, name="changed"), save=False)
+    snapshot.discard()
+    assert not os.path.exists(snapshot._temp_path)
+    again, _ = run(tmp_path, records(5, name="changed"))
+    assert again.patched == 5
+
+
+def test_truncated_snapshot_sends_the_rest_whole(tmp_path):
+    first, _ = run(tmp_path, records(2000))
+    with open(first.path, 'rb') as f:
+        data = f.read()
+    with open(first.path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+    second, sent = run(tmp_path, records(2000))
+    assert second.damaged
+    assert second.unchanged + second.new == 2000 and second.new > 0
+    assert len(sent) == second.new
+    # The next run compares against the rewritten, complete snapshot
+    third, sent = run(tmp_path, records(2000))
+    assert third.unchanged == 2000 and not third.damaged
+
+
+def test_unreadable_snapshot_is_treated_as_missing(tmp_path):
+    first, _ = run(tmp_path, records(10))
+    with open(first.path, 'wb') as f:
+        f.write(b"not a gzip file")
+    second, sent = run(tmp_path, records(10))
+    assert second.damaged and second.new == 10 and len(sent) == 10
+
+
+def test_garbage_line_stops_the_comparison(tmp_path):
+    first, _ = run(tmp_path, records(10))
+    with gzip.open(first.path, 'rt', encoding='utf-8') as f:
+        lines = f.readlines()
+    lines.insert(5, "{broken\n")
+    with gzip.open(first.path, 'wt', encoding='utf-8') as f:
+        f.writelines(lines)
+    second, _ = run(tmp_path, records(10))
+    assert second.damaged and (second.unchanged, second.new) == (4, 6)
@@ -0,0 +1,94 @@
+"""Isolating records the API rejects by splitting the rejected chunk in halves."""
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.mock_api import MockBulkAPI  # noqa: E402
+from services.api_service import APIService, ChunkRejected  # noqa: E402
+from utils.metrics import TableMetrics  # noqa: E402
+from utils.validation import RecordValidator, filter_valid  # noqa: E402
+
+
+def records(count):
+    return [{"external_id": f"k{i}", "value": i} for i in range(count)]
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    service = APIService("http://127.0.0.1:9", "key", "tenant")
+    service.posted = []
+    service.bad_keys = set()
+
+    def post_chunk(endpoint, table_name, payload, metrics=None, body=None, records=0):
+        keys = [record["external_id"] for record in payload["data"]]
+        service.posted.append(keys)
+        if service.bad_keys.intersection(keys):
+            raise ChunkRejected(422, "invalid record")
+
+    monkeypatch.setattr(service, "_post_chunk", post_chunk)
+    rejected = []
+    service.on_rejected = lambda table, record, reason: rejected.append((record["external_id"], reason))
+    service.rejected = rejected
+    return service
+
+
+@pytest.mark.parametrize("size", [2, 16, 1024])
+@pytest.mark.parametrize("position", ["first", "middle", "last"])
+def test_one_bad_record_costs_two_requests_per_halving(api, size, position):
+    index = {"first": 0, "middle": size // 2, "last": size - 1}[position]
+    api.bad_keys = {f"k{index}"}
+    accepted = api._post_records("items/bulk", "items", records(size), "upsert", "external_id")
+    assert accepted == size - 1
+    assert api.rejected == [(f"k{index}", "422 - invalid record")]
+    assert len(api.posted) == 1 + 2 * int(math.log2(size))
+
+
+def test_several_bad_records_are_all_isolated(api):
+    api.bad_keys = {"k3", "k4", "k60"}
+    accepted = api._post_records("items/bulk", "items", records(64), "upsert", "external_id")
+    assert accepted == 61
+    assert sorted(key for key, _ in api.rejected) == ["k3", "k4", "k60"]
+    # Every accepted record was posted exactly once in an accepted chunk
+    accepted_keys = [key for keys in api.posted if not api.bad_keys.intersection(keys) for key in keys]
+    assert sorted(accepted_keys) == sorted(f"k{i}" for i in range(64) if f"k{i}" not in api.bad_keys)
+
+
+def test_without_handler_the_chunk_fails(api):
+    api.on_rejected = None
+    api.bad_keys = {"k1"}
+    with pytest.raises(ChunkRejected):
+        api._post_records("items/bulk", "items", records(8), "upsert", "external_id")
+    assert len(api.posted) == 1
+
+
+def test_bulk_upsert_against_the_mock_api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with MockBulkAPI(reject_keys=["k37", "k500"]) as mock:
+        service = APIService(mock.base_url, "key", "tenant", batch_size=100)
+        rejected = []
+        service.on_rejected = lambda table, record, reason: rejected.append(record["external_id"])
+        metrics = TableMetrics("items")
+        try:
+            service.bulk_upsert("items", records(1000), metrics=metrics)
+        finally:
+            service.close()
+    assert sorted(rejected) == ["k37", "k500"]
+    assert metrics.records_uploaded == 998
+    # 10 chunks; the two rejected ones are halved 6 times (100, 50, 25, 12 or 13, 6, 3, 1)
+    assert metrics.requests == 10 + 2 * 2 * 6
+
+
+def test_validator_checks_key_and_text_length():
+    validator = RecordValidator("external_id", max_text_length=5)
+    rejected = []
+    valid = list(filter_valid(
+        [{"external_id": "a", "name": "short"}, {"external_id": "", "name": "x"}, {"name": "x"},
+         {"external_id": "b", "lines": [{"sku": "too long"}]}, {"external_id": "c", "qty": 12345678}],
+        validator, lambda record, reason: rejected.append(reason)))
+    assert [record["external_id"] for record in valid] == ["a", "c"]
+    assert rejected == ["missing key external_id", "missing key external_id", "lines.sku: length 8 exceeds 5"]
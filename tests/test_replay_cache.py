@@ -0,0 +1,123 @@
+"""Replay cache: round trip, key lookups through the index and interrupted generations."""
+import json
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.replay import ReplayCache  # noqa: E402
+
+
+def records(count, name="a"):
+    return [{"external_id": f"K{i}", "name": name, "lines": [{"sku": f"s{i}"}]} for i in range(count)]
+
+
+def store(cache, items, table="items", key_field="external_id"):
+    writer = cache.writer(table, key_field)
+    for _ in writer.tee(items):
+        pass
+    writer.commit()
+    return writer
+
+
+def test_round_trip(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    store(cache, records(500))
+    assert list(cache.iter_records("items")) == records(500)
+    assert cache.tables() == ["items"]
+    assert cache.meta("items")["records"] == 500
+
+
+def test_key_lookup_uses_the_index(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    store(cache, records(5000))
+    found = list(cache.iter_records("items", ["k4999", "K0", "k2500", "missing", "K0"]))
+    assert [record["external_id"] for record in found] == ["K4999", "K0", "K2500"]
+
+
+def test_numeric_keys_match_their_text(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    store(cache, [{"id": 500000, "v": 1}, {"id": Decimal("12.0"), "v": 2}, {"id": "abc", "v": 3}], key_field="id")
+    assert [record["v"] for record in cache.iter_records("items", ["500000", "12.0", "ABC"])] == [1, 2, 3]
+
+
+def test_empty_extract(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    store(cache, [])
+    assert list(cache.iter_records("items")) == []
+    assert list(cache.iter_records("items", ["k1"])) == []
+
+
+def test_missing_cache_raises(tmp_path):
+    with pytest.raises(Exception, match="No replay cache"):
+        list(ReplayCache(str(tmp_path)).iter_records("items"))
+
+
+def test_new_generation_replaces_the_previous_one(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    first = store(cache, records(10))
+    second = store(cache, records(3, name="b"))
+    assert cache.generations("items") == [second.generation]
+    assert first.generation != second.generation
+    assert [record["name"] for record in cache.iter_records("items")] == ["b"] * 3
+
+
+def test_interrupted_generation_keeps_the_previous_cache(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    store(cache, records(10))
+    interrupted = cache.writer("items", "external_id")
+    for record in records(5, name="partial"):
+        interrupted.add(record)
+    interrupted._file.close()  # the process died before commit() or abort()
+    assert list(cache.iter_records("items")) == records(10)
+    assert len(cache.generations("items")) == 2
+
+    latest = store(cache, records(4, name="c"))
+    assert cache.generations("items") == [latest.generation]
+
+
+def test_aborted_generation_is_removed(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    store(cache, records(10))
+    writer = cache.writer("items", "external_id")
+    writer.add(records(1)[0])
+    writer.abort()
+    assert len(cache.generations("items")) == 1
+    assert list(cache.iter_records("items")) == records(10)
+
+
+def test_truncated_data_file_is_reported(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    writer = store(cache, records(100))
+    with open(writer.data_path, 'r+b') as f:
+        f.truncate(os.path.getsize(writer.data_path) - 10)
+    with pytest.raises(Exception, match="damaged"):
+        list(cache.iter_records("items"))
+
+
+def test_truncated_index_is_reported(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    writer = store(cache, records(100))
+    with open(writer.index_path, 'r+b') as f:
+        f.truncate(20 * 50)
+    assert len(list(cache.iter_records("items"))) == 100
+    with pytest.raises(Exception, match="damaged"):
+        list(cache.iter_records("items", ["K1"]))
+
+
+def test_index_entries_point_at_their_records(tmp_path):
+    cache = ReplayCache(str(tmp_path))
+    writer = store(cache, records(50))
+    with open(writer.data_path, 'rb') as f:
+        data = f.read()
+    with open(writer.index_path, 'rb') as f:
+        index = f.read()
+    hashes = [int.from_bytes(index[i:i + 8], 'little') for i in range(0, len(index), 20)]
+    assert hashes == sorted(hashes)
+    for i in range(0, len(index), 20):
+        offset = int.from_bytes(index[i + 8:i + 16], 'little')
+        length = int.from_bytes(index[i + 16:i + 20], 'little')
+        assert json.loads(data[offset:offset + length])["external_id"].startswith("K")
@@ -0,0 +1,145 @@
+"""Run lock: skip, queue and kill_stale policies, heartbeats and takeovers."""
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.run_lock import RunLock, pid_reused, process_start_time  # noqa: E402
+
+
+def write_lock(folder, pid, started=None, heartbeat=None, host=None):
+    with open(os.path.join(folder, "run.lock"), 'w', encoding='utf-8') as f:
+        json.dump({"pid": pid, "host": host or socket.gethostname(), "token": "other",
+                   "started": started or datetime.now().isoformat(timespec="seconds"),
+                   "heartbeat": time.time() if heartbeat is None else heartbeat}, f)
+
+
+@pytest.fixture
+def other_process():
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    # Its start time must be readable before a lock "taken" now can be compared with it
+    time.sleep(0.2)
+    yield process
+    process.kill()
+    process.wait()
+
+
+def test_acquire_and_release(tmp_path):
+    lock = RunLock(str(tmp_path))
+    assert lock.acquire()
+    holder = lock.holder()
+    assert holder["pid"] == os.getpid() and holder["token"] == lock.token
+    lock.release()
+    assert lock.holder() is None
+
+
+def test_second_run_is_skipped(tmp_path):
+    first = RunLock(str(tmp_path))
+    assert first.acquire()
+    second = RunLock(str(tmp_path))
+    assert not second.acquire()
+    assert second.holder_at_skip["pid"] == os.getpid()
+    second.record_skip()
+    assert second.skipped_runs() == 1
+    first.release()
+
+
+def test_lock_of_a_finished_process_is_taken_over(tmp_path):
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    write_lock(tmp_path, process.pid)
+    lock = RunLock(str(tmp_path))
+    assert lock.acquire()
+    assert lock.taken_over["pid"] == process.pid
+    lock.release()
+
+
+def test_reused_pid_is_taken_over(tmp_path, other_process):
+    # The lock was taken long before the process that now has its PID started
+    write_lock(tmp_path, other_process.pid, started="2020-01-01T00:00:00")
+    lock = RunLock(str(tmp_path), policy="skip")
+    assert lock.acquire()
+    assert lock.taken_over["pid"] == other_process.pid
+    lock.release()
+
+
+def test_live_holder_is_not_taken_over(tmp_path, other_process):
+    write_lock(tmp_path, other_process.pid, started=datetime.now().isoformat(timespec="seconds"))
+    assert not RunLock(str(tmp_path), policy="skip").acquire()
+
+
+def test_pid_reuse_check(other_process):
+    started = process_start_time(other_process.pid)
+    if started is None:
+        pytest.skip("process start times are not available on this platform")
+    assert abs(started - time.time()) < 30
+    assert pid_reused(other_process.pid, "2020-01-01T00:00:00")
+    assert not pid_reused(other_process.pid, datetime.fromtimestamp(started + 5).isoformat(timespec="seconds"))
+    assert not pid_reused(other_process.pid, None)
+
+
+def test_queue_waits_for_the_lock(tmp_path):
+    first = RunLock(str(tmp_path))
+    assert first.acquire()
+    second = RunLock(str(tmp_path), policy="queue", wait_seconds=5)
+    second.POLL_INTERVAL = 0.05
+    threading.Timer(0.3, first.release).start()
+    assert second.acquire()
+    assert second.waited_seconds >= 0.2
+    second.release()
+
+
+def test_queue_gives_up_after_the_wait(tmp_path):
+    first = RunLock(str(tmp_path))
+    assert first.acquire()
+    second = RunLock(str(tmp_path), policy="queue", wait_seconds=0.2)
+    second.POLL_INTERVAL = 0.05
+    assert not second.acquire()
+    first.release()
+
+
+def test_kill_stale_takes_over_a_frozen_run(tmp_path, other_process):
+    write_lock(tmp_path, other_process.pid, heartbeat=time.time() - 3600)
+    lock = RunLock(str(tmp_path), policy="kill_stale", stale_seconds=60)
+    assert lock.acquire()
+    assert other_process.wait(timeout=10) is not None
+    lock.release()
+
+
+def test_stale_lock_on_another_host_is_only_taken_by_kill_stale(tmp_path):
+    write_lock(tmp_path, 12345, heartbeat=time.time() - 3600, host="other-host")
+    assert not RunLock(str(tmp_path), policy="skip", stale_seconds=60).acquire()
+    lock = RunLock(str(tmp_path), policy="kill_stale", stale_seconds=60)
+    assert lock.acquire()
+    lock.release()
+
+
+def test_heartbeat_thread_keeps_a_long_run_fresh(tmp_path, monkeypatch):
+    monkeypatch.setattr(RunLock, "HEARTBEAT_INTERVAL", 0.1)
+    lock = RunLock(str(tmp_path))
+    assert lock.acquire()
+    first = lock.holder()["heartbeat"]
+    time.sleep(0.5)  # no progress events, like a long query
+    assert lock.holder()["heartbeat"] > first
+    lock.release()
+    assert lock.holder() is None
+
+
+def test_taken_over_lock_is_lost_and_not_rewritten(tmp_path, monkeypatch):
+    monkeypatch.setattr(RunLock, "HEARTBEAT_INTERVAL", 0.1)
+    lock = RunLock(str(tmp_path))
+    assert lock.acquire()
+    write_lock(tmp_path, os.getpid())
+    time.sleep(0.4)
+    assert lock.lost
+    assert lock.holder()["token"] == "other"
+    lock.release()
+    assert lock.holder()["token"] == "other"
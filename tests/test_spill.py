@@ -0,0 +1,97 @@
+"""Memory-bounded nesting and sorting: spilled results equal the in-memory ones."""
+import os
+import pickle
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import spill  # noqa: E402
+from utils.metrics import TableMetrics  # noqa: E402
+from utils.spill import nest_within_budget, sort_within_budget  # noqa: E402
+from utils.transformers import auto_nest_data  # noqa: E402
+
+
+def rows(parents=300, children=3):
+    # Children of a parent are spread over the extract, so groups span several runs
+    return [{"parent-id": parent, "external_id": f"p{parent}", "name": f"parent {parent}",
+             "lines.sku": f"sku-{parent}-{child}"}
+            for child in range(children) for parent in range(parents)]
+
+
+def by_key(records):
+    return sorted(records, key=lambda record: record["external_id"])
+
+
+def test_nesting_without_spill_matches_auto_nest(tmp_path):
+    stream = nest_within_budget(rows(), 0, str(tmp_path))
+    assert list(stream) == auto_nest_data(rows())
+    assert stream.row_count == 900 and stream.record_count == 300
+    assert os.listdir(tmp_path) == []
+
+
+def test_spilled_nesting_matches_auto_nest(tmp_path):
+    metrics = TableMetrics("items")
+    stream = nest_within_budget(rows(), 4000, str(tmp_path), metrics)
+    nested = list(stream)
+    assert metrics.spill_runs > 1
+    assert by_key(nested) == by_key(auto_nest_data(rows()))
+    # Child order within a parent is the arrival order
+    assert [line["sku"] for line in nested[0]["lines"]] == ["sku-0-0", "sku-0-1", "sku-0-2"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_many_runs_are_merged_in_between(tmp_path, monkeypatch):
+    monkeypatch.setattr(spill, "MAX_OPEN_RUNS", 4)
+    metrics = TableMetrics("items")
+    nested = list(nest_within_budget(rows(), 2000, str(tmp_path), metrics))
+    assert metrics.spill_runs > 4
+    assert by_key(nested) == by_key(auto_nest_data(rows()))
+    assert os.listdir(tmp_path) == []
+
+
+def test_rows_without_parent_id_stream_through(tmp_path):
+    flat = [{"external_id": f"k{i}"} for i in range(10)]
+    stream = nest_within_budget(iter(flat), 1, str(tmp_path))
+    assert stream.nester is None and list(stream) == flat
+
+
+def test_abandoned_nesting_removes_spill_files(tmp_path):
+    stream = iter(nest_within_budget(rows(), 4000, str(tmp_path)))
+    next(stream)
+    assert os.listdir(tmp_path)
+    stream.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_truncated_run_raises_instead_of_dropping_records(tmp_path):
+    stream = iter(nest_within_budget(rows(), 4000, str(tmp_path)))
+    next(stream)
+    for name in os.listdir(tmp_path):
+        path = os.path.join(tmp_path, name)
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) // 2)
+    with pytest.raises((EOFError, pickle.UnpicklingError)):
+        list(stream)
+    assert os.listdir(tmp_path) == []
+
+
+def test_sort_within_budget_is_stable(tmp_path):
+    records = [{"external_id": f"k{i % 97:03d}", "seq": i} for i in range(2000)]
+    expected = sorted(records, key=lambda record: record["external_id"])
+    metrics = TableMetrics("items")
+    result = list(sort_within_budget(records, lambda record: record["external_id"], 5000, str(tmp_path), metrics))
+    assert metrics.spill_runs > 1
+    assert result == expected
+    assert list(sort_within_budget(records, lambda record: record["external_id"])) == expected
+    assert os.listdir(tmp_path) == []
+
+
+def test_abandoned_sort_removes_spill_files(tmp_path):
+    records = ({"external_id": f"k{i:04d}"} for i in range(3000, 0, -1))
+    result = sort_within_budget(records, lambda record: record["external_id"], 5000, str(tmp_path))
+    assert next(result)["external_id"] == "k0001"
+    assert os.listdir(tmp_path)
+    result.close()
+    assert os.listdir(tmp_path) == []
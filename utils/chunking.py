@@ -0,0 +1,95 @@
+"""
+Deterministic chunks for key-ordered uploads.
+
+With -- @sort_by_key (or sync.sort_by_key) the records of a table are uploaded in
+key order, and a chunk is also closed after every record whose key hash hits
+1 in batch_size / 2 (besides the batch_size and batch_bytes limits). Chunk
+boundaries then depend on the keys themselves: a new or deleted record only
+changes the chunk it falls in, instead of shifting every chunk after it.
+
+With -- @chunk_digests (or sync.chunk_digests) the digest of every uploaded request
+body is stored per table in {state_folder}/chunks/. A chunk whose body is identical
+to one uploaded by an earlier run is not sent again. The digests are discarded after
+sync.chunk_digest_refresh_hours, so a full upload still happens regularly.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional, Set
+
+from utils.keyset import key_token
+from utils.state import atomic_write_text
+
+
+def key_sort_token(record: Dict[str, Any], key_field: str = "external_id") -> str:
+    """Sort key of a record: its key token, records without a key first."""
+    return key_token(record, key_field) or ""
+
+
+class ChunkDigests:
+    """The request body digests of the last upload of one table."""
+
+    def __init__(self, state_folder: str, table_name: str, refresh_seconds: float = 86400.0):
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', table_name)
+        self.path = os.path.join(state_folder, "chunks", f"{safe_name}.digests.json")
+        self.refresh_seconds = refresh_seconds
+        self.full_upload = time.time()  # when the oldest digest that is still trusted was uploaded
+        self.previous: Set[str] = self._load()
+        self.current: Set[str] = set()
+        self.skipped_chunks = 0
+        self.skipped_records = 0
+
+    def _load(self) -> Set[str]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        full_upload = float(stored.get("full_upload") or 0)
+        if self.refresh_seconds > 0 and time.time() - full_upload > self.refresh_seconds:
+            return set()  # time for a full upload
+        self.full_upload = full_upload
+        return set(stored.get("digests") or ())
+
+    @staticmethod
+    def digest(body: bytes) -> str:
+        return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def skip(self, digest: str, records: int) -> bool:
+        """Return True (and keep the digest) if a chunk with this digest was uploaded before."""
+        if digest not in self.previous:
+            return False
+        self.current.add(digest)
+        self.skipped_chunks += 1
+        self.skipped_records += records
+        return True
+
+    def uploaded(self, digest: str) -> None:
+        """Remember a chunk the API accepted completely."""
+        self.current.add(digest)
+
+    def save(self) -> None:
+        """Replace the stored digests with the chunks of this run (after the upload succeeded)."""
+        atomic_write_text(self.path, json.dumps({"full_upload": self.full_upload, "digests": sorted(self.current)}))
+
+
+class KeyChunking:
+    """How the API service cuts the chunks of a key-ordered upload, with optional chunk digests."""
+
+    def __init__(self, key_field: str = "external_id", digests: Optional[ChunkDigests] = None):
+        self.key_field = key_field
+        self.digests = digests
+
+    def boundary(self, batch_size: int) -> Callable[[Dict[str, Any]], bool]:
+        """Return a test for the records after which a chunk of about batch_size / 2 records is closed."""
+        divisor = max(1, batch_size // 2)
+        key_field = self.key_field
+
+        def is_boundary(record: Dict[str, Any]) -> bool:
+            token = key_token(record, key_field)
+            return token is not None and zlib.crc32(token.encode('utf-8')) % divisor == 0
+
+        return is_boundary
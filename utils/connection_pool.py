@@ -0,0 +1,92 @@
+"""
+Small thread-safe database connection pool with a prepared-statement cache per connection.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class ConnectionPool:
+    """
+    Keeps idle connections open between queries (and between runs in daemon mode).
+
+    Each pooled connection has its own LRU cache of prepared statements, so a query
+    that runs again on the same connection skips parsing and planning.
+
+    A connection that was idle for ping_after_seconds is checked with ping(conn)
+    before it is handed out again: the server may have dropped it in the meantime
+    (restart, idle timeout, network outage), e.g. between two daemon runs.
+    """
+
+    def __init__(self, connect: Callable[[], Any], max_idle: int = 8, statement_cache_size: int = 32,
+                 ping: Optional[Callable[[Any], None]] = None, ping_after_seconds: float = 30.0):
+        self._connect = connect
+        self.max_idle = max_idle
+        self.statement_cache_size = statement_cache_size
+        self.ping = ping
+        self.ping_after_seconds = ping_after_seconds
+        self._idle: List[Tuple[Any, float]] = []  # (connection, time.monotonic() it was released)
+        self._statements: Dict[int, "OrderedDict[Any, Any]"] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Any:
+        """
+        Return an idle connection, or a new one if none is idle.
+
+        An idle connection whose ping fails is discarded with its statement cache and
+        a fresh connection is returned instead.
+        """
+        with self._lock:
+            idle = self._idle.pop() if self._idle else None
+        if idle is not None:
+            conn, released = idle
+            if self.ping is None or time.monotonic() - released < self.ping_after_seconds:
+                return conn
+            try:
+                self.ping(conn)
+                return conn
+            except Exception:
+                self.discard(conn)
+        return self._connect()
+
+    def release(self, conn: Any) -> None:
+        """Return a healthy connection to the pool."""
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((conn, time.monotonic()))
+                return
+        self.discard(conn)
+
+    def statement(self, conn: Any, key: Any, prepare: Callable[[], Any],
+                  dispose: Optional[Callable[[Any], None]] = None) -> Any:
+        """Return the cached statement for key on conn, preparing it on first use."""
+        cache = self._statements.setdefault(id(conn), OrderedDict())
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        statement = prepare()
+        cache[key] = statement
+        while len(cache) > self.statement_cache_size:
+            _, evicted = cache.popitem(last=False)
+            if dispose:
+                try:
+                    dispose(evicted)
+                except Exception:
+                    pass
+        return statement
+
+    def discard(self, conn: Any) -> None:
+        """Close a connection that failed, so it is never handed out again."""
+        self._statements.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self.discard(conn)
@@ -0,0 +1,47 @@
+"""
+Dead-letter files for records that could not be uploaded.
+
+Records that fail validation, or that the API rejects on their own after a chunk
+was split, are appended to {dead_letter_folder}/{table}_{timestamp}.jsonl with the
+reason, one JSON object per line, so the rest of the table can still be uploaded.
+More than sync.max_dead_letters rejected records fail the table: that many bad
+records point at a broken query rather than at a few bad rows.
+"""
+import json
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+class DeadLetterFile:
+    """The rejected records of one table in one run; the file is created at the first record."""
+
+    def __init__(self, folder: str, table_name: str, limit: int = 100):
+        self.folder = folder
+        self.table_name = table_name
+        self.limit = max(0, int(limit or 0))  # 0 = no limit
+        self.count = 0
+        self.path: Optional[str] = None
+        self._file = None
+
+    def add(self, record: Dict[str, Any], reason: str, stage: str = "validate") -> None:
+        """Append a rejected record; raises once more than limit records were rejected."""
+        if self._file is None:
+            os.makedirs(self.folder, exist_ok=True)
+            safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.table_name)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.path = os.path.join(self.folder, f"{safe_name}_{timestamp}.jsonl")
+            self._file = open(self.path, 'a', encoding='utf-8')
+        entry = {"table": self.table_name, "stage": stage, "reason": reason,
+                 "time": datetime.now().isoformat(timespec="seconds"), "record": record}
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+        self.count += 1
+        if self.limit and self.count > self.limit:
+            raise Exception(f"More than {self.limit} records of {self.table_name} were rejected, see {self.path}")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,277 @@
+"""
+Dry-run output sinks and a fast diff of two dry-run outputs.
+
+sync.dry_run_format selects the file written per table:
+
+    json      one pretty-printed payload (default, the original format)
+    jsonl     one compact JSON record per line
+    jsonl.gz  the same, gzip-compressed
+    parquet   columnar, needs pyarrow
+    arrow     Arrow IPC stream, needs pyarrow
+
+All formats except json are written chunk by chunk. In the columnar formats nested
+values (child arrays) are stored as JSON text and the key field is kept in the
+schema metadata, so --diff-dry-run can compare any two formats.
+"""
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DRY_RUN_FORMATS = ("json", "jsonl", "jsonl.gz", "parquet", "arrow")
+
+_EXTENSIONS = {"jsonl": ".jsonl", "jsonl.gz": ".jsonl.gz", "parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise Exception("The parquet and arrow dry-run formats require pyarrow (pip install pyarrow)")
+
+
+def _text(value: Any) -> Optional[str]:
+    """Text form of a value in a columnar string column (matches json.dumps(default=str))."""
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    if isinstance(value, str):
+        return value
+    return str(value)
+
+
+class JsonLinesWriter:
+    """Writes one compact JSON record per line, optionally gzip-compressed."""
+
+    def __init__(self, path: str, key_field: str, compress: bool = False):
+        self.path = path
+        self.key_field = key_field
+        self._file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=5) if compress \
+            else open(path, 'w', encoding='utf-8')
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        self._file.write("".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ColumnarWriter:
+    """
+    Writes chunks as Parquet row groups or Arrow IPC record batches.
+
+    The schema is taken from the first chunk: booleans, integers and floats keep their
+    type, all other values (strings, dates, decimals, nested arrays) are stored as text.
+    """
+
+    def __init__(self, path: str, key_field: str, file_format: str):
+        self.path = path
+        self.key_field = key_field
+        self.file_format = file_format
+        self._pa = _import_pyarrow()
+        self._schema = None
+        self._json_columns: List[str] = []
+        self._writer = None
+
+    def _infer_schema(self, records: List[Dict[str, Any]]):
+        pa = self._pa
+        columns: Dict[str, Any] = {}
+        for record in records:
+            for name, value in record.items():
+                if columns.get(name) is None and value is not None:
+                    if isinstance(value, bool):
+                        columns[name] = pa.bool_()
+                    elif isinstance(value, int):
+                        columns[name] = pa.int64()
+                    elif isinstance(value, float):
+                        columns[name] = pa.float64()
+                    else:
+                        columns[name] = pa.string()
+                        if isinstance(value, (dict, list)):
+                            self._json_columns.append(name)
+                else:
+                    columns.setdefault(name, None)
+        metadata = {"keyField": json.dumps(self.key_field), "jsonColumns": json.dumps(self._json_columns)}
+        return pa.schema([(name, column_type or pa.string()) for name, column_type in columns.items()],
+                         metadata=metadata)
+
+    def _open(self) -> None:
+        pa = self._pa
+        if self.file_format == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression="zstd")
+        else:
+            import pyarrow.ipc
+            self._sink = pa.OSFile(self.path, 'wb')
+            self._writer = pyarrow.ipc.new_stream(self._sink, self._schema)
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        pa = self._pa
+        if self._schema is None:
+            self._schema = self._infer_schema(records)
+            self._open()
+
+        unknown = {name for record in records for name in record} - set(self._schema.names)
+        if unknown:
+            raise Exception(f"Columns {sorted(unknown)} are not in the schema of the first chunk, "
+                            f"use the jsonl dry-run format for this table")
+
+        arrays = []
+        for field in self._schema:
+            values = [record.get(field.name) for record in records]
+            if field.type == pa.string():
+                values = [_text(value) for value in values]
+            elif field.type == pa.int64():
+                values = [int(value) if isinstance(value, float) and value.is_integer() else value
+                          for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        if self._writer is None:
+            # No records: write an empty file with only the key field in its schema
+            pa = self._pa
+            self._schema = pa.schema([(self.key_field, pa.string())],
+                                     metadata={"keyField": json.dumps(self.key_field), "jsonColumns": "[]"})
+            self._open()
+        self._writer.close()
+        if self.file_format == "arrow":
+            self._sink.close()
+
+
+def open_dry_run_writer(folder: str, table_name: str, key_field: str, file_format: str):
+    """Create the writer for a table's dry-run output in file_format (not json)."""
+    if file_format not in _EXTENSIONS:
+        raise Exception(f"Unknown dry-run format: {file_format} (expected one of {', '.join(DRY_RUN_FORMATS)})")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(folder, f"{table_name}_{timestamp}{_EXTENSIONS[file_format]}")
+    if file_format in ("parquet", "arrow"):
+        return ColumnarWriter(path, key_field, file_format)
+    return JsonLinesWriter(path, key_field, compress=file_format == "jsonl.gz")
+
+
+def _read_columnar(path: str) -> Tuple[Optional[str], Iterator[Dict[str, Any]]]:
+    pa = _import_pyarrow()
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        schema = parquet_file.schema_arrow
+        batches = parquet_file.iter_batches()
+    else:
+        import pyarrow.ipc
+        reader = pyarrow.ipc.open_stream(pa.memory_map(path, 'r'))
+        schema = reader.schema
+        batches = iter(reader)
+    metadata = schema.metadata or {}
+    key_field = json.loads(metadata[b"keyField"]) if b"keyField" in metadata else None
+    json_columns = set(json.loads(metadata.get(b"jsonColumns", b"[]")))
+
+    def records() -> Iterator[Dict[str, Any]]:
+        for batch in batches:
+            for record in batch.to_pylist():
+                for name in json_columns:
+                    if record.get(name) is not None:
+                        record[name] = json.loads(record[name])
+                yield record
+
+    return key_field, records()
+
+
+def read_dry_run(path: str) -> Tuple[Optional[str], Iterator[Dict[str, Any]]]:
+    """Return (key field if recorded in the file, records) of a dry-run output in any format."""
+    if path.endswith((".parquet", ".arrow")):
+        return _read_columnar(path)
+    if path.endswith((".jsonl", ".jsonl.gz")):
+        def records() -> Iterator[Dict[str, Any]]:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        return None, records()
+    with open(path, 'r', encoding='utf-8') as f:
+        payload = json.load(f)
+    return payload.get("keyField"), iter(payload.get("data", []))
+
+
+def _without_nulls(value: Any) -> Any:
+    """value with None-valued fields dropped at every level (columnar formats store absent fields as null)."""
+    if isinstance(value, dict):
+        return {name: _without_nulls(item) for name, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [_without_nulls(item) for item in value]
+    return value
+
+
+def _fingerprint(record: Dict[str, Any]) -> bytes:
+    canonical = json.dumps(_without_nulls(record), sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+
+
+def diff_dry_runs(path_a: str, path_b: str, key_field: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Compare two dry-run outputs by key and return the added, changed and removed keys.
+
+    Only a 16-byte fingerprint per record of A is kept in memory; B is streamed.
+    A null field counts as absent, so json/jsonl and parquet/arrow outputs compare equal.
+    The key field is key_field, else the one recorded in A, else external_id.
+    """
+    recorded_key, records_a = read_dry_run(path_a)
+    # Dry-run records are lowercased like the API payload, so is their key field
+    key_field = (key_field or recorded_key or "external_id").lower()
+
+    fingerprints: Dict[str, bytes] = {}
+    duplicates = 0
+    for record in records_a:
+        key = json.dumps(record.get(key_field), default=str)
+        if key in fingerprints:
+            duplicates += 1
+        fingerprints[key] = _fingerprint(record)
+
+    added: List[Any] = []
+    changed: List[Any] = []
+    unchanged = 0
+    _, records_b = read_dry_run(path_b)
+    for record in records_b:
+        key = json.dumps(record.get(key_field), default=str)
+        fingerprint = fingerprints.pop(key, None)
+        if fingerprint is None:
+            added.append(record.get(key_field))
+        elif fingerprint != _fingerprint(record):
+            changed.append(record.get(key_field))
+        else:
+            unchanged += 1
+    removed = [json.loads(key) for key in fingerprints]
+
+    return {
+        "key_field": key_field,
+        "a": path_a,
+        "b": path_b,
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "unchanged": unchanged,
+        "duplicate_keys_in_a": duplicates,
+    }
+
+
+def format_diff(diff: Dict[str, Any], limit: int = 20) -> str:
+    """Return a short text summary of diff_dry_runs() output."""
+    lines = [f"Dry-run diff by {diff['key_field']}: {diff['a']} -> {diff['b']}",
+             f"  unchanged: {diff['unchanged']}"]
+    for name in ("added", "changed", "removed"):
+        keys = diff[name]
+        lines.append(f"  {name}: {len(keys)}")
+        for key in keys[:limit]:
+            lines.append(f"    {key}")
+        if len(keys) > limit:
+            lines.append(f"    ... and {len(keys) - limit} more")
+    if diff["duplicate_keys_in_a"]:
+        lines.append(f"  warning: {diff['duplicate_keys_in_a']} duplicate keys in {diff['a']}")
+    return "\n".join(lines)
@@ -0,0 +1,101 @@
+"""
+Type-aware decoding of Firebird result columns.
+
+fdb returns most columns as plain Python values, but not all of them can be sent as
+JSON: text BLOBs larger than the driver's stream threshold come back as BlobReader
+objects, binary BLOBs and CHARACTER SET OCTETS columns as bytes. A ColumnDecoders
+is built once per result set from cursor.description and converts only those
+columns, one fetched batch at a time:
+
+    text BLOB      str; a streamed BLOB is read in one call of at most blob_max_bytes
+    binary BLOB    base64 text
+    OCTETS text    hex text (typically GUIDs stored as CHAR(16) OCTETS)
+
+All other columns are passed through untouched.
+"""
+import base64
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# fdb reports a BLOB as a str column with display size 0 and its subtype in the scale field
+BLOB_SUBTYPE_TEXT = 1
+
+# The driver materializes BLOBs up to this size itself and streams larger ones
+DRIVER_STREAM_THRESHOLD = 65536
+
+
+class ColumnDecoders:
+    """Per-column decoders for one Firebird result set."""
+
+    def __init__(self, description: Sequence[Sequence[Any]], blob_max_bytes: int = 0):
+        """
+        Args:
+            description: cursor.description of the executed statement
+            blob_max_bytes: Longer BLOBs are truncated to this size (0 = no limit)
+        """
+        self.columns = [column[0] for column in description]
+        self.blob_max_bytes = blob_max_bytes
+        self.truncated = 0
+        self.decoders: List[Tuple[int, Callable[[Any], Any]]] = []
+        # Text columns only need a decoder if they hold OCTETS, which shows in their first value
+        self._undecided: List[int] = []
+        for index, column in enumerate(description):
+            if column[1] is not str:
+                continue
+            if column[2] == 0:
+                decoder = self._text_blob if column[5] == BLOB_SUBTYPE_TEXT else self._binary_blob
+                self.decoders.append((index, decoder))
+            else:
+                self._undecided.append(index)
+
+    def _read_blob(self, reader) -> Any:
+        """Read a streamed BLOB up to blob_max_bytes in one driver call and close it."""
+        try:
+            length = reader.get_info()[0]
+            limit = min(length, self.blob_max_bytes) if self.blob_max_bytes else length
+            value = reader.read(limit)
+        finally:
+            reader.close()
+        if limit < length:
+            self.truncated += 1
+        return value
+
+    def _text_blob(self, value: Any) -> Any:
+        return value if value.__class__ is str else self._read_blob(value)
+
+    def _binary_blob(self, value: Any) -> str:
+        if value.__class__ is not bytes:
+            value = self._read_blob(value)
+        return base64.b64encode(value).decode('ascii')
+
+    @staticmethod
+    def _octets(value: Any) -> Any:
+        return value.hex() if value.__class__ is bytes else value
+
+    def _decide(self, rows: Sequence[Sequence[Any]]) -> None:
+        for index in list(self._undecided):
+            for row in rows:
+                value = row[index]
+                if value is not None:
+                    if value.__class__ is bytes:
+                        self.decoders.append((index, self._octets))
+                    self._undecided.remove(index)
+                    break
+
+    def to_dicts(self, rows: Sequence[Sequence[Any]]) -> List[Dict[str, Any]]:
+        """Decode a fetched batch column by column and return it as dictionaries."""
+        if self._undecided:
+            self._decide(rows)
+        if self.decoders:
+            rows = [list(row) for row in rows]
+            for index, decode in self.decoders:
+                for row in rows:
+                    value = row[index]
+                    if value is not None:
+                        row[index] = decode(value)
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in rows]
+
+
+def stream_threshold(blob_max_bytes: int) -> int:
+    """Driver stream threshold so that no BLOB above blob_max_bytes is materialized whole."""
+    return min(DRIVER_STREAM_THRESHOLD, blob_max_bytes) if blob_max_bytes else DRIVER_STREAM_THRESHOLD
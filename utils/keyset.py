@@ -0,0 +1,117 @@
+"""
+Persisted sorted key sets for deletion detection.
+
+The keys of the last successful run of a table are stored as a gzip file with one
+JSON-encoded key per line in sorted order. Detecting deleted records is then a
+single merge walk over the stored file (streamed from disk) and the sorted keys
+of the current extract, so the previous key set is never loaded into memory.
+"""
+import gzip
+import json
+import os
+import re
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from utils.transformers import find_key_value
+
+
+def key_token(record: Dict[str, Any], key_field: str = "external_id") -> Optional[str]:
+    """
+    Return the canonical token for a record key, or None if the record has no key.
+
+    Strings are lowercased like the API payload, other values keep their JSON type,
+    so the token can be decoded back into the value that was uploaded.
+    """
+    value = find_key_value(record, key_field)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.lower()
+    elif isinstance(value, Decimal):
+        value = int(value) if value == value.to_integral_value() else float(value)
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def merge_records(streams: Iterable[Iterable[Dict[str, Any]]], key_field: str = "external_id") -> Iterator[Dict[str, Any]]:
+    """
+    Merge record streams, dropping records whose key token was already produced by an earlier stream.
+
+    Streams are consumed lazily in order, so the first stream has priority. Only the
+    set of seen key tokens is kept in memory. Records without a key are passed through.
+    Keys compare like deletion detection and the replay cache compare them (key_token).
+    """
+    seen = set()
+    for stream in streams:
+        for record in stream:
+            token = key_token(record, key_field)
+            if token is None:
+                yield record
+                continue
+            if token in seen:
+                continue
+            seen.add(token)
+            yield record
+
+
+def sorted_unique(tokens: Iterable[Optional[str]]) -> List[str]:
+    """Return the distinct, non-empty tokens in sorted order."""
+    return sorted({token for token in tokens if token is not None})
+
+
+def diff_sorted(previous: Iterable[str], current: List[str]) -> Iterator[str]:
+    """
+    Yield tokens present in the sorted stream previous but missing from the sorted list current.
+    """
+    index = 0
+    length = len(current)
+    for token in previous:
+        while index < length and current[index] < token:
+            index += 1
+        if index < length and current[index] == token:
+            continue
+        yield token
+
+
+class KeySetStore:
+    """Stores one sorted key file per table under {state_folder}/keys/."""
+
+    def __init__(self, state_folder: str = "state"):
+        self.folder = os.path.join(state_folder, "keys")
+
+    def _path(self, table_name: str) -> str:
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', table_name)
+        return os.path.join(self.folder, f"{safe_name}.keys.gz")
+
+    def exists(self, table_name: str) -> bool:
+        return os.path.exists(self._path(table_name))
+
+    def iter_keys(self, table_name: str) -> Iterator[str]:
+        """Stream the stored tokens of a table in sorted order."""
+        path = self._path(table_name)
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line:
+                    yield line
+
+    def count(self, table_name: str) -> int:
+        return sum(1 for _ in self.iter_keys(table_name))
+
+    def save(self, table_name: str, tokens: List[str]) -> None:
+        """Atomically replace the stored key set of a table with sorted tokens."""
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(table_name)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=5) as f:
+            for token in tokens:
+                f.write(token)
+                f.write('\n')
+        os.replace(temp_path, path)
+
+
+def decode_token(token: str) -> Any:
+    """Return the key value encoded in a token."""
+    return json.loads(token)
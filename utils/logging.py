@@ -1,74 +1,282 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Dict, Tuple
+
+LOG_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drop identical messages repeated more than `burst` times within `interval` seconds.
+
+    When the message is logged again after the window, the number of suppressed
+    repeats is appended so nothing disappears silently. Off unless an interval is
+    configured (sync.log_rate_limit_seconds), so normal repeated lines are kept.
+    """
+
+    def __init__(self, interval: float = 0.0, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._seen: Dict[Tuple[str, int, str], list] = {}  # key -> [window_start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0:
+            return True
+
+        key = (record.name, record.levelno, str(record.msg))
+        now = record.created
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.interval:
+                suppressed = entry[2] if entry else 0
+                self._seen[key] = [now, 1, 0]
+                if len(self._seen) > 10000:
+                    self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.interval}
+                if suppressed:
+                    record.msg = f"{record.msg} (repeated {suppressed} more times)"
+                return True
+            entry[1] += 1
+            if entry[1] <= self.burst:
+                return True
+            entry[2] += 1
+            return False
+
+
+class _SizeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that stops rotating a file it cannot rename.
+
+    On Windows a log file that another process (a second sync.exe, the GUI) has open
+    cannot be renamed, so size rotation only works for the process that has the file
+    to itself. Instead of failing the rollover on every later record, the file then
+    grows until the next day's file is started.
+    """
+
+    def doRollover(self) -> None:
+        try:
+            super().doRollover()
+        except OSError:
+            self.maxBytes = 0
+            if self.stream is None:
+                self.stream = self._open()
+
+
+class _DailyRotatingFileHandler(logging.Handler):
+    """Routes each logger to its own {name}_YYYYMMDD.log file with size-based rotation."""
+
+    def __init__(self, log_folder: str, max_bytes: int, backup_count: int):
+        super().__init__()
+        self.log_folder = log_folder
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handlers: Dict[str, Tuple[str, logging.Handler]] = {}
+
+    def set_rotation(self, max_bytes: int, backup_count: int) -> None:
+        """Apply new rotation settings to future and already open log files."""
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        for _, handler in self._handlers.values():
+            handler.maxBytes = max_bytes
+            handler.backupCount = backup_count
+
+    def emit(self, record: logging.LogRecord) -> None:
+        day = time.strftime('%Y%m%d', time.localtime(record.created))
+        current = self._handlers.get(record.name)
+        if current is None or current[0] != day:
+            if current is not None:
+                current[1].close()
+            # The folder may have been removed since the backend started
+            os.makedirs(self.log_folder, exist_ok=True)
+            log_filepath = os.path.join(self.log_folder, f"{record.name}_{day}.log")
+            handler = _SizeRotatingFileHandler(
+                log_filepath, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8'
+            )
+            handler.setFormatter(self.formatter)
+            current = (day, handler)
+            self._handlers[record.name] = current
+        current[1].emit(record)
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        super().setFormatter(fmt)
+        for _, handler in self._handlers.values():
+            handler.setFormatter(fmt)
+
+    def close(self) -> None:
+        for _, handler in self._handlers.values():
+            handler.close()
+        self._handlers.clear()
+        super().close()
+
+
+class _UnformattedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _LoggingBackend:
+    """Process-wide queue, listener thread and handlers shared by all Logger instances."""
+
+    def __init__(self, log_folder: str):
+        # Absolute, so a later change of the working directory does not move the log files
+        log_folder = os.path.abspath(log_folder)
+        os.makedirs(log_folder, exist_ok=True)
+        self.log_folder = log_folder
+        self.level = logging.INFO
+        self.queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.queue_handler = _UnformattedQueueHandler(self.queue)
+        self.rate_limiter = RateLimitFilter()
+        self.queue_handler.addFilter(self.rate_limiter)
+
+        self.file_handler = _DailyRotatingFileHandler(log_folder, max_bytes=10 * 1024 * 1024, backup_count=5)
+        self.file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        self.console_handler = logging.StreamHandler()
+        self.console_handler.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+
+        self.listener = logging.handlers.QueueListener(
+            self.queue, self.file_handler, self.console_handler, respect_handler_level=True
+        )
+        self.listener.start()
+        self.loggers: Dict[str, logging.Logger] = {}
+        atexit.register(self.stop)
+
+    def attach(self, name: str) -> logging.Logger:
+        logger = logging.getLogger(name)
+        logger.setLevel(self.level)
+        logger.propagate = False
+        if self.queue_handler not in logger.handlers:
+            logger.addHandler(self.queue_handler)
+        self.loggers[name] = logger
+        return logger
+
+    def stop(self) -> None:
+        """Flush queued records and stop the listener thread."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.file_handler.close()
+
+
+_backend: Optional[_LoggingBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _get_backend(log_folder: str) -> _LoggingBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _LoggingBackend(log_folder)
+        return _backend
+
+
+def configure_logging(level: str = "INFO", log_format: str = "text", max_bytes: int = 10 * 1024 * 1024,
+                      backup_count: int = 5, rate_limit_seconds: float = 0.0, rate_limit_burst: int = 5,
+                      log_folder: str = "logs") -> None:
+    """
+    Apply logging settings to the shared backend and all existing loggers.
+
+    Args:
+        level: Minimum level (DEBUG, INFO, WARNING, ERROR), normally sync.log_level
+        log_format: "text" for the classic format or "json" for JSON lines in the log files
+        max_bytes: Size at which a log file is rotated (0 disables rotation)
+        backup_count: Number of rotated files to keep
+        rate_limit_seconds: Window for suppressing repeated identical messages (0 disables)
+        rate_limit_burst: Identical messages allowed per window before suppression
+        log_folder: Folder for the log files
+    """
+    backend = _get_backend(log_folder)
+    backend.level = LOG_LEVELS.get(str(level).upper(), logging.INFO)
+    for logger in backend.loggers.values():
+        logger.setLevel(backend.level)
+
+    backend.rate_limiter.interval = float(rate_limit_seconds)
+    backend.rate_limiter.burst = int(rate_limit_burst)
+
+    backend.file_handler.set_rotation(int(max_bytes), int(backup_count))
+    if str(log_format).lower() == "json":
+        backend.file_handler.setFormatter(JsonLinesFormatter())
+    else:
+        backend.file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
 
 class Logger:
-    """Logging utility for DataSync application."""
-    
+    """
+    Logging utility for DataSync application.
+
+    All loggers share one backend, created by the first Logger of the process, so
+    its log_folder applies to all of them. A different log_folder passed later is
+    ignored with a warning, and log_folder then reports the folder actually used.
+    """
+
     def __init__(self, name: str, log_folder: str = "logs"):
         self.name = name
         self.log_folder = log_folder
         self.logger = self._setup_logger()
-    
+
     def _setup_logger(self) -> logging.Logger:
-        """Setup logger with file and console handlers."""
-        # Create logs directory if it doesn't exist
-        os.makedirs(self.log_folder, exist_ok=True)
-        
-        # Create logger
-        logger = logging.getLogger(self.name)
-        logger.setLevel(logging.INFO)
-        
-        # Avoid duplicate handlers
-        if logger.handlers:
-            return logger
-        
-        # Create formatters
-        file_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        console_formatter = logging.Formatter(
-            '%(levelname)s - %(message)s'
-        )
-        
-        # File handler
-        log_filename = f"{self.name}_{datetime.now().strftime('%Y%m%d')}.log"
-        log_filepath = os.path.join(self.log_folder, log_filename)
-        file_handler = logging.FileHandler(log_filepath, encoding='utf-8')
-        file_handler.setLevel(logging.INFO)
-        file_handler.setFormatter(file_formatter)
-        
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(console_formatter)
-        
-        # Add handlers to logger
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
-        
+        """Attach the logger to the shared queue-based backend."""
+        # Records are queued here and formatted/written by a background listener thread,
+        # so logging never blocks the query or upload loop on disk or console I/O
+        backend = _get_backend(self.log_folder)
+        logger = backend.attach(self.name)
+        if os.path.abspath(self.log_folder) != backend.log_folder:
+            logger.warning(f"Log folder {self.log_folder} ignored, this process logs to {backend.log_folder}")
+            self.log_folder = backend.log_folder
         return logger
-    
+
     def info(self, message: str) -> None:
         """Log info message."""
         self.logger.info(message)
-    
+
     def warning(self, message: str) -> None:
         """Log warning message."""
         self.logger.warning(message)
-    
+
     def error(self, message: str, exception: Optional[Exception] = None) -> None:
         """Log error message."""
         if exception:
             self.logger.error(f"{message}: {str(exception)}", exc_info=True)
         else:
             self.logger.error(message)
-    
+
     def debug(self, message: str) -> None:
         """Log debug message."""
         self.logger.debug(message)
-    
+
     def success(self, message: str) -> None:
         """Log success message as info."""
-        self.logger.info(f"SUCCESS: {message}")
\ No newline at end of file
+        self.logger.info(f"SUCCESS: {message}")
+
+    def is_enabled_for(self, level: str) -> bool:
+        """Return True if messages of the given level would be logged."""
+        return self.logger.isEnabledFor(LOG_LEVELS.get(level.upper(), logging.INFO))
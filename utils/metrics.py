@@ -0,0 +1,304 @@
+"""
+Performance instrumentation for sync runs.
+
+Collects per-table stage timings (query execute, fetch, nest, normalize,
+serialize, compress, upload), HTTP latencies and throughput figures, and
+writes them as a JSON run report next to the log files.
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile (0-100) of values using linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (pct / 100.0) * (len(ordered) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def get_peak_rss_bytes() -> Optional[int]:
+    """Return the peak resident set size of this process in bytes, if available."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return int(counters.PeakWorkingSetSize)
+    except Exception:
+        pass
+
+    return None
+
+
+class TableMetrics:
+    """Timing and throughput figures for a single table (query file)."""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.stages: Dict[str, float] = {}
+        self.rows_extracted = 0
+        self.records_uploaded = 0
+        self.records_deleted = 0
+        self.records_unchanged = 0
+        self.records_rejected = 0
+        self.chunks_skipped = 0
+        self.bytes_sent = 0
+        self.requests = 0
+        self.retries = 0
+        self.http_latencies: List[float] = []
+        self.nest_peak_bytes = 0
+        self.spill_runs = 0
+        self.spilled_bytes = 0
+        self.peak_rss_bytes: Optional[int] = None
+        self.sink: Optional[str] = None
+        # ColumnSpecs (name, type) of the query result, set by the database services
+        self.columns: Optional[list] = None
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.duration_seconds = 0.0
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Context manager that adds the elapsed wall time to the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """Add seconds to the named stage."""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record_request(self, latency_seconds: float, bytes_sent: int) -> None:
+        """Record a single HTTP request attempt."""
+        self.requests += 1
+        self.bytes_sent += bytes_sent
+        self.http_latencies.append(latency_seconds)
+
+    def elapsed(self) -> float:
+        """Seconds since the table started, or its total duration once finished."""
+        return self.duration_seconds or (time.perf_counter() - self._started)
+
+    def finish(self, success: bool, error: Optional[str] = None) -> None:
+        """Mark the table as finished and freeze its total duration."""
+        self.status = "success" if success else "failed"
+        self.error = error
+        self.duration_seconds = time.perf_counter() - self._started
+        self.peak_rss_bytes = get_peak_rss_bytes()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the metrics as a JSON-serializable dictionary."""
+        duration = self.elapsed()
+        latencies = self.http_latencies
+        return {
+            "table": self.table_name,
+            "status": self.status,
+            "error": self.error,
+            "sink": self.sink,
+            "duration_seconds": round(duration, 4),
+            "stages_seconds": {name: round(value, 4) for name, value in self.stages.items()},
+            "rows_extracted": self.rows_extracted,
+            "records_uploaded": self.records_uploaded,
+            "records_deleted": self.records_deleted,
+            "records_unchanged": self.records_unchanged,
+            "records_rejected": self.records_rejected,
+            "chunks_skipped": self.chunks_skipped,
+            "rows_per_second": round(self.rows_extracted / duration, 2) if duration > 0 else 0.0,
+            "bytes_sent": self.bytes_sent,
+            "requests": self.requests,
+            "retries": self.retries,
+            "memory": {
+                "peak_rss_bytes": self.peak_rss_bytes,
+                "nest_peak_bytes": self.nest_peak_bytes,
+                "spill_runs": self.spill_runs,
+                "spilled_bytes": self.spilled_bytes,
+            },
+            "http_latency_seconds": {
+                "p50": round(percentile(latencies, 50), 4),
+                "p90": round(percentile(latencies, 90), 4),
+                "p99": round(percentile(latencies, 99), 4),
+                "max": round(max(latencies), 4) if latencies else 0.0,
+            },
+        }
+
+
+class RunMetrics:
+    """Collection of table metrics for one sync run."""
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.tables: Dict[str, TableMetrics] = {}
+        self._started = time.perf_counter()
+        self.duration_seconds = 0.0
+
+    def table(self, table_name: str) -> TableMetrics:
+        """Return (creating if needed) the metrics for a table."""
+        if table_name not in self.tables:
+            self.tables[table_name] = TableMetrics(table_name)
+        return self.tables[table_name]
+
+    def finish(self) -> None:
+        """Freeze the run duration."""
+        self.finished_at = datetime.now()
+        self.duration_seconds = time.perf_counter() - self._started
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the run report as a JSON-serializable dictionary."""
+        tables = [metrics.to_dict() for metrics in self.tables.values()]
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": self.finished_at.isoformat(timespec="seconds") if self.finished_at else None,
+            "duration_seconds": round(self.duration_seconds, 4),
+            "peak_rss_bytes": get_peak_rss_bytes(),
+            "rows_extracted": sum(t["rows_extracted"] for t in tables),
+            "records_uploaded": sum(t["records_uploaded"] for t in tables),
+            "bytes_sent": sum(t["bytes_sent"] for t in tables),
+            "tables": tables,
+        }
+
+
+def timed(metrics: Optional[TableMetrics], stage: str):
+    """Return a stage timer for metrics, or a no-op context when metrics is None."""
+    if metrics is None:
+        return nullcontext()
+    return metrics.stage(stage)
+
+
+@contextmanager
+def _history_lock(history_path: str, timeout: float = 5.0, stale_seconds: float = 60.0):
+    """
+    Hold {history_path}.lock while the history file is appended to or trimmed, so
+    several processes (tenants, a manual run next to the daemon) sharing the log
+    folder do not lose each other's lines. Yields whether the lock was taken; after
+    timeout the caller goes ahead without it (an append is still safe, a trim is not).
+    """
+    lock_path = f"{history_path}.lock"
+    deadline = time.monotonic() + timeout
+    fd = None
+    while fd is None:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_seconds:
+                    os.remove(lock_path)  # left behind by a process that died while holding it
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+    try:
+        yield fd is not None
+    finally:
+        if fd is not None:
+            os.close(fd)
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+
+def _trim_history(history_path: str, history_limit: int) -> None:
+    """Keep the last history_limit lines of the history file (the caller holds the history lock)."""
+    with open(history_path, 'r', encoding='utf-8') as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    temp_path = f"{history_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines[-history_limit:]) + "\n")
+    os.replace(temp_path, history_path)
+
+
+def write_run_report(report: Dict[str, Any], log_folder: str = "logs", history_limit: int = 500,
+                     prefix: str = "run_report") -> str:
+    """
+    Write the run report as JSON and append a summary to the rolling history file.
+
+    Args:
+        report: Run report as returned by RunMetrics.to_dict()
+        log_folder: Folder to write the report into (same folder as the logs)
+        history_limit: Maximum number of runs kept in run_history.jsonl
+        prefix: File name prefix of the report (run_report_<tenant> in multi-tenant mode)
+
+    Returns:
+        Path to the written report file
+    """
+    os.makedirs(log_folder, exist_ok=True)
+
+    # The PID keeps reports of processes that finish in the same second apart
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(log_folder, f"{prefix}_{timestamp}_{os.getpid()}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+
+    summary = {
+        "started_at": report.get("started_at"),
+        "duration_seconds": report.get("duration_seconds"),
+        "peak_rss_bytes": report.get("peak_rss_bytes"),
+        "rows_extracted": report.get("rows_extracted"),
+        "bytes_sent": report.get("bytes_sent"),
+        "tables": {
+            table["table"]: {
+                "status": table["status"],
+                "duration_seconds": table["duration_seconds"],
+                "rows_per_second": table["rows_per_second"],
+                "http_p90": table["http_latency_seconds"]["p90"],
+            }
+            for table in report.get("tables", [])
+        },
+    }
+
+    if report.get("tenant"):
+        summary["tenant"] = report["tenant"]
+    if report.get("lock"):
+        summary["lock"] = report["lock"]
+
+    history_path = os.path.join(log_folder, "run_history.jsonl")
+    line = json.dumps(summary, ensure_ascii=False, default=str) + "\n"
+    with _history_lock(history_path) as locked:
+        with open(history_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+        # Trim only once the file holds about twice the limit, not after every run
+        if locked and os.path.getsize(history_path) > 2 * history_limit * len(line.encode('utf-8')):
+            _trim_history(history_path, history_limit)
+
+    return report_path
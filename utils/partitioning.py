@@ -0,0 +1,187 @@
+"""
+Key-range partitioned extraction of a single query over several connections.
+
+The query is wrapped as a derived table and split into N disjoint ranges of a
+numeric key column (normally "parent-id"), whose bounds come from one quick
+MIN/MAX query on the driving table (-- @partition_bounds). Because every
+parent-id value falls into exactly one range, each partition contains complete
+parent groups and nesting stays correct. Partitions are yielded in key order
+into the transform/upload pipeline as they finish.
+
+Range bounds are bound as the :range_lo and :range_hi query parameters, so all
+partitions share one statement text (and one cached prepared statement). A query
+file that uses :range_lo/:range_hi itself is not wrapped; it applies the range
+where it is most selective.
+"""
+import re
+import time
+from decimal import Decimal
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from utils.metrics import TableMetrics, timed
+from utils.sql import compile_named_params, split_order_by, quote_identifier
+
+# Bounds bound to a query that filters on :range_lo/:range_hi itself while its MIN/MAX is determined
+_FULL_RANGE = {"range_lo": -2 ** 63, "range_hi": 2 ** 63 - 1}
+
+
+def split_range(low: int, high: int, count: int) -> List[Tuple[int, int]]:
+    """Split the inclusive range [low, high] into at most count half-open ranges [lo, hi)."""
+    count = max(1, min(count, high - low + 1))
+    step = -(-(high - low + 1) // count)  # ceiling division
+    ranges = []
+    start = low
+    while start <= high:
+        end = min(start + step, high + 1)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def build_bounds_query(sql: str, key: str, bounds: Optional[str] = None) -> str:
+    """
+    Return a query selecting the MIN and MAX of the partition key.
+
+    bounds is the declared bounds source: a complete query (SELECT MIN(...), MAX(...) ...)
+    or table.column of the driving table, e.g. production_orders.objectid. Without it
+    the MIN/MAX is taken over the result of sql, which evaluates the whole query once.
+    """
+    if bounds:
+        bounds = bounds.strip().rstrip(";")
+        if re.match(r'(?is)^(select|with)\s', bounds):
+            return bounds
+        table, _, column = bounds.rpartition(".")
+        if not table or not column:
+            raise ValueError(f"Partition bounds must be a query or table.column, got {bounds!r}")
+        return f"SELECT MIN({column}) AS range_lo, MAX({column}) AS range_hi FROM {table}"
+    body, _ = split_order_by(sql)
+    column = f"partition_q.{quote_identifier(key)}"
+    return f"SELECT MIN({column}) AS range_lo, MAX({column}) AS range_hi FROM (\n{body}\n) partition_q"
+
+
+def build_probe_query(sql: str) -> str:
+    """Return sql wrapped so that it returns no rows, to read its column types cheaply."""
+    body, _ = split_order_by(sql)
+    return f"SELECT * FROM (\n{body}\n) partition_q WHERE 1 = 0"
+
+
+def _integer_key_type(columns, key: str) -> Optional[bool]:
+    """Return whether the key column can hold integers, or None if the driver did not tell."""
+    for column in columns or ():
+        if column.name.lower() == key.lower() and column.type_code is not None:
+            return issubclass(column.type_code, (int, float, Decimal)) and not issubclass(column.type_code, bool)
+    return None
+
+
+def uses_range_params(sql: str) -> bool:
+    """Return True if sql filters on the :range_lo/:range_hi parameters itself."""
+    _, names = compile_named_params(sql)
+    return "range_lo" in names and "range_hi" in names
+
+
+def build_range_query(sql: str, key: str, dialect: str) -> str:
+    """
+    Return sql restricted to :range_lo <= key < :range_hi.
+
+    The original ORDER BY is kept inside the derived table so rows arrive in the
+    same order as an unpartitioned run (SQL Server needs OFFSET 0 ROWS for that).
+    """
+    body, order_by = split_order_by(sql)
+    if order_by and dialect == "sqlserver":
+        order_by = f"{order_by} OFFSET 0 ROWS"
+    inner = f"{body}\n{order_by}" if order_by else body
+    column = f"partition_q.{quote_identifier(key)}"
+    return (
+        f"SELECT * FROM (\n{inner}\n) partition_q "
+        f"WHERE {column} >= :range_lo AND {column} < :range_hi"
+    )
+
+
+def fetch_partitioned(service, sql: str, key: str, partitions: int,
+                      metrics: Optional[TableMetrics] = None, logger=None,
+                      params: Optional[Dict[str, Any]] = None,
+                      bounds: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Execute sql as `partitions` parallel key-range queries on service and yield the rows.
+
+    Every range runs on its own pooled connection. Partitions are yielded in key-range
+    order as soon as they and the ones before them are done, so the output matches an
+    unpartitioned run that is ordered by the key, and each partition's rows are released
+    once they were consumed.
+
+    bounds declares a cheap bounds query (see build_bounds_query). Without it the column
+    types of sql are probed first, so a key that is not numeric runs unpartitioned
+    without evaluating the query for its bounds. Falls back to a single query when the
+    key bounds are empty or not integers. Named query parameters in params are bound in
+    every range query.
+    """
+    params = dict(params or {})
+    in_query = uses_range_params(sql)
+    full_params = {**params, **_FULL_RANGE} if in_query else params
+
+    def unpartitioned() -> Iterator[Dict[str, Any]]:
+        if logger:
+            logger.warning(f"Partition key {key} is not an integer column, running unpartitioned")
+        if hasattr(service, "iter_query"):
+            return service.iter_query(sql, metrics, full_params)
+        return iter(service.execute_query(sql, metrics, full_params))
+
+    if not bounds:
+        probe = TableMetrics("partition_probe")
+        with timed(metrics, "partition_bounds"):
+            service.execute_query(build_probe_query(sql), probe, full_params)
+        if _integer_key_type(probe.columns, key) is False:
+            yield from unpartitioned()
+            return
+        if logger:
+            logger.warning(f"No partition bounds declared, MIN/MAX of {key} is taken over the whole query; "
+                           f"declare -- @partition_bounds: table.column for a quick bounds query")
+    with timed(metrics, "partition_bounds"):
+        result = service.execute_query(build_bounds_query(sql, key, bounds), None, full_params)
+    low, high = list(result[0].values())[:2] if result else (None, None)
+
+    if low is None or high is None:
+        return
+    if isinstance(low, (float, Decimal)) and low == int(low) and high == int(high):
+        low, high = int(low), int(high)
+    if not isinstance(low, int) or not isinstance(high, int):
+        yield from unpartitioned()
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    ranges = split_range(low, high, partitions)
+    range_sql = sql if in_query else build_range_query(sql, key, getattr(service, "dialect", ""))
+    if logger:
+        logger.info(f"Extracting {key} {low}..{high} in {len(ranges)} parallel partitions")
+
+    partition_metrics = [TableMetrics(f"partition_{index}") for index in range(len(ranges))]
+    started = time.perf_counter()
+    finished: List[float] = []
+    with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="partition") as executor:
+        futures = [
+            executor.submit(service.execute_query, range_sql, partition, {**params, "range_lo": lo, "range_hi": hi})
+            for (lo, hi), partition in zip(ranges, partition_metrics)
+        ]
+        for future in futures:
+            future.add_done_callback(lambda _: finished.append(time.perf_counter()))
+        try:
+            for index in range(len(futures)):
+                rows = futures[index].result()
+                futures[index] = None  # drop the reference, so the rows are freed once yielded
+                if index == 0 and metrics is not None:
+                    # Before the first row, like the services do for an unpartitioned query
+                    metrics.columns = partition_metrics[0].columns
+                yield from rows
+                del rows
+        finally:
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+
+    if metrics is not None:
+        # Stage times are summed over partitions (database time); the wall time is reported separately
+        for partition in partition_metrics:
+            for stage, seconds in partition.stages.items():
+                metrics.add_time(stage, seconds)
+        metrics.add_time("partitioned_extract_wall", max(finished, default=started) - started)
@@ -0,0 +1,214 @@
+"""
+Payload minimization before upload.
+
+    -- @minimize: nulls      drop fields that are None
+    -- @minimize: defaults   also drop empty strings and empty child arrays
+    -- @patch: true          send only the fields that changed since the last run
+
+Fields are dropped at every nesting level; the key field is always kept. In patch
+mode a snapshot of field fingerprints (8-byte hashes, not values) of the records
+last sent is kept per table in {state_folder}/snapshots/. Unchanged records are not
+sent at all, changed records only carry their key and the changed fields (a field
+that disappeared is sent as null), new records are sent whole. The snapshot is
+only replaced after the upload succeeded. Patched records are uploaded in key
+order (sorted within sync.memory_budget_mb), so they can be compared with the
+key-sorted snapshot in one pass instead of holding it in memory.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from utils.keyset import key_token
+
+MINIMIZE_MODES = ("none", "nulls", "defaults")
+
+_EMPTY_DEFAULTS = ("", [], {})
+
+
+def minimize_record(record: Dict[str, Any], mode: str, key_field: str = "external_id") -> Dict[str, Any]:
+    """Return record without null (mode nulls) or default-valued (mode defaults) fields."""
+    drop_defaults = mode == "defaults"
+    key_lower = key_field.lower()
+    result = {}
+    for name, value in record.items():
+        if isinstance(value, list):
+            value = [minimize_record(item, mode, key_field) if isinstance(item, dict) else item for item in value]
+        if str(name).lower() != key_lower and (value is None or (drop_defaults and value in _EMPTY_DEFAULTS)):
+            continue
+        result[name] = value
+    return result
+
+
+def minimize_records(records: Iterable[Dict[str, Any]], mode: str,
+                     key_field: str = "external_id") -> Iterator[Dict[str, Any]]:
+    """Yield the minimized records (unchanged when mode is none)."""
+    if mode not in ("nulls", "defaults"):
+        yield from records
+        return
+    for record in records:
+        yield minimize_record(record, mode, key_field)
+
+
+def _fingerprint(value: Any) -> int:
+    canonical = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":"))
+    return int.from_bytes(hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class PatchSnapshot:
+    """
+    The field fingerprints of the records last sent for one table.
+
+    The snapshot file is sorted by key token, so records passed in the same order
+    (key_sort_token) are compared with it in a single merge pass: the previous
+    snapshot is read and the current one is written while the records go by, and
+    only the fingerprints of one record of each are held in memory.
+    """
+
+    FORMAT = 2  # header {"format": 2}: entries sorted by token, one per token
+
+    def __init__(self, state_folder: str, table_name: str, key_field: str = "external_id"):
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', table_name)
+        self.path = os.path.join(state_folder, "snapshots", f"{safe_name}.snapshot.gz")
+        self.key_field = key_field
+        self.new = 0
+        self.patched = 0
+        self.unchanged = 0
+        self.forgotten: Set[str] = set()
+        self.damaged = False  # the stored snapshot could not be read to the end
+        self._previous = self._read_previous()
+        self._ahead: Optional[Tuple[str, Dict[str, int]]] = next(self._previous, None)
+        self._last_token: Optional[str] = None
+        self._pending: Optional[Tuple[str, Dict[str, int]]] = None  # a later record with the same key replaces it
+        self._temp_path = f"{self.path}.{os.getpid()}.tmp"
+        self._file = None
+
+    def _read_previous(self) -> Iterator[Tuple[str, Dict[str, int]]]:
+        """
+        Yield the stored (token, fields) entries in token order.
+
+        A damaged file (interrupted copy, disk error) ends the entries where it becomes
+        unreadable: the records after that point are sent whole, and the snapshot
+        written by this run replaces the damaged one.
+        """
+        try:
+            yield from self._read_entries()
+        except (OSError, EOFError, ValueError, TypeError, zlib.error):
+            self.damaged = True
+
+    def _read_entries(self) -> Iterator[Tuple[str, Dict[str, int]]]:
+        if not os.path.exists(self.path):
+            return
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            entries = (json.loads(line) for line in f if line.strip())
+            first = next(entries, None)
+            if isinstance(first, dict):
+                for token, fields in entries:
+                    yield token, fields
+                return
+            # Written before snapshots were sorted: sort it in memory once, the next save is sorted
+            legacy = {} if first is None else {first[0]: first[1]}
+            for token, fields in entries:
+                legacy[token] = fields
+        for token in sorted(legacy):
+            yield token, legacy[token]
+
+    def _previous_fields(self, token: str) -> Optional[Dict[str, int]]:
+        while self._ahead is not None and self._ahead[0] < token:
+            self._ahead = next(self._previous, None)
+        if self._ahead is not None and self._ahead[0] == token:
+            return self._ahead[1]
+        return None
+
+    def _open_temp(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = gzip.open(self._temp_path, 'wt', encoding='utf-8', compresslevel=5)
+        self._file.write(json.dumps({"format": self.FORMAT}) + '\n')
+
+    def _write(self, token: str, fields: Dict[str, int]) -> None:
+        if self._file is None:
+            self._open_temp()
+        self._file.write(json.dumps([token, fields], separators=(",", ":")))
+        self._file.write('\n')
+
+    def patch(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return what to send for record: itself, only its changes, or None if it is unchanged."""
+        token = key_token(record, self.key_field)
+        if token is None:
+            return record
+        if self._last_token is not None and token < self._last_token:
+            raise ValueError(f"Patch records must be in key order: {token} came after {self._last_token}")
+        self._last_token = token
+        fields = {str(name): _fingerprint(value) for name, value in record.items()}
+        if self._pending is not None and self._pending[0] != token:
+            self._write(*self._pending)
+        self._pending = (token, fields)
+        previous = self._previous_fields(token)
+        if previous is None:
+            self.new += 1
+            return record
+
+        key_lower = self.key_field.lower()
+        changes = {}
+        for name, value in record.items():
+            if str(name).lower() == key_lower:
+                changes[name] = value
+            elif previous.get(str(name)) != fields[str(name)]:
+                changes[name] = value
+        cleared = [name for name in previous if name not in fields]
+        if len(changes) <= 1 and not cleared:
+            self.unchanged += 1
+            return None
+        for name in cleared:
+            changes[name] = None
+        self.patched += 1
+        return changes
+
+    def patch_all(self, records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield the patches of records (in key order), skipping unchanged records."""
+        for record in records:
+            patch = self.patch(record)
+            if patch is not None:
+                yield patch
+
+    def forget(self, record: Dict[str, Any]) -> None:
+        """Leave record out of the current snapshot, so a rejected record is sent whole next run."""
+        token = key_token(record, self.key_field)
+        if token is not None:
+            self.forgotten.add(token)
+
+    def save(self) -> None:
+        """Atomically replace the stored snapshot with the records seen in this run."""
+        if self._pending is not None:
+            self._write(*self._pending)
+            self._pending = None
+        if self._file is None:
+            self._open_temp()
+        self._file.close()
+        self._file = None
+        self._previous.close()  # the stored file is replaced below, which Windows refuses while it is open
+        if self.forgotten:
+            self._drop_forgotten()
+        os.replace(self._temp_path, self.path)
+
+    def _drop_forgotten(self) -> None:
+        filtered_path = f"{self._temp_path}.filtered"
+        with gzip.open(self._temp_path, 'rt', encoding='utf-8') as source, \
+                gzip.open(filtered_path, 'wt', encoding='utf-8', compresslevel=5) as target:
+            for index, line in enumerate(source):
+                if index and json.loads(line)[0] in self.forgotten:
+                    continue
+                target.write(line)
+        os.replace(filtered_path, self._temp_path)
+
+    def discard(self) -> None:
+        """Keep the stored snapshot (failed upload or dry run) and remove this run's partial one."""
+        self._previous.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
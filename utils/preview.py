@@ -0,0 +1,46 @@
+"""
+Query preview for the GUI: a capped run of a query file with its plan and timings.
+"""
+import itertools
+from typing import Any, Dict, Optional
+
+from utils.metrics import TableMetrics
+from utils.sql import build_preview_query
+from utils.transformers import auto_nest_data
+
+
+def preview_query(service, sql: str, limit: int = 100, params: Optional[Dict[str, Any]] = None,
+                  nest: bool = True) -> Dict[str, Any]:
+    """
+    Run sql on service capped at limit rows and return the rows, the nested records,
+    the query plan and the connect/execute/fetch times.
+
+    The plan is that of the uncapped query, i.e. what a sync run would execute. A
+    plan that cannot be produced is reported as plan_error instead of failing the preview.
+    """
+    metrics = TableMetrics("preview")
+    capped_sql = build_preview_query(sql, limit, getattr(service, "dialect", ""))
+    if capped_sql is None:
+        rows = list(itertools.islice(service.iter_query(sql, metrics, params), limit))
+    else:
+        rows = service.execute_query(capped_sql, metrics, params)
+
+    plan, plan_error = "", None
+    explain = getattr(service, "explain", None)
+    if explain is not None:
+        try:
+            plan = explain(sql, params)
+        except Exception as e:
+            plan_error = str(e)
+
+    with metrics.stage("nest"):
+        records = auto_nest_data(rows) if nest and rows else rows
+    return {
+        "rows": rows,
+        "records": records,
+        "capped": capped_sql is not None,
+        "limit": limit,
+        "plan": plan,
+        "plan_error": plan_error,
+        "stages_seconds": {name: round(seconds, 4) for name, seconds in metrics.stages.items()},
+    }
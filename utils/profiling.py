@@ -0,0 +1,75 @@
+"""
+Opt-in per-table profiling with cProfile and tracemalloc.
+
+Only used when sync.py runs with --profile; nothing in this module is touched otherwise.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class TableProfiler:
+    """Writes a .pstats file and a top-N allocation report per profiled table."""
+
+    def __init__(self, output_folder: str = os.path.join("logs", "profiles"), top_n: int = 25):
+        self.output_folder = output_folder
+        self.top_n = top_n
+        os.makedirs(self.output_folder, exist_ok=True)
+
+    @contextmanager
+    def profile(self, table_name: str):
+        """Profile the wrapped block and write the reports, even if the block raises."""
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            self._write_reports(table_name, profiler, before, after, peak)
+
+    def _write_reports(self, table_name: str, profiler: cProfile.Profile,
+                       before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, peak: int) -> None:
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', table_name)
+        base_path = os.path.join(self.output_folder, f"{safe_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+        profiler.dump_stats(f"{base_path}.pstats")
+
+        hotspots = io.StringIO()
+        pstats.Stats(profiler, stream=hotspots).sort_stats("cumulative").print_stats(self.top_n)
+
+        # Ignore allocations made by the profilers themselves
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        growth = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        largest = after.filter_traces(filters).statistics("lineno")
+
+        with open(f"{base_path}_memory.txt", 'w', encoding='utf-8') as f:
+            f.write(f"Table: {table_name}\n")
+            f.write(f"Peak traced memory: {peak / (1024 * 1024):.1f} MiB\n\n")
+            f.write(f"Top {self.top_n} allocation growth during sync:\n")
+            for stat in growth[:self.top_n]:
+                f.write(f"  {stat}\n")
+            f.write(f"\nTop {self.top_n} live allocations after sync:\n")
+            for stat in largest[:self.top_n]:
+                f.write(f"  {stat}\n")
+            f.write("\nCPU hotspots (cumulative):\n")
+            f.write(hotspots.getvalue())
@@ -0,0 +1,276 @@
+"""
+Minimal Prometheus/OpenMetrics exposition without external dependencies.
+
+Provides counters, gauges and histograms with labels, a textfile writer for the
+node_exporter textfile collector and a background HTTP server for /metrics.
+"""
+import bisect
+import math
+import threading
+from typing import Dict, List, Tuple, Optional, Iterable, Union, TYPE_CHECKING
+
+from utils.state import atomic_write_text
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None,
+                   const: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in const]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for a labelled metric family."""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Labels of the registry (e.g. the tenant), added to every sample
+        self.const_labels: Tuple[Tuple[str, str], ...] = ()
+        self._lock = threading.Lock()
+
+    def _labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        return _format_labels(self.labelnames, key, extra, self.const_labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        raise NotImplementedError
+
+    def header(self, openmetrics: bool = False) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+    def render(self, openmetrics: bool = False) -> List[str]:
+        return self.header(openmetrics) + self.samples(openmetrics)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        # The family name of an OpenMetrics counter has no _total suffix, samples do
+        sample_name = self.name if self.name.endswith("_total") else f"{self.name}_total"
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{sample_name}{self._labels(key)} {_format_value(value)}" for key, value in items]
+
+    def header(self, openmetrics: bool = False) -> List[str]:
+        family = self.name[:-len("_total")] if openmetrics and self.name.endswith("_total") else self.name
+        return [f"# HELP {family} {self.documentation}", f"# TYPE {family} counter"]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = self._labels(key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = self._labels(key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _render(registries: Iterable["Registry"], openmetrics: bool) -> str:
+    """Render the families of registries, each family once with the samples of all registries."""
+    families: Dict[str, List[_Metric]] = {}
+    for registry in registries:
+        for metric in registry.metrics:
+            families.setdefault(metric.name, []).append(metric)
+    lines: List[str] = []
+    for metrics in families.values():
+        lines.extend(metrics[0].header(openmetrics))
+        for metric in metrics:
+            lines.extend(metric.samples(openmetrics))
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class Registry:
+    """Collection of metric families rendered together."""
+
+    def __init__(self, labels: Optional[Dict[str, str]] = None):
+        """labels are added to every sample, e.g. {"tenant": "acme"}."""
+        self.labels = tuple((labels or {}).items())
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        metric.const_labels = self.labels
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, openmetrics: bool = False) -> str:
+        return _render([self], openmetrics)
+
+    def write_textfile(self, path: str) -> None:
+        """Write metrics atomically for the node_exporter/windows_exporter textfile collector."""
+        atomic_write_text(path, self.render())
+
+
+class MultiRegistry:
+    """Several registries (one per tenant) exposed as one, told apart by their labels."""
+
+    def __init__(self, registries: Iterable[Registry]):
+        self.registries = list(registries)
+
+    def render(self, openmetrics: bool = False) -> str:
+        return _render(self.registries, openmetrics)
+
+
+def start_http_server(registry: Union[Registry, MultiRegistry], host: str = "127.0.0.1", port: int = 9464) -> "ThreadingHTTPServer":
+    """Serve registry on http://host:port/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = registry.render(openmetrics).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Keep scrape requests out of the console and log files
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
+
+
+class SyncMetrics:
+    """Prometheus metric families describing sync runs."""
+
+    def __init__(self, prefix: str = "taskform_sync", labels: Optional[Dict[str, str]] = None):
+        self.registry = Registry(labels)
+        r = self.registry
+        self.rows_extracted = r.register(Counter(f"{prefix}_rows_extracted_total", "Rows extracted from the database.", ["table"]))
+        self.records_uploaded = r.register(Counter(f"{prefix}_records_uploaded_total", "Records uploaded to the API.", ["table"]))
+        self.records_deleted = r.register(Counter(f"{prefix}_records_deleted_total", "Records deleted via deletion detection.", ["table"]))
+        self.records_rejected = r.register(Counter(f"{prefix}_records_rejected_total", "Records written to the dead-letter folder.", ["table"]))
+        self.bytes_sent = r.register(Counter(f"{prefix}_bytes_sent_total", "Request body bytes sent to the API.", ["table"]))
+        self.retries = r.register(Counter(f"{prefix}_retries_total", "API request retries.", ["table"]))
+        self.table_runs = r.register(Counter(f"{prefix}_table_runs_total", "Table syncs by outcome.", ["table", "status"]))
+        self.table_duration = r.register(Histogram(f"{prefix}_table_duration_seconds", "Duration of a table sync.", ["table"]))
+        self.api_latency = r.register(Histogram(
+            f"{prefix}_api_request_duration_seconds", "Latency of API bulk requests.", ["table"],
+            buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+        ))
+        self.last_success = r.register(Gauge(
+            f"{prefix}_table_last_success_timestamp_seconds", "Unix time of the last successful table sync.", ["table"]
+        ))
+        self.last_status = r.register(Gauge(f"{prefix}_table_last_run_success", "1 if the last table sync succeeded.", ["table"]))
+        self.runs = r.register(Counter(f"{prefix}_runs_total", "Sync runs by outcome.", ["status"]))
+        self.last_run = r.register(Gauge(f"{prefix}_last_run_timestamp_seconds", "Unix time the last sync run finished."))
+        self.last_run_duration = r.register(Gauge(f"{prefix}_last_run_duration_seconds", "Duration of the last sync run."))
+
+    def observe_table(self, metrics, last_success: Optional[float] = None) -> None:
+        """Record a finished TableMetrics instance."""
+        table = metrics.table_name
+        self.rows_extracted.inc(metrics.rows_extracted, table=table)
+        self.records_uploaded.inc(metrics.records_uploaded, table=table)
+        self.records_deleted.inc(metrics.records_deleted, table=table)
+        self.records_rejected.inc(metrics.records_rejected, table=table)
+        self.bytes_sent.inc(metrics.bytes_sent, table=table)
+        self.retries.inc(metrics.retries, table=table)
+        self.table_runs.inc(1, table=table, status=metrics.status)
+        self.table_duration.observe(metrics.duration_seconds, table=table)
+        for latency in metrics.http_latencies:
+            self.api_latency.observe(latency, table=table)
+        self.last_status.set(1 if metrics.status == "success" else 0, table=table)
+        if last_success is not None:
+            self.last_success.set(last_success, table=table)
+
+    def observe_run(self, success: bool, finished_at: float, duration_seconds: float) -> None:
+        """Record the outcome of a full sync run."""
+        self.runs.inc(1, status="success" if success else "failed")
+        self.last_run.set(finished_at)
+        self.last_run_duration.set(duration_seconds)
@@ -0,0 +1,250 @@
+"""
+Per-query settings declared in a header block at the top of a .sql file.
+
+    -- @key: external_id
+    -- @source: firebird
+    -- @batch_bytes: 2MB
+    -- @interval: 5m
+    SELECT ...
+
+The header is the run of comment lines before the first SQL line. Settings are
+parsed once and cached in memory and in a small index file keyed by the file's
+mtime, size and content hash, so the daemon and the GUI only re-read and re-parse
+files that changed.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from utils.state import atomic_write_text
+
+_HEADER_LINE = re.compile(r'^--\s*@([A-Za-z_][A-Za-z0-9_]*)\s*:?\s*(.*?)\s*$')
+_SIZE = re.compile(r'^(\d+(?:\.\d+)?)\s*([KMG]?)I?B?$', re.IGNORECASE)
+_DURATION = re.compile(r'^(\d+(?:\.\d+)?)\s*(S|SEC|M|MIN|H|HOUR|D|DAY)?S?$', re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+_DURATION_UNITS = {"S": 1, "SEC": 1, "M": 60, "MIN": 60, "H": 3600, "HOUR": 3600, "D": 86400, "DAY": 86400}
+
+INDEX_VERSION = 1
+
+
+def parse_header(sql: str) -> Dict[str, str]:
+    """Return the raw @name: value pairs from the leading comment block of sql."""
+    values: Dict[str, str] = {}
+    for line in sql.lstrip('\ufeff').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("--"):
+            break
+        match = _HEADER_LINE.match(line)
+        if match:
+            values[match.group(1).lower()] = match.group(2)
+    return values
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte size such as 500000, 512KB or 2MB."""
+    match = _SIZE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def parse_duration(value: str) -> float:
+    """Parse a duration in seconds such as 90, 90s, 5m, 1h or 1d (plain numbers are seconds)."""
+    match = _DURATION.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    return float(match.group(1)) * _DURATION_UNITS[(match.group(2) or "S").upper()]
+
+
+def _parse_bool(value: str) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on", "ja")
+
+
+class QuerySettings:
+    """
+    Settings of one query file. Attributes are None when the header does not set them,
+    so callers fall back to the configuration.
+
+    Supported header keys: key, source, nest (auto/none), batch_size, batch_bytes,
+    interval, partition_key, partitions, partition_bounds, detect_deletions, delete_mode, memory_budget,
+    sink, initial_sink, minimize (none/nulls/defaults), patch, validate, sort_by_key and
+    chunk_digests.
+    """
+
+    def __init__(self, table_name: str, header: Optional[Dict[str, str]] = None):
+        self.table_name = table_name
+        self.header = dict(header or {})
+        self.errors: List[str] = []
+
+        self.key: Optional[str] = None
+        self.source: Optional[str] = None
+        self.nest: Optional[str] = None
+        self.batch_size: Optional[int] = None
+        self.batch_bytes: Optional[int] = None
+        self.interval_seconds: Optional[float] = None
+        self.partition_key: Optional[str] = None
+        self.partitions: Optional[int] = None
+        self.partition_bounds: Optional[str] = None
+        self.detect_deletions: Optional[bool] = None
+        self.delete_mode: Optional[str] = None
+        self.memory_budget: Optional[int] = None
+        self.sink: Optional[str] = None
+        self.initial_sink: Optional[str] = None
+        self.minimize: Optional[str] = None
+        self.patch: Optional[bool] = None
+        self.validate: Optional[bool] = None
+        self.sort_by_key: Optional[bool] = None
+        self.chunk_digests: Optional[bool] = None
+
+        for name, value in self.header.items():
+            try:
+                self._apply(name, value)
+            except ValueError as e:
+                self.errors.append(f"@{name}: {e}")
+
+    def _apply(self, name: str, value: str) -> None:
+        if name == "key":
+            self.key = value
+        elif name == "source":
+            self.source = value.lower()
+        elif name == "nest":
+            if value.lower() not in ("auto", "none"):
+                raise ValueError(f"expected auto or none, got {value}")
+            self.nest = value.lower()
+        elif name == "batch_size":
+            self.batch_size = max(1, int(value))
+        elif name == "batch_bytes":
+            self.batch_bytes = parse_size(value)
+        elif name == "interval":
+            self.interval_seconds = parse_duration(value)
+        elif name == "partition_key":
+            self.partition_key = value
+        elif name == "partitions":
+            self.partitions = int(value)
+        elif name == "partition_bounds":
+            self.partition_bounds = value
+        elif name == "detect_deletions":
+            self.detect_deletions = _parse_bool(value)
+        elif name == "delete_mode":
+            self.delete_mode = value.lower()
+        elif name == "memory_budget":
+            self.memory_budget = parse_size(value)
+        elif name == "sink":
+            self.sink = value.lower()
+        elif name == "initial_sink":
+            self.initial_sink = value.lower()
+        elif name == "minimize":
+            if value.lower() not in ("none", "nulls", "defaults"):
+                raise ValueError(f"expected none, nulls or defaults, got {value}")
+            self.minimize = value.lower()
+        elif name == "patch":
+            self.patch = _parse_bool(value)
+        elif name == "validate":
+            self.validate = _parse_bool(value)
+        elif name == "sort_by_key":
+            self.sort_by_key = _parse_bool(value)
+        elif name == "chunk_digests":
+            self.chunk_digests = _parse_bool(value)
+        else:
+            raise ValueError("unknown setting")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the settings that are set, for logging and the GUI."""
+        return {name: value for name, value in vars(self).items()
+                if name not in ("table_name", "header", "errors") and value is not None}
+
+
+class QueryCatalog:
+    """
+    Lists the .sql files of the queries folder with their parsed settings.
+
+    Files are only read again when their mtime or size changed, and only parsed
+    again when their content hash changed.
+    """
+
+    def __init__(self, index_path: Optional[str] = None):
+        self.index_path = index_path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._settings: Dict[str, QuerySettings] = {}
+        self._dirty = False
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict) and loaded.get("version") == INDEX_VERSION:
+                self._entries = loaded.get("files", {})
+        except Exception as e:
+            print(f"Warning: Could not load query index: {e}")
+
+    def save(self) -> None:
+        """Write the index file if anything changed since it was loaded."""
+        if not self.index_path or not self._dirty:
+            return
+        index = {"version": INDEX_VERSION, "files": self._entries}
+        atomic_write_text(self.index_path, json.dumps(index, indent=2, ensure_ascii=False))
+        self._dirty = False
+
+    def get(self, file_path: str) -> QuerySettings:
+        """Return the settings of a query file, re-parsing it only if it changed."""
+        key = os.path.normcase(os.path.abspath(file_path))
+        table_name = os.path.splitext(os.path.basename(file_path))[0]
+        stat = os.stat(file_path)
+        entry = self._entries.get(key)
+
+        if entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            settings = self._settings.get(key)
+            if settings is None:
+                settings = self._settings[key] = QuerySettings(table_name, entry["header"])
+            return settings
+
+        import hashlib  # only needed when a file changed
+
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+        if entry is None or entry["sha1"] != digest:
+            entry = {"sha1": digest, "header": parse_header(content.decode('utf-8-sig', errors='replace'))}
+            self._settings[key] = QuerySettings(table_name, entry["header"])
+        elif key not in self._settings:
+            self._settings[key] = QuerySettings(table_name, entry["header"])
+        entry.update(mtime=stat.st_mtime, size=stat.st_size)
+        self._entries[key] = entry
+        self._dirty = True
+        return self._settings[key]
+
+    def invalidate(self, file_path: Optional[str] = None) -> None:
+        """Forget a file (or all files) so its header is read again on the next refresh."""
+        if file_path is None:
+            keys = list(self._entries)
+        else:
+            keys = [os.path.normcase(os.path.abspath(file_path))]
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+            self._settings.pop(key, None)
+
+    def for_table(self, table_name: str) -> QuerySettings:
+        """Return the cached settings of a table, or empty settings if its file was not read."""
+        for settings in self._settings.values():
+            if settings.table_name == table_name:
+                return settings
+        return QuerySettings(table_name)
+
+    def refresh(self, file_paths: List[str]) -> List[QuerySettings]:
+        """Refresh the settings of file_paths, forget removed files and save the index."""
+        keys = {os.path.normcase(os.path.abspath(path)) for path in file_paths}
+        for key in list(self._entries):
+            if key not in keys:
+                del self._entries[key]
+                self._settings.pop(key, None)
+                self._dirty = True
+        settings = [self.get(path) for path in file_paths]
+        self.save()
+        return settings
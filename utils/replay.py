@@ -0,0 +1,231 @@
+"""
+Local replay cache of the last successful extract per table (sync.replay_cache).
+
+Each table is stored as three files in {state_folder}/replay/:
+
+    <table>.<generation>.data   one compact JSON record per line
+    <table>.<generation>.idx    sorted fixed-size entries (key hash, offset, length)
+    <table>.meta.json           key field, record count and the current generation
+
+Both data files are memory-mapped when read. A full replay streams the data file;
+a replay of selected keys binary-searches the index and reads only those records.
+A new extract is written under a new generation and becomes current when the
+meta file is replaced, so an interrupted run never damages the previous cache; the
+files it left behind are removed by the next commit. Files whose size does not
+match the meta data are reported as damaged instead of being replayed.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import time
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from utils.transformers import find_key_value
+from utils.state import atomic_write_text
+
+# key hash (8 bytes), data offset (8 bytes), record length (4 bytes), little endian
+_ENTRY_SIZE = 20
+
+
+def lookup_key(value: Any) -> str:
+    """Canonical text of a key value, matching keys given on the command line."""
+    return (value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)).lower()
+
+
+def _stored_key(record: Dict[str, Any], key_field: str) -> Optional[str]:
+    """The lookup key of a record as it reads back from the cache (Decimal keys are stored as text)."""
+    value = find_key_value(record, key_field)
+    if value is None:
+        return None
+    return lookup_key(json.loads(json.dumps(value, ensure_ascii=False, default=str)))
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _safe_name(table_name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', table_name)
+
+
+class ReplayWriter:
+    """Writes one table's extract to a new cache generation; commit() makes it current."""
+
+    def __init__(self, cache: "ReplayCache", table_name: str, key_field: str):
+        self.cache = cache
+        self.table_name = table_name
+        self.key_field = key_field
+        self.generation = time.strftime("%Y%m%d%H%M%S") + f"{time.perf_counter_ns() % 1000000:06d}"
+        os.makedirs(cache.folder, exist_ok=True)
+        self.data_path = cache.path(table_name, f"{self.generation}.data")
+        self.index_path = cache.path(table_name, f"{self.generation}.idx")
+        self._file = open(self.data_path, 'wb')
+        self._offset = 0
+        self._hashes = array('Q')
+        self._offsets = array('Q')
+        self._lengths = array('I')
+
+    def add(self, record: Dict[str, Any]) -> None:
+        data = json.dumps(record, ensure_ascii=False, default=str, separators=(",", ":")).encode('utf-8') + b"\n"
+        self._file.write(data)
+        key = _stored_key(record, self.key_field)
+        self._hashes.append(_key_hash(key) if key is not None else 0)
+        self._offsets.append(self._offset)
+        self._lengths.append(len(data) - 1)
+        self._offset += len(data)
+
+    def tee(self, records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield records unchanged while adding them to the cache."""
+        for record in records:
+            self.add(record)
+            yield record
+
+    def commit(self) -> None:
+        """Write the index and make this generation the table's current cache."""
+        self._file.close()
+        order = sorted(range(len(self._hashes)), key=self._hashes.__getitem__)
+        with open(self.index_path, 'wb') as f:
+            for i in order:
+                f.write(self._hashes[i].to_bytes(8, 'little') + self._offsets[i].to_bytes(8, 'little')
+                        + self._lengths[i].to_bytes(4, 'little'))
+        previous = self.cache.meta(self.table_name)
+        atomic_write_text(self.cache.path(self.table_name, "meta.json"), json.dumps({
+            "table": self.table_name,
+            "key_field": self.key_field,
+            "generation": self.generation,
+            "records": len(self._hashes),
+            "bytes": self._offset,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }, indent=2))
+        if previous:
+            self.cache.remove_generation(self.table_name, previous["generation"])
+        # Generations of runs that were interrupted before commit() or abort()
+        for generation in self.cache.generations(self.table_name):
+            if generation != self.generation:
+                self.cache.remove_generation(self.table_name, generation)
+
+    def abort(self) -> None:
+        """Discard this generation (the previous cache stays current)."""
+        self._file.close()
+        for path in (self.data_path, self.index_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ReplayCache:
+    """The replay caches of all tables in one folder."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def path(self, table_name: str, suffix: str) -> str:
+        return os.path.join(self.folder, f"{_safe_name(table_name)}.{suffix}")
+
+    def meta(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """Return the meta data of a table's current cache, or None if it has none."""
+        path = self.path(table_name, "meta.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def tables(self) -> List[str]:
+        """Return the tables that have a cache."""
+        if not os.path.isdir(self.folder):
+            return []
+        tables = []
+        for name in sorted(os.listdir(self.folder)):
+            if name.endswith(".meta.json"):
+                meta = self.meta(name[:-len(".meta.json")])
+                if meta:
+                    tables.append(meta["table"])
+        return tables
+
+    def writer(self, table_name: str, key_field: str) -> ReplayWriter:
+        return ReplayWriter(self, table_name, key_field)
+
+    def generations(self, table_name: str) -> List[str]:
+        """Return the generations that have files for a table, current or not."""
+        pattern = re.compile(re.escape(_safe_name(table_name)) + r"\.(\d+)\.(?:data|idx)$")
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted({match.group(1) for match in map(pattern.match, os.listdir(self.folder)) if match})
+
+    def remove_generation(self, table_name: str, generation: str) -> None:
+        for suffix in ("data", "idx"):
+            try:
+                os.remove(self.path(table_name, f"{generation}.{suffix}"))
+            except OSError:
+                pass
+
+    @staticmethod
+    def _map(path: str):
+        if os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _checked_path(self, meta: Dict[str, Any], suffix: str, size: int) -> str:
+        """Return the path of a cache file, raising if it is missing or not as large as its meta data says."""
+        path = self.path(meta["table"], f"{meta['generation']}.{suffix}")
+        actual = os.path.getsize(path) if os.path.exists(path) else None
+        if actual != size:
+            raise Exception(f"Replay cache of table {meta['table']} is damaged: {os.path.basename(path)} "
+                            f"has {actual} bytes instead of {size}")
+        return path
+
+    def iter_records(self, table_name: str, keys: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the cached records of a table, or only those whose key is in keys.
+
+        Keys are matched case-insensitively on their text ("500000" matches 500000).
+        """
+        meta = self.meta(table_name)
+        if meta is None:
+            raise Exception(f"No replay cache for table {table_name}")
+        data = self._map(self._checked_path(meta, "data", meta["bytes"]))
+        if data is None:
+            return
+        try:
+            if keys is None:
+                start = 0
+                size = len(data)
+                while start < size:
+                    end = data.find(b"\n", start)
+                    end = size if end == -1 else end
+                    yield json.loads(data[start:end])
+                    start = end + 1
+                return
+
+            index = self._map(self._checked_path(meta, "idx", meta["records"] * _ENTRY_SIZE))
+            if index is None:
+                return
+            try:
+                count = len(index) // _ENTRY_SIZE
+                for key in dict.fromkeys(lookup_key(key) for key in keys):
+                    target = _key_hash(key)
+                    low, high = 0, count
+                    while low < high:
+                        middle = (low + high) // 2
+                        if int.from_bytes(index[middle * _ENTRY_SIZE:middle * _ENTRY_SIZE + 8], 'little') < target:
+                            low = middle + 1
+                        else:
+                            high = middle
+                    while low < count:
+                        entry = index[low * _ENTRY_SIZE:(low + 1) * _ENTRY_SIZE]
+                        if int.from_bytes(entry[:8], 'little') != target:
+                            break
+                        offset = int.from_bytes(entry[8:16], 'little')
+                        record = json.loads(data[offset:offset + int.from_bytes(entry[16:], 'little')])
+                        if _stored_key(record, meta["key_field"]) == key:
+                            yield record
+                        low += 1
+            finally:
+                index.close()
+        finally:
+            data.close()
@@ -0,0 +1,297 @@
+"""
+Cross-process run lock on the state folder, so overlapping runs (a Task Scheduler
+interval shorter than a run, a manual run next to the daemon) do not extract and
+upload the same data twice.
+
+The lock file ({state_folder}/run.lock) is created exclusively and holds the PID,
+host, start time and a heartbeat that a background thread refreshes while the lock
+is held, also during a long query. A lock whose process is gone is taken over, as is
+a lock whose PID now belongs to a process that started after the lock did (the PID
+was reused). A lock whose heartbeat is older than the stale time belongs to a frozen run; what happens then, and when the lock is held by a live run,
+depends on the policy (sync.run_lock):
+
+    skip        do not run (default)
+    queue       wait up to sync.lock_wait_minutes for the lock, then skip
+    kill_stale  terminate a hung holder and take over; skip while the holder is alive
+"""
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from utils.state import atomic_write_text
+
+LOCK_POLICIES = ("skip", "queue", "kill_stale")
+
+
+class RunLockLost(Exception):
+    """Another run took over the lock of this run, so this run must stop writing."""
+
+
+def pid_alive(pid: int) -> bool:
+    """Return whether a process with pid exists on this machine."""
+    if pid <= 0:
+        return False
+    if sys.platform == "win32":
+        # os.kill(pid, 0) would terminate the process on Windows
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5  # access denied: it exists
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def process_start_time(pid: int) -> Optional[float]:
+    """Return when the process with pid started (Unix time), or None if it cannot be determined."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle:
+                return None
+            try:
+                times = [ctypes.c_ulonglong() for _ in range(4)]
+                if not kernel32.GetProcessTimes(handle, *(ctypes.byref(value) for value in times)):
+                    return None
+                # FILETIME: 100 ns intervals since 1601-01-01
+                return times[0].value / 1e7 - 11644473600
+            finally:
+                kernel32.CloseHandle(handle)
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            # The command name (field 2) may contain spaces, the fields after it do not
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat", 'r') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration, AttributeError):
+        return None
+
+
+def pid_reused(pid: int, lock_started: Optional[str]) -> bool:
+    """Return whether pid belongs to a process that started after the lock was taken."""
+    if not lock_started:
+        return False
+    process_started = process_start_time(pid)
+    if process_started is None:
+        return False
+    try:
+        # started has a resolution of seconds
+        return process_started > datetime.fromisoformat(lock_started).timestamp() + 1
+    except ValueError:
+        return False
+
+
+class RunLock:
+    """The run lock of one state folder."""
+
+    HEARTBEAT_INTERVAL = 15.0  # seconds between heartbeat writes
+    POLL_INTERVAL = 5.0  # seconds between attempts while queued
+
+    def __init__(self, state_folder: str, policy: str = "skip", stale_seconds: float = 7200.0,
+                 wait_seconds: float = 3600.0, logger=None):
+        self.path = os.path.join(state_folder, "run.lock")
+        self.skips_path = os.path.join(state_folder, "run.lock.skipped")
+        self.policy = policy if policy in LOCK_POLICIES else "skip"
+        self.stale_seconds = stale_seconds
+        self.wait_seconds = wait_seconds
+        self.logger = logger
+        self.token: Optional[str] = None
+        self._started: Optional[str] = None
+        self.waited_seconds = 0.0
+        self.taken_over: Optional[Dict[str, Any]] = None
+        self.holder_at_skip: Optional[Dict[str, Any]] = None
+        self.lost = False  # set when another run took the lock over (this run hung too long)
+        self._last_heartbeat = 0.0
+        self._heartbeat_lock = threading.Lock()
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def _content(self) -> Dict[str, Any]:
+        return {"pid": os.getpid(), "host": socket.gethostname(), "token": self.token,
+                "started": self._started, "heartbeat": time.time()}
+
+    def holder(self) -> Optional[Dict[str, Any]]:
+        """Return the contents of the current lock file, or None if there is none."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Being written right now, or corrupt: treat it as a lock without heartbeat
+            return {}
+
+    def _holder_state(self, holder: Dict[str, Any]) -> str:
+        """Return dead, stale or alive for the holder of the lock."""
+        if holder.get("host") == socket.gethostname():
+            pid = int(holder.get("pid") or 0)
+            if not pid_alive(pid) or pid_reused(pid, holder.get("started")):
+                return "dead"
+        heartbeat = holder.get("heartbeat")
+        if heartbeat is None:
+            try:
+                heartbeat = os.path.getmtime(self.path)
+            except OSError:
+                return "dead"
+        return "stale" if time.time() - float(heartbeat) > self.stale_seconds else "alive"
+
+    def _try_create(self) -> bool:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        self.token = uuid.uuid4().hex
+        self._started = datetime.now().isoformat(timespec="seconds")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._content(), f)
+        self._last_heartbeat = time.monotonic()
+        return True
+
+    def _remove_if(self, holder: Dict[str, Any]) -> None:
+        """Remove the lock file, unless another process replaced it in the meantime."""
+        current = self.holder()
+        if current is not None and current.get("token") == holder.get("token"):
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _log(self, message: str) -> None:
+        if self.logger is not None:
+            self.logger.warning(message)
+
+    def acquire(self) -> bool:
+        """Take the lock according to the policy; returns False if this run must be skipped."""
+        started = time.monotonic()
+        warned = False
+        while True:
+            if self._try_create():
+                self.waited_seconds = time.monotonic() - started
+                self._start_heartbeat()
+                return True
+            holder = self.holder()
+            if holder is None:
+                continue  # released just now
+            state = self._holder_state(holder)
+            description = f"PID {holder.get('pid')} on {holder.get('host')} since {holder.get('started')}"
+            if state == "dead":
+                self._log(f"Taking over the run lock of a run that is gone ({description})")
+                self.taken_over = holder
+                self._remove_if(holder)
+                continue
+            if state == "stale":
+                if self.policy == "kill_stale":
+                    if holder.get("host") == socket.gethostname():
+                        self._log(f"Terminating a hung run without heartbeat for {self.stale_seconds:.0f}s ({description})")
+                        try:
+                            os.kill(int(holder["pid"]), signal.SIGTERM)
+                        except (OSError, KeyError, ValueError):
+                            pass
+                    self.taken_over = holder
+                    self._remove_if(holder)
+                    continue
+                if not warned:
+                    self._log(f"The run holding the lock has no heartbeat for {self.stale_seconds:.0f}s ({description})")
+                    warned = True
+            if self.policy == "queue" and time.monotonic() - started < self.wait_seconds:
+                time.sleep(min(self.POLL_INTERVAL, max(0.1, self.wait_seconds - (time.monotonic() - started))))
+                continue
+            self.waited_seconds = time.monotonic() - started
+            self.holder_at_skip = holder
+            return False
+
+    def _start_heartbeat(self) -> None:
+        """Refresh the heartbeat from a daemon thread while the lock is held."""
+        self._heartbeat_stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="run-lock-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._heartbeat_stop.wait(self.HEARTBEAT_INTERVAL):
+            if self.token is None:
+                return
+            self.heartbeat(force=True)
+
+    def _stop_heartbeat(self) -> None:
+        self._heartbeat_stop.set()
+        thread, self._heartbeat_thread = self._heartbeat_thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+    def heartbeat(self, force: bool = False) -> None:
+        """
+        Refresh the heartbeat of a held lock (at most every HEARTBEAT_INTERVAL seconds).
+
+        If the lock file no longer holds this run's token, another run took it over:
+        the lock is marked lost and never written again, and the caller must stop.
+        """
+        with self._heartbeat_lock:
+            if self.token is None or (not force and time.monotonic() - self._last_heartbeat < self.HEARTBEAT_INTERVAL):
+                return
+            self._last_heartbeat = time.monotonic()
+            holder = self.holder()
+            if holder is None or holder.get("token") != self.token:
+                self.lost = True
+                self.token = None
+                if self.logger is not None:
+                    holder = holder or {}
+                    self.logger.error(f"The run lock was taken over by PID {holder.get('pid')} on {holder.get('host')}, "
+                                      f"stopping this run")
+                return
+            try:
+                atomic_write_text(self.path, json.dumps(self._content()))
+            except OSError:
+                pass  # a missed heartbeat only makes the lock look stale sooner
+
+    def release(self) -> None:
+        """Stop the heartbeat and remove the lock if this process holds it."""
+        self._stop_heartbeat()
+        with self._heartbeat_lock:
+            if self.token is None:
+                return
+            self._remove_if({"token": self.token})
+            self.token = None
+
+    def record_skip(self) -> None:
+        """Count a skipped run, reported by the next run that gets the lock."""
+        try:
+            count = self.skipped_runs()
+            atomic_write_text(self.skips_path, str(count + 1))
+        except OSError:
+            pass
+
+    def skipped_runs(self) -> int:
+        """Return the number of runs skipped since the last completed run."""
+        try:
+            with open(self.skips_path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def reset_skipped_runs(self) -> None:
+        try:
+            os.remove(self.skips_path)
+        except OSError:
+            pass
@@ -0,0 +1,334 @@
+"""
+Memory-bounded nesting of large extracts.
+
+Rows are grouped by parent-id in memory until the estimated size of the buffered
+groups exceeds the memory budget. The buffer is then written to disk as a run
+sorted by parent-id. At the end the runs are merged (external sort), and each
+parent is nested from its complete group of rows, so the result equals
+auto_nest_data() on the full extract. When nothing spilled, parents keep their
+first-seen order; when runs were merged, parents come out in parent-id order.
+
+sort_within_budget() sorts nested records by key the same way, for key-ordered uploads.
+"""
+import heapq
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.metrics import TableMetrics
+from utils.transformers import auto_nest_data
+
+# Runs merged in one pass; beyond this they are first merged into a single run
+MAX_OPEN_RUNS = 64
+# Row sizes are measured on every SAMPLE_EVERY-th row and averaged
+SAMPLE_EVERY = 32
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    """Totally ordered key for a parent-id that groups equal values (1 == 1.0 == Decimal('1'))."""
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return (2, repr(value))
+
+
+def _row_size(row: Dict[str, Any]) -> int:
+    """Approximate memory used by a row dictionary and its values (keys are shared)."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values()) + 8
+
+
+class RecordStream:
+    """
+    Iterable of nested records with the counters the sync reports.
+
+    row_count and record_count are complete once the stream has been consumed.
+    """
+
+    def __init__(self, source: Iterator[Dict[str, Any]], nester: Optional["SpillingNester"] = None):
+        self._source = source
+        self.nester = nester
+        self.record_count = 0
+
+    @property
+    def row_count(self) -> int:
+        """Rows read from the database so far (equal to record_count when nothing is nested)."""
+        return self.nester.row_count if self.nester is not None else self.record_count
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for record in self._source:
+            self.record_count += 1
+            yield record
+
+
+class MergedRecordStream(RecordStream):
+    """Record stream over other record streams; row_count sums the rows read by each of them."""
+
+    def __init__(self, source: Iterator[Dict[str, Any]], streams: List[RecordStream]):
+        super().__init__(source)
+        self.streams = streams
+
+    @property
+    def row_count(self) -> int:
+        return sum(stream.row_count for stream in self.streams)
+
+
+class SpillingNester:
+    """Groups rows by parent-id within a memory budget (0 = unlimited), spilling sorted runs to disk."""
+
+    def __init__(self, budget_bytes: int, spill_folder: Optional[str] = None,
+                 metrics: Optional[TableMetrics] = None):
+        self.budget_bytes = max(0, int(budget_bytes or 0))
+        self.spill_folder = spill_folder
+        self.metrics = metrics
+        self.row_count = 0
+        self.peak_bytes = 0
+        self.spilled_bytes = 0
+        self._groups: Dict[Any, List[Dict[str, Any]]] = {}
+        self._buffered_rows = 0
+        self._avg_row_bytes = 0.0
+        self._samples = 0
+        self.run_count = 0
+        self._runs: List[str] = []
+
+    @property
+    def buffered_bytes(self) -> int:
+        return int(self._buffered_rows * self._avg_row_bytes)
+
+    def add(self, row: Dict[str, Any]) -> None:
+        """Buffer one row, spilling the buffer to disk when it exceeds the budget."""
+        if self.row_count % SAMPLE_EVERY == 0:
+            self._samples += 1
+            self._avg_row_bytes += (_row_size(row) - self._avg_row_bytes) / self._samples
+        self.row_count += 1
+
+        parent_id = row["parent-id"]
+        group = self._groups.get(parent_id)
+        if group is None:
+            self._groups[parent_id] = [row]
+        else:
+            group.append(row)
+        self._buffered_rows += 1
+
+        buffered = self.buffered_bytes
+        if buffered > self.peak_bytes:
+            self.peak_bytes = buffered
+        if self.budget_bytes and buffered > self.budget_bytes:
+            self._spill()
+
+    def _new_run_path(self) -> str:
+        if self.spill_folder:
+            os.makedirs(self.spill_folder, exist_ok=True)
+        handle, path = tempfile.mkstemp(prefix="nest_", suffix=".run", dir=self.spill_folder or None)
+        os.close(handle)
+        return path
+
+    def _write_run(self, entries: Iterable[Tuple[Tuple[int, Any], List[Dict[str, Any]]]]) -> str:
+        path = self._new_run_path()
+        with open(path, 'wb') as f:
+            for entry in entries:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled_bytes += os.path.getsize(path)
+        return path
+
+    def _spill(self) -> None:
+        if not self._groups:
+            return
+        entries = sorted(((_sort_key(parent_id), rows) for parent_id, rows in self._groups.items()),
+                         key=lambda entry: entry[0])
+        self._runs.append(self._write_run(entries))
+        self.run_count += 1
+        self._groups = {}
+        self._buffered_rows = 0
+
+        if len(self._runs) >= MAX_OPEN_RUNS:
+            runs, self._runs = self._runs, []
+            try:
+                self._runs.append(self._write_run(self._merge_runs(runs)))
+            finally:
+                self._remove(runs)
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[Tuple[Tuple[int, Any], List[Dict[str, Any]]]]:
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def _merge_runs(self, runs: List[str], extra: Optional[list] = None) -> Iterator[Tuple[Tuple[int, Any], List[Dict[str, Any]]]]:
+        """Merge sorted runs into one sorted stream, concatenating the rows of equal parent-ids in run order."""
+        streams = [self._read_run(path) for path in runs]
+        if extra:
+            streams.append(iter(extra))
+        current_key = None
+        current_rows: List[Dict[str, Any]] = []
+        # heapq.merge is stable: equal keys come out in stream order, so arrival order is kept
+        for key, rows in heapq.merge(*streams, key=lambda entry: entry[0]):
+            if current_rows and key != current_key:
+                yield current_key, current_rows
+                current_rows = []
+            current_key = key
+            current_rows.extend(rows)
+        if current_rows:
+            yield current_key, current_rows
+
+    @staticmethod
+    def _remove(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def results(self) -> Iterator[Dict[str, Any]]:
+        """Yield the nested records; spill files are removed when the iteration ends."""
+        self._record_metrics()
+        if not self._runs:
+            groups, self._groups = self._groups, {}
+            for rows in groups.values():
+                yield from auto_nest_data(rows)
+            return
+
+        runs = self._runs
+        buffered = sorted(((_sort_key(parent_id), rows) for parent_id, rows in self._groups.items()),
+                          key=lambda entry: entry[0])
+        self._groups = {}
+        try:
+            for _, rows in self._merge_runs(runs, buffered):
+                yield from auto_nest_data(rows)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Remove the spill files and drop the buffer."""
+        self._remove(self._runs)
+        self._runs = []
+        self._groups = {}
+
+    def _record_metrics(self) -> None:
+        if self.metrics is None:
+            return
+        self.metrics.nest_peak_bytes = max(self.metrics.nest_peak_bytes, self.peak_bytes)
+        self.metrics.spill_runs += self.run_count
+        self.metrics.spilled_bytes += self.spilled_bytes
+
+
+def _record_size(record: Dict[str, Any]) -> int:
+    """Approximate memory used by a nested record, including its child records."""
+    size = _row_size(record)
+    for value in record.values():
+        if isinstance(value, list):
+            size += sum(_record_size(child) if isinstance(child, dict) else sys.getsizeof(child) for child in value)
+    return size
+
+
+def sort_within_budget(records: Iterable[Dict[str, Any]], sort_key, budget_bytes: int = 0,
+                       spill_folder: Optional[str] = None,
+                       metrics: Optional[TableMetrics] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield records ordered by sort_key(record) (a string), keeping equal keys in arrival order.
+
+    Up to budget_bytes of records (0 = unlimited) are sorted in memory; beyond that
+    sorted runs are spilled to disk and merged while the result is consumed.
+    """
+    budget_bytes = max(0, int(budget_bytes or 0))
+    buffer: List[Tuple[str, Dict[str, Any]]] = []
+    runs: List[str] = []
+    avg_bytes = 0.0
+    samples = 0
+    spilled_bytes = 0
+
+    def write_run(entries) -> str:
+        nonlocal spilled_bytes
+        if spill_folder:
+            os.makedirs(spill_folder, exist_ok=True)
+        handle, path = tempfile.mkstemp(prefix="sort_", suffix=".run", dir=spill_folder or None)
+        with os.fdopen(handle, 'wb') as f:
+            for entry in entries:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        spilled_bytes += os.path.getsize(path)
+        return path
+
+    def merged(paths: List[str], extra: Optional[list] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        streams = [SpillingNester._read_run(path) for path in paths]
+        if extra:
+            streams.append(iter(extra))
+        return heapq.merge(*streams, key=lambda entry: entry[0])
+
+    try:
+        for index, record in enumerate(records):
+            if budget_bytes and index % SAMPLE_EVERY == 0:
+                samples += 1
+                avg_bytes += (_record_size(record) - avg_bytes) / samples
+            buffer.append((sort_key(record), record))
+            if budget_bytes and len(buffer) * avg_bytes > budget_bytes:
+                buffer.sort(key=lambda entry: entry[0])
+                runs.append(write_run(buffer))
+                buffer = []
+                if len(runs) >= MAX_OPEN_RUNS:
+                    previous, runs = runs, []
+                    try:
+                        runs.append(write_run(merged(previous)))
+                    finally:
+                        SpillingNester._remove(previous)
+        buffer.sort(key=lambda entry: entry[0])
+        if metrics is not None and runs:
+            metrics.spill_runs += len(runs)
+            metrics.spilled_bytes += spilled_bytes
+        for _, record in (merged(runs, buffer) if runs else buffer):
+            yield record
+    finally:
+        SpillingNester._remove(runs)
+
+
+def prime(rows: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Start a lazy query so it connects and executes now, and return an equivalent iterator.
+
+    Errors that happen before the first row (connection, syntax) are raised here instead
+    of in the consumer, so callers can still fall back to another database.
+    """
+    iterator = iter(rows)
+    first = next(iterator, None)
+    if first is None:
+        return iter(())
+    return itertools.chain([first], iterator)
+
+
+def nest_within_budget(rows: Iterable[Dict[str, Any]], budget_bytes: int,
+                       spill_folder: Optional[str] = None,
+                       metrics: Optional[TableMetrics] = None) -> RecordStream:
+    """
+    Nest rows like auto_nest_data() while keeping the buffered rows under budget_bytes
+    (0 = unlimited, nothing is spilled).
+
+    Rows without a parent-id column are streamed through unchanged, without buffering.
+    Nesting happens while the returned stream is consumed, so its time shows up in
+    the stages of the consumer (normally the upload).
+    """
+    iterator = iter(rows)
+    first = next(iterator, None)
+    if first is None:
+        return RecordStream(iter(()))
+
+    if "parent-id" not in first:
+        return RecordStream(itertools.chain([first], iterator))
+
+    nester = SpillingNester(budget_bytes, spill_folder, metrics)
+
+    def nested() -> Iterator[Dict[str, Any]]:
+        try:
+            nester.add(first)
+            for row in iterator:
+                nester.add(row)
+            yield from nester.results()
+        finally:
+            nester.close()
+
+    return RecordStream(nested(), nester)
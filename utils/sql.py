@@ -0,0 +1,196 @@
+"""
+Lightweight SQL text helpers that are aware of comments, string literals,
+quoted identifiers and parentheses.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_ORDER_BY = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+_WITH = re.compile(r'^\s*WITH\b', re.IGNORECASE)
+
+
+def mask_sql(sql: str, mask_parentheses: bool = False) -> str:
+    """
+    Return a copy of sql with the same length in which comments, the contents of
+    string literals and quoted identifiers (and optionally everything inside
+    parentheses) are replaced by spaces.
+
+    Keyword searches on the masked text therefore only match real top-level SQL,
+    and match positions can be used to slice the original text.
+    """
+    out = list(sql)
+    i = 0
+    depth = 0
+    length = len(sql)
+    while i < length:
+        ch = sql[i]
+        nxt = sql[i + 1] if i + 1 < length else ""
+        if ch == '-' and nxt == '-':
+            end = sql.find('\n', i)
+            end = length if end == -1 else end
+            for j in range(i, end):
+                out[j] = ' '
+            i = end
+            continue
+        if ch == '/' and nxt == '*':
+            end = sql.find('*/', i + 2)
+            end = length if end == -1 else end + 2
+            for j in range(i, end):
+                if out[j] != '\n':
+                    out[j] = ' '
+            i = end
+            continue
+        if ch in ("'", '"'):
+            j = i + 1
+            while j < length:
+                if sql[j] == ch:
+                    if j + 1 < length and sql[j + 1] == ch:
+                        j += 2  # escaped quote
+                        continue
+                    break
+                j += 1
+            for k in range(i + 1, min(j, length)):
+                out[k] = ' '
+            i = j + 1
+            continue
+        if mask_parentheses:
+            if ch == '(':
+                depth += 1
+                i += 1
+                continue
+            if ch == ')':
+                depth = max(0, depth - 1)
+                i += 1
+                continue
+            if depth > 0 and ch != '\n':
+                out[i] = ' '
+        i += 1
+    return "".join(out)
+
+
+def strip_statement(sql: str) -> str:
+    """Strip a leading BOM, surrounding whitespace and trailing semicolons and comments."""
+    sql = sql.lstrip('\ufeff').strip()
+    masked = mask_sql(sql)
+    end = len(masked.rstrip())
+    while end > 0 and masked[end - 1] == ';':
+        end = len(masked[:end - 1].rstrip())
+    return sql[:end]
+
+
+def split_order_by(sql: str) -> Tuple[str, str]:
+    """
+    Split a statement into its body and its top-level ORDER BY clause.
+
+    Returns:
+        (body, order_by) where order_by is "" if the statement has no top-level ORDER BY
+    """
+    sql = strip_statement(sql)
+    masked = mask_sql(sql, mask_parentheses=True)
+    matches = list(_ORDER_BY.finditer(masked))
+    if not matches:
+        return sql, ""
+    start = matches[-1].start()
+    return sql[:start].rstrip(), sql[start:].strip()
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a column alias unless it is a plain identifier (which keeps case folding intact)."""
+    if _IDENTIFIER.match(name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_preview_query(sql: str, limit: int, dialect: str) -> Optional[str]:
+    """
+    Return sql capped at limit rows (TOP n on SQL Server, FIRST n on Firebird, LIMIT n otherwise).
+
+    The statement is wrapped in a derived table with its ORDER BY kept inside, like
+    the partition queries. Returns None for statements that cannot be wrapped
+    (common table expressions); callers then stop fetching after limit rows.
+    """
+    body, order_by = split_order_by(sql)
+    if _WITH.match(mask_sql(body)):
+        return None
+    limit = max(1, int(limit))
+    if order_by and dialect == "sqlserver":
+        order_by = f"{order_by} OFFSET 0 ROWS"
+    inner = f"{body}\n{order_by}" if order_by else body
+    if dialect == "sqlserver":
+        return f"SELECT TOP {limit} * FROM (\n{inner}\n) preview_q"
+    if dialect == "firebird":
+        return f"SELECT FIRST {limit} * FROM (\n{inner}\n) preview_q"
+    return f"SELECT * FROM (\n{inner}\n) preview_q LIMIT {limit}"
+
+
+_NAMED_PARAM = re.compile(r'(?<![:\w]):([A-Za-z_][A-Za-z0-9_]*)')
+_compiled_cache: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+_file_cache: Dict[str, Tuple[float, int, str]] = {}
+
+
+def compile_named_params(sql: str) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Convert :name parameters to the qmark (?) style used by pyodbc and fdb.
+
+    Parameters inside comments, string literals and quoted identifiers are ignored.
+    Results are cached per SQL text.
+
+    Returns:
+        (sql with ? placeholders, parameter names in placeholder order)
+    """
+    cached = _compiled_cache.get(sql)
+    if cached is not None:
+        return cached
+
+    masked = mask_sql(sql)
+    names = []
+    parts = []
+    last = 0
+    for match in _NAMED_PARAM.finditer(masked):
+        parts.append(sql[last:match.start()])
+        parts.append("?")
+        names.append(match.group(1).lower())
+        last = match.end()
+    parts.append(sql[last:])
+
+    compiled = ("".join(parts), tuple(names))
+    if len(_compiled_cache) > 256:
+        _compiled_cache.clear()
+    _compiled_cache[sql] = compiled
+    return compiled
+
+
+def bind_params(names: Tuple[str, ...], params: Optional[Dict[str, Any]]) -> List[Any]:
+    """Return positional values for names from params, raising if one is missing."""
+    if not names:
+        return []
+    params = {str(key).lower(): value for key, value in (params or {}).items()}
+    missing = [name for name in names if name not in params]
+    if missing:
+        raise Exception(f"No value for query parameter(s): {', '.join(':' + name for name in sorted(set(missing)))}")
+    return [params[name] for name in names]
+
+
+def read_sql_file(file_path: str) -> str:
+    """Read a query file (BOM removed), re-reading only when its mtime or size changed."""
+    stat = os.stat(file_path)
+    cached = _file_cache.get(file_path)
+    if cached is not None and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+        return cached[2]
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        sql = f.read()
+    _file_cache[file_path] = (stat.st_mtime, stat.st_size, sql)
+    return sql
+
+
+def invalidate_sql_file(file_path: Optional[str] = None) -> None:
+    """Drop the cached text of a query file, or of all files when file_path is None."""
+    if file_path is None:
+        _file_cache.clear()
+        return
+    target = os.path.normcase(os.path.abspath(file_path))
+    for cached_path in list(_file_cache):
+        if os.path.normcase(os.path.abspath(cached_path)) == target:
+            del _file_cache[cached_path]
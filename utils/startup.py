@@ -0,0 +1,100 @@
+"""
+Cold start breakdown for --startup-profile.
+
+Records named startup phases (module imports, config, logging, services, ...)
+and, like `python -X importtime`, the time spent importing each module while the
+profile is enabled. The report ends with the total time to the first query and
+whether it stayed under the target.
+"""
+import builtins
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+class StartupProfile:
+    """Startup phase and import timer; all methods are no-ops until enable() is called."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.enabled = False
+        self.phases: List[Tuple[str, float]] = []
+        self.imports: Dict[str, float] = {}
+        self.ready: Optional[float] = None
+        self._original_import = None
+        self._depth = 0
+
+    def enable(self, imports_done: Optional[float] = None) -> None:
+        """Start recording. imports_done is when the entry module finished its own imports."""
+        if self.enabled:
+            return
+        self.enabled = True
+        if imports_done is not None:
+            self.phases.append(("module imports", imports_done - self.started))
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def disable(self) -> None:
+        """Stop recording imports."""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        # Only the outermost import of a module tree is recorded, with its cumulative time
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.imports[name] = self.imports.get(name, 0.0) + time.perf_counter() - start
+
+    @contextmanager
+    def phase(self, name: str):
+        """Record the wall time of a startup phase."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def mark_ready(self) -> None:
+        """Mark the end of startup (the sync is about to run its first query)."""
+        if self.enabled and self.ready is None:
+            self.ready = time.perf_counter()
+
+    def report(self, target_seconds: float, top_n: int = 15) -> str:
+        """Return the startup breakdown as text; imports done after mark_ready() are listed too."""
+        total = (self.ready or time.perf_counter()) - self.started
+        lines = ["Startup profile (time to first query):"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<24} {seconds * 1000:9.1f} ms")
+        if self.imports:
+            lines.append("  Imports after start-up of sync.py (cumulative, incl. deferred driver imports):")
+            slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:top_n]
+            for name, seconds in slowest:
+                lines.append(f"    {name:<22} {seconds * 1000:9.1f} ms")
+        verdict = "OK" if total <= target_seconds else "OVER TARGET"
+        lines.append(f"  {'total':<24} {total * 1000:9.1f} ms (target {target_seconds * 1000:.0f} ms, {verdict})")
+        lines.append("  Interpreter start-up is not included; use `python -X importtime sync.py` for it.")
+        return "\n".join(lines)
+
+
+# Shared instance, enabled by sync.py for --startup-profile
+startup_profile: Optional[StartupProfile] = None
+
+
+def get_startup_profile() -> StartupProfile:
+    """Return the shared startup profile, creating it if needed."""
+    global startup_profile
+    if startup_profile is None:
+        startup_profile = StartupProfile()
+    return startup_profile
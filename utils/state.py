@@ -0,0 +1,58 @@
+"""
+Persistent sync state shared between runs (last successful sync per table, etc.).
+"""
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+
+def atomic_write_text(path: str, text: str, encoding: str = 'utf-8') -> None:
+    """Write text to path via a temporary file so readers never see a partial file."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding=encoding) as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+class SyncState:
+    """Small JSON-backed store for state that must survive between sync runs."""
+
+    def __init__(self, state_folder: str = "state"):
+        self.state_folder = state_folder
+        self.path = os.path.join(state_folder, "sync_state.json")
+        self.data: Dict[str, Any] = {"tables": {}}
+        self.load()
+
+    def load(self) -> None:
+        """Load state from disk, starting empty if the file is missing or corrupt."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                self.data.update(loaded)
+                self.data.setdefault("tables", {})
+        except Exception as e:
+            print(f"Warning: Could not load sync state: {e}")
+
+    def save(self) -> None:
+        """Persist state to disk."""
+        atomic_write_text(self.path, json.dumps(self.data, indent=2, ensure_ascii=False, default=str))
+
+    def table(self, table_name: str) -> Dict[str, Any]:
+        """Return (creating if needed) the state dictionary for a table."""
+        return self.data["tables"].setdefault(table_name, {})
+
+    def mark_success(self, table_name: str, when: Optional[datetime] = None) -> None:
+        """Record a successful sync of a table."""
+        when = when or datetime.now()
+        self.table(table_name)["last_success"] = when.timestamp()
+
+    def last_success(self, table_name: str) -> Optional[float]:
+        """Return the unix timestamp of the last successful sync of a table."""
+        return self.data["tables"].get(table_name, {}).get("last_success")
@@ -0,0 +1,212 @@
+"""
+Several tenant configurations synced by one process (sync.py --tenants-dir).
+
+Every *.json file in the tenants folder is one tenant, named after the file. Tenants
+keep their own configuration, credentials, database pools, state and X-Tenant-ID;
+they share the process, the logging backend, one HTTP session (connection pool) and
+one worker pool. Tables are scheduled one at a time by fair share: a free worker
+takes the next table of the tenant that used the least sync time in the current
+pass, so a tenant with many or slow tables cannot starve the others.
+
+Process-wide settings come from the first tenant, like the logging settings: the
+top-level sync.throttle limits (one set of buckets for all tenants) and the /metrics
+endpoint, which serves the metrics of every tenant with a tenant label.
+"""
+import glob
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Set
+
+from utils.logging import Logger
+from utils.prometheus import MultiRegistry
+from utils.throttle import ThrottleLevel
+
+
+def find_tenant_configs(folder: str) -> List[str]:
+    """Return the tenant configuration files in folder, sorted by name."""
+    return sorted(glob.glob(os.path.join(folder, "*.json")))
+
+
+class Tenant:
+    """One tenant: its name, configuration file and SyncService."""
+
+    def __init__(self, name: str, config_path: str, service: Any):
+        self.name = name
+        self.config_path = config_path
+        self.service = service
+
+
+class TenantHost:
+    """Runs the syncs of several tenants in one process with fair scheduling."""
+
+    # Delay between a file change notification and applying it
+    WATCH_SETTLE_SECONDS = 1.0
+
+    def __init__(self, config_paths: List[str], service_factory: Callable[..., Any], workers: int = 2):
+        """
+        Args:
+            config_paths: Tenant configuration files
+            service_factory: SyncService (or a compatible factory taking tenant, http_session and configure_logging)
+            workers: Tables synced at the same time, never two of the same tenant
+        """
+        self.logger = Logger("tenants")
+        self.workers = max(1, int(workers))
+        self.session = self._create_session()
+        self.tenants: List[Tenant] = []
+
+        state_folders: Dict[str, str] = {}
+        for config_path in config_paths:
+            name = os.path.splitext(os.path.basename(config_path))[0]
+            try:
+                # The logging settings of the first tenant apply to the shared backend
+                service = service_factory(config_path, tenant=name, http_session=self.session,
+                                          configure_logging=not self.tenants)
+            except Exception as e:
+                self.logger.error(f"Skipping tenant {name}", e)
+                continue
+            state_folder = os.path.normcase(os.path.abspath(service.state.state_folder))
+            if state_folder in state_folders:
+                self.logger.error(f"Skipping tenant {name}: state folder {service.state.state_folder} "
+                                  f"is also used by tenant {state_folders[state_folder]}")
+                service.close()
+                continue
+            state_folders[state_folder] = name
+            self.tenants.append(Tenant(name, config_path, service))
+
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tenant")
+        self._share_global_throttle()
+        self.logger.info(f"Loaded {len(self.tenants)} tenant(s), {self.workers} worker(s)")
+
+    def _create_session(self):
+        """HTTP session shared by all tenants, with enough pooled connections for every worker."""
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(10, self.workers * 2))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _share_global_throttle(self) -> None:
+        """Give every tenant the top-level sync.throttle limits of the first tenant as one process-wide level."""
+        if not self.tenants:
+            return
+        settings = self.tenants[0].service.config.get("sync.throttle") or {}
+        level = ThrottleLevel("global", settings)
+        for tenant in self.tenants:
+            tenant.service.global_throttle = level if level.enabled else None
+
+    def _run_table(self, tenant: Tenant, run: Dict[str, Any]) -> float:
+        """Sync the next table of a tenant's run and return the time it took."""
+        threading.current_thread().name = f"tenant-{tenant.name}"  # shows up in JSON logs
+        start = time.perf_counter()
+        try:
+            tenant.service.run_next_table(run)
+        except Exception as e:
+            self.logger.error(f"Sync of tenant {tenant.name} failed", e)
+        return time.perf_counter() - start
+
+    def run_pass(self, due_only: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Sync the (due) tables of all tenants once and return the results per tenant."""
+        runs: Dict[str, Dict[str, Any]] = {}
+        results: Dict[str, Dict[str, Any]] = {}
+        tenants = {tenant.name: tenant for tenant in self.tenants}
+        for tenant in self.tenants:
+            try:
+                runs[tenant.name] = tenant.service.start_run(due_only)
+            except Exception as e:
+                self.logger.error(f"Could not start the sync of tenant {tenant.name}", e)
+                results[tenant.name] = {"success_count": 0, "failed_count": 1, "skipped_count": 0,
+                                        "failed_files": []}
+
+        used = {name: 0.0 for name in runs}
+        running: Dict[Future, Tenant] = {}
+        while True:
+            busy = {tenant.name for tenant in running.values()}
+            waiting = [name for name, run in runs.items()
+                       if name not in busy and tenants[name].service.has_next_table(run)]
+            while waiting and len(running) < self.workers:
+                name = min(waiting, key=lambda candidate: used[candidate])
+                waiting.remove(name)
+                running[self.executor.submit(self._run_table, tenants[name], runs[name])] = tenants[name]
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                used[running.pop(future).name] += future.result()
+
+        for name, run in runs.items():
+            try:
+                results[name] = tenants[name].service.finish_run(run)
+            except Exception as e:
+                self.logger.error(f"Could not finish the sync of tenant {name}", e)
+                results[name] = run["results"]
+            if used[name]:
+                self.logger.info(f"Tenant {name}: {results[name]['success_count']} succeeded, "
+                                 f"{results[name]['failed_count']} failed in {used[name]:.2f}s of sync time")
+        return results
+
+    def seconds_until_due(self) -> float:
+        """Return how long until the next table of any tenant is due."""
+        return min((tenant.service.seconds_until_next_due() for tenant in self.tenants), default=60.0)
+
+    def _watched_paths(self) -> List[str]:
+        return sorted({path for tenant in self.tenants for path in tenant.service.watched_paths()})
+
+    def apply_file_changes(self, changed_paths: Set[str]) -> None:
+        """Let every tenant apply the changes to its configuration and queries."""
+        for tenant in self.tenants:
+            try:
+                tenant.service.apply_file_changes(changed_paths)
+            except Exception as e:
+                self.logger.error(f"Could not apply file changes to tenant {tenant.name}", e)
+        self._share_global_throttle()
+
+    def run_daemon(self) -> None:
+        """
+        Sync every tenant's tables when they are due and serve /metrics until interrupted.
+
+        Changes to the tenant configurations and their queries folders are picked up
+        between passes without a restart.
+        """
+        from utils.watcher import FileWatcher
+
+        if self.tenants:
+            self.tenants[0].service.start_metrics_endpoint(
+                MultiRegistry(tenant.service.prometheus.registry for tenant in self.tenants))
+        for tenant in self.tenants:
+            tenant.service.seed_metrics()
+
+        watched_paths = self._watched_paths()
+        watcher = FileWatcher(watched_paths)
+        watcher.start()
+        self.logger.info(f"Multi-tenant daemon mode, watching configs and queries for changes ({watcher.backend})")
+        try:
+            while True:
+                self.run_pass(due_only=True)
+                if watcher.wait(max(1.0, self.seconds_until_due())):
+                    time.sleep(self.WATCH_SETTLE_SECONDS)  # let editors finish writing
+                    self.apply_file_changes(watcher.pop_changes())
+                    if self._watched_paths() != watched_paths:
+                        watcher.stop()
+                        watched_paths = self._watched_paths()
+                        watcher = FileWatcher(watched_paths)
+                        watcher.start()
+        except KeyboardInterrupt:
+            self.logger.info("Daemon stopped")
+        finally:
+            watcher.stop()
+            self.close()
+
+    def close(self) -> None:
+        """Close the tenants' pools, the worker pool and the shared HTTP session."""
+        for tenant in self.tenants:
+            try:
+                tenant.service.close()
+            except Exception as e:
+                self.logger.error(f"Could not close tenant {tenant.name}", e)
+        self.executor.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,188 @@
+"""
+Token-bucket throttling of database fetches and API uploads (sync.throttle).
+
+    "throttle": {
+        "rows_per_second": 0, "bytes_per_second": 0, "requests_per_second": 0,
+        "windows": [{"from": "07:00", "to": "18:00", "days": ["mon", "tue", "wed", "thu", "fri"],
+                     "rows_per_second": 2000, "bytes_per_second": 500000}],
+        "sources": {"firebird": {"rows_per_second": 5000}, "api": {"requests_per_second": 10}},
+        "tables": {"orders": {"rows_per_second": 1000}}
+    }
+
+Every level (the whole process, a source, a table) has its own buckets and all of
+them apply, so the strictest limit wins. 0 means unlimited. Inside a window its
+limits replace the level's base limits; a window whose "to" is before its "from"
+runs past midnight. The database services take rows per fetched batch and the API
+service takes bytes and a request per request body, so the cost is one clock read
+per batch; without limits no throttle is installed at all.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+LIMIT_KINDS = ("rows", "bytes", "requests")
+
+_DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def _minutes(value: str) -> int:
+    hours, _, minutes = str(value).partition(":")
+    return int(hours) * 60 + int(minutes or 0)
+
+
+class TokenBucket:
+    """Allows rate units per second with bursts of up to burst_seconds worth of units."""
+
+    def __init__(self, rate: float, burst_seconds: float = 1.0):
+        self.rate = float(rate)
+        self.burst_seconds = burst_seconds
+        self.tokens = self.rate * burst_seconds
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self.rate = float(rate)
+            self.tokens = min(self.tokens, self.rate * self.burst_seconds)
+
+    def take(self, amount: float) -> float:
+        """Take amount units, sleeping while the bucket is in debt; returns the seconds slept."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate * self.burst_seconds, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A large amount (a whole request body) may put the bucket in debt; the caller waits it off
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ThrottleLevel:
+    """The limits and buckets of one level (the process, a source or a table)."""
+
+    def __init__(self, name: str, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.name = name
+        self.base = self._limits(settings)
+        self.windows = []
+        for window in settings.get("windows") or ():
+            days = {_DAYS.index(str(day).lower()[:3]) for day in window.get("days") or _DAYS}
+            self.windows.append((_minutes(window.get("from", "00:00")), _minutes(window.get("to", "24:00")),
+                                 days, {**self.base, **self._limits(window)}))
+        self.buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()  # a level can be shared by the tenants of one process
+
+    @staticmethod
+    def _limits(settings: Dict[str, Any]) -> Dict[str, float]:
+        return {kind: float(settings[f"{kind}_per_second"] or 0)
+                for kind in LIMIT_KINDS if f"{kind}_per_second" in settings}
+
+    @property
+    def enabled(self) -> bool:
+        return any(self.base.values()) or any(any(limits.values()) for _, _, _, limits in self.windows)
+
+    def limits_at(self, now: datetime) -> Dict[str, float]:
+        """Return the limits that apply at now: the first matching window, else the base limits."""
+        minute = now.hour * 60 + now.minute
+        for start, end, days, limits in self.windows:
+            if start <= end:
+                inside = start <= minute < end and now.weekday() in days
+            else:
+                # Past midnight: the part after midnight belongs to the previous day's window
+                inside = ((minute >= start and now.weekday() in days)
+                          or (minute < end and (now.weekday() - 1) % 7 in days))
+            if inside:
+                return limits
+        return self.base
+
+    def apply(self, now: datetime) -> None:
+        """Set the bucket rates for the limits at now."""
+        limits = self.limits_at(now)
+        with self._lock:
+            for kind in LIMIT_KINDS:
+                rate = limits.get(kind, 0.0)
+                bucket = self.buckets.get(kind)
+                if rate <= 0:
+                    self.buckets.pop(kind, None)
+                elif bucket is None:
+                    self.buckets[kind] = TokenBucket(rate)
+                elif bucket.rate != rate:
+                    bucket.set_rate(rate)
+
+
+class Throttle:
+    """The levels that apply to one service while one table is synced."""
+
+    # Seconds between checks whether a time window started or ended
+    WINDOW_CHECK_INTERVAL = 30.0
+
+    def __init__(self, levels: List[ThrottleLevel]):
+        self.levels = [level for level in levels if level is not None and level.enabled]
+        self.waited_seconds = 0.0
+        self._checked = 0.0
+        self._check_windows()
+
+    def _check_windows(self) -> None:
+        self._checked = time.monotonic()
+        now = datetime.now()
+        for level in self.levels:
+            level.apply(now)
+
+    def take(self, kind: str, amount: float) -> float:
+        """Take amount units of kind from every level; returns the seconds slept."""
+        if time.monotonic() - self._checked > self.WINDOW_CHECK_INTERVAL:
+            self._check_windows()
+        waited = 0.0
+        for level in self.levels:
+            bucket = level.buckets.get(kind)
+            if bucket is not None:
+                waited += bucket.take(amount)
+        self.waited_seconds += waited
+        return waited
+
+    def rows(self, count: int) -> float:
+        return self.take("rows", count)
+
+    def upload(self, body_bytes: int) -> float:
+        return self.take("requests", 1) + self.take("bytes", body_bytes)
+
+
+class ThrottledReader:
+    """File object wrapper that takes upload bytes from a throttle as the body is read."""
+
+    def __init__(self, fileobj, size: int, throttle: Throttle):
+        self.fileobj = fileobj
+        self.remaining = size
+        self.throttle = throttle
+
+    def __len__(self) -> int:
+        return self.remaining
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        if data:
+            self.throttle.take("bytes", len(data))
+        return data
+
+
+def create_throttle(levels: List[Optional[ThrottleLevel]]) -> Optional[Throttle]:
+    """Return a Throttle over the levels that have limits, or None when none has any."""
+    throttle = Throttle([level for level in levels if level is not None])
+    return throttle if throttle.levels else None
+
+
+def fetch_rows(cursor, throttle: Optional[Throttle], fetch_size: int = 1000) -> List[Any]:
+    """cursor.fetchall(), fetched in batches of fetch_size rows when a throttle applies."""
+    if throttle is None:
+        return cursor.fetchall()
+    rows: List[Any] = []
+    while True:
+        batch = cursor.fetchmany(fetch_size)
+        if not batch:
+            return rows
+        rows.extend(batch)
+        throttle.rows(len(batch))
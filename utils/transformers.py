@@ -1,7 +1,7 @@
 """
 Data transformation utilities for nesting flat query results.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 from decimal import Decimal
 
 
@@ -179,3 +179,25 @@ def _nested_paths_to_arrays(items: List[Dict]) -> List[Dict]:
         result.append(final_item)
     
     return result
+
+
+def find_key_value(record: Dict[str, Any], key_field: str = "external_id") -> Any:
+    """Return the value of key_field in record, matching the field name case-insensitively."""
+    value = record.get(key_field)
+    if value is None:
+        lowered = key_field.lower()
+        for name, candidate in record.items():
+            if str(name).lower() == lowered:
+                return candidate
+    return value
+
+
+def lowercase_json(value: Union[Dict[str, Any], List[Any], str, Any]) -> Union[Dict[str, Any], List[Any], str, Any]:
+    """Recursively convert all dictionary keys and string values to lowercase (the API payload form)."""
+    if isinstance(value, dict):
+        return {str(key).lower(): lowercase_json(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [lowercase_json(item) for item in value]
+    if isinstance(value, str):
+        return value.lower()
+    return value
@@ -0,0 +1,74 @@
+"""
+Per-record validation before upload.
+
+A RecordValidator checks what the cursor metadata of the query cannot guarantee:
+
+    key      the key field is present and not empty
+    length   text is not longer than sync.max_text_length (the longest text the
+             API accepts, 0 = no limit), also inside nested child records
+
+Records that fail are set aside with the reason instead of failing the upload of
+the whole table.
+
+The database services also describe their result columns here (ColumnSpec) and
+store them on the table metrics, e.g. for the key type check of partitioned queries.
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from utils.transformers import find_key_value
+
+
+class ColumnSpec:
+    """Name and Python type of one result column."""
+
+    def __init__(self, name: str, type_code: Any = None):
+        self.name = name
+        self.type_code = type_code
+
+
+def describe_columns(description: Optional[Sequence[Sequence[Any]]]) -> List[ColumnSpec]:
+    """Return the ColumnSpecs of a DB-API cursor.description."""
+    columns = []
+    for column in description or ():
+        type_code = column[1] if len(column) > 1 and isinstance(column[1], type) else None
+        columns.append(ColumnSpec(str(column[0]), type_code))
+    return columns
+
+
+class RecordValidator:
+    """Checks records for a filled key field and the maximum text length."""
+
+    def __init__(self, key_field: str = "external_id", max_text_length: int = 0):
+        self.key_field = key_field
+        self.max_text_length = max(0, int(max_text_length or 0))
+
+    def validate(self, record: Dict[str, Any]) -> Optional[str]:
+        """Return why record is invalid, or None if it is valid."""
+        key = find_key_value(record, self.key_field)
+        if key is None or key == "":
+            return f"missing key {self.key_field}"
+        if self.max_text_length:
+            return self._check_text_length(record)
+        return None
+
+    def _check_text_length(self, record: Dict[str, Any]) -> Optional[str]:
+        for name, value in record.items():
+            if isinstance(value, str) and len(value) > self.max_text_length:
+                return f"{name}: length {len(value)} exceeds {self.max_text_length}"
+            if isinstance(value, list):
+                for child in value:
+                    error = self._check_text_length(child) if isinstance(child, dict) else None
+                    if error:
+                        return f"{name}.{error}"
+        return None
+
+
+def filter_valid(records: Iterable[Dict[str, Any]], validator: RecordValidator,
+                 rejected: Callable[[Dict[str, Any], str], None]) -> Iterator[Dict[str, Any]]:
+    """Yield the valid records and pass the invalid ones with their reason to rejected."""
+    for record in records:
+        error = validator.validate(record)
+        if error is None:
+            yield record
+        else:
+            rejected(record, error)
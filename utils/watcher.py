@@ -0,0 +1,153 @@
+"""
+Change notification for config.json and the queries folder in daemon mode.
+
+Uses watchdog (inotify / ReadDirectoryChangesW) when it is installed and falls
+back to polling file stats otherwise. The watcher only collects changed paths and
+wakes the daemon; the daemon applies them between runs.
+"""
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional dependency
+    FileSystemEventHandler = object
+    Observer = None
+
+
+def _normalize(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Forwards watchdog events for watched paths to the FileWatcher."""
+
+    def __init__(self, watcher: "FileWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+            if path:
+                self.watcher._notify(path)
+
+
+class FileWatcher:
+    """
+    Watches files and folders (non-recursive) and reports which of them changed.
+
+    Changes inside a watched folder are reported with the path of the changed file.
+    """
+
+    def __init__(self, paths: Iterable[str], poll_interval: float = 2.0, extensions: Tuple[str, ...] = (".sql",)):
+        self.paths = {_normalize(path) for path in paths}
+        self.poll_interval = poll_interval
+        self.extensions = extensions
+        self._changed: Set[str] = set()
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread: Optional[threading.Thread] = None
+        self.backend = "none"
+
+    def start(self) -> None:
+        """Start watching, with watchdog if available and polling otherwise."""
+        if Observer is not None:
+            try:
+                observer = Observer()
+                handler = _EventHandler(self)
+                for folder in {path if os.path.isdir(path) else os.path.dirname(path) for path in self.paths}:
+                    if os.path.isdir(folder):
+                        observer.schedule(handler, folder, recursive=False)
+                observer.daemon = True
+                observer.start()
+                self._observer = observer
+                self.backend = "watchdog"
+                return
+            except Exception:
+                self._observer = None
+
+        self._thread = threading.Thread(target=self._poll, name="file-watcher", daemon=True)
+        self._thread.start()
+        self.backend = "polling"
+
+    def stop(self) -> None:
+        """Stop watching."""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _is_relevant(self, path: str) -> bool:
+        path = _normalize(path)
+        if path in self.paths:
+            return True
+        return os.path.dirname(path) in self.paths and path.lower().endswith(self.extensions)
+
+    def _notify(self, path: str) -> None:
+        if not self._is_relevant(path):
+            return
+        with self._lock:
+            self._changed.add(_normalize(path))
+        self._event.set()
+
+    def _snapshot(self) -> Dict[str, Tuple[float, int]]:
+        snapshot: Dict[str, Tuple[float, int]] = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                try:
+                    names = os.listdir(path)
+                except OSError:
+                    continue
+                for name in names:
+                    if name.lower().endswith(self.extensions):
+                        self._stat_into(snapshot, os.path.join(path, name))
+            else:
+                self._stat_into(snapshot, path)
+        return snapshot
+
+    @staticmethod
+    def _stat_into(snapshot: Dict[str, Tuple[float, int]], path: str) -> None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        snapshot[_normalize(path)] = (stat.st_mtime, stat.st_size)
+
+    def _poll(self) -> None:
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            for path in set(previous) | set(current):
+                if previous.get(path) != current.get(path):
+                    self._notify(path)
+            previous = current
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleep up to timeout seconds, returning True as soon as a change was seen.
+
+        Waits in short slices so Ctrl+C stays responsive on Windows.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self._event.is_set()
+            if self._event.wait(min(1.0, remaining)):
+                return True
+
+    def pop_changes(self) -> Set[str]:
+        """Return and clear the paths that changed since the last call."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            self._event.clear()
+        return changed